@@ -0,0 +1,185 @@
+# api/admission.py
+
+import hashlib
+import math
+import time
+from typing import Dict, Optional
+
+from fastapi import Form, HTTPException, Request
+
+from app import memory, metrics
+from .auth import is_valid_api_key
+from config import (
+    RATE_LIMIT_PER_MINUTE, RATE_LIMIT_BURST, MAX_CONCURRENT_PER_KEY, MAX_IN_FLIGHT_REQUESTS,
+    RATE_LIMIT_BY_ADDRESS,
+)
+
+ADMISSION_REJECTIONS = metrics.REGISTRY.register(metrics.Counter(
+    "bajaj_admission_rejections_total", "Requests rejected by admission control", ("reason",)))
+
+
+class TokenBucket:
+    def __init__(self, rate_per_second: float, capacity: float):
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, cost: float = 1.0) -> float:
+        """Take `cost` tokens; returns 0 on success, else seconds until enough tokens exist"""
+        now = time.monotonic()
+        self._refill(now)
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        if self.rate <= 0:
+            return 60.0
+        return (cost - self.tokens) / self.rate
+
+    def is_idle(self) -> bool:
+        self._refill(time.monotonic())
+        return self.tokens >= self.capacity
+
+
+class AdmissionController:
+    """
+    Per-client token-bucket rate limit, a cap on concurrent heavy requests per
+    client, a global in-flight cap and the process memory budget. Rejects
+    immediately rather than queueing. Requests without a client identity
+    (client None) only count against the global cap and the memory budget.
+    """
+
+    MAX_TRACKED_CLIENTS = 10000
+
+    def __init__(self, rate_per_minute: int, burst: int, max_per_key: int, max_in_flight: int):
+        self.rate_per_second = rate_per_minute / 60.0
+        self.burst = max(1, burst)
+        self.max_per_key = max_per_key
+        self.max_in_flight = max_in_flight
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.active: Dict[str, int] = {}
+        self.in_flight = 0
+
+    def _bucket(self, client: str) -> TokenBucket:
+        bucket = self.buckets.get(client)
+        if bucket is None:
+            if len(self.buckets) >= self.MAX_TRACKED_CLIENTS:
+                self._prune()
+            bucket = self.buckets[client] = TokenBucket(self.rate_per_second, self.burst)
+        return bucket
+
+    def _prune(self):
+        # Full buckets carry no state worth keeping
+        for client in [c for c, b in self.buckets.items() if b.is_idle() and not self.active.get(c)]:
+            del self.buckets[client]
+
+    def _reject(self, status_code: int, reason: str, retry_after: float, detail: str):
+        ADMISSION_REJECTIONS.inc(reason=reason)
+        raise HTTPException(status_code=status_code, detail=detail,
+                            headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+
+    def acquire(self, client: Optional[str]):
+        try:
+            memory.guard.check()
+        except memory.MemoryPressure as e:
+            self._reject(503, "memory", 5, str(e))
+        if self.max_in_flight and self.in_flight >= self.max_in_flight:
+            self._reject(503, "global_in_flight", 1, "Server is at capacity, retry shortly")
+        if client is not None:
+            if self.max_per_key and self.active.get(client, 0) >= self.max_per_key:
+                self._reject(429, "key_concurrency", 1, "Too many concurrent requests for this API key")
+            if self.rate_per_second > 0:
+                wait = self._bucket(client).try_take()
+                if wait > 0:
+                    self._reject(429, "rate_limit", wait, "Rate limit exceeded")
+            self.active[client] = self.active.get(client, 0) + 1
+        self.in_flight += 1
+
+    def release(self, client: Optional[str]):
+        self.in_flight -= 1
+        if client is None:
+            return
+        remaining = self.active.get(client, 1) - 1
+        if remaining > 0:
+            self.active[client] = remaining
+        else:
+            self.active.pop(client, None)
+
+
+controller = AdmissionController(
+    rate_per_minute=RATE_LIMIT_PER_MINUTE,
+    burst=RATE_LIMIT_BURST,
+    max_per_key=MAX_CONCURRENT_PER_KEY,
+    max_in_flight=MAX_IN_FLIGHT_REQUESTS,
+)
+
+
+def client_identity(request: Request, form_authorization: Optional[str] = None,
+                    by_address: bool = None) -> Optional[str]:
+    """
+    Admission key: the presented API key (hashed) if it is valid. Otherwise
+    the client address when limiting by address (RATE_LIMIT_BY_ADDRESS),
+    else None: no per-client limits, so made-up keys never get a fresh rate
+    limit and keyless callers (hackrx) are not throttled per address.
+    """
+    token = request.headers.get("Authorization") or form_authorization
+    if is_valid_api_key(token):
+        if token.lower().startswith("bearer "):
+            token = token[7:]
+        return "key:" + hashlib.sha256(token.strip().encode()).hexdigest()[:16]
+    if not (RATE_LIMIT_BY_ADDRESS if by_address is None else by_address):
+        return None
+    host = request.client.host if request.client else "unknown"
+    return f"ip:{host}"
+
+
+class AdmissionTicket:
+    """An admitted request's slot; released once, either by the dependency or by its new owner"""
+
+    def __init__(self, client: Optional[str]):
+        self.client = client
+        self.detached = False
+        self._released = False
+
+    def detach(self) -> "AdmissionTicket":
+        """Keep the slot past the handler (e.g. for a streaming body); caller must release()"""
+        self.detached = True
+        return self
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            controller.release(self.client)
+
+
+def _admit(request: Request, authorization: Optional[str] = None) -> AdmissionTicket:
+    client = client_identity(request, authorization)
+    controller.acquire(client)
+    return AdmissionTicket(client)
+
+
+async def admit_heavy_request(request: Request, authorization: str = Form(None)):
+    """
+    Dependency for the document-processing endpoints. Holds an admission slot
+    for the duration of the handler and fails fast with 429/503 + Retry-After.
+    """
+    ticket = _admit(request, authorization)
+    try:
+        yield ticket
+    finally:
+        if not ticket.detached:
+            ticket.release()
+
+
+async def admit_json_request(request: Request):
+    """admit_heavy_request for endpoints with a JSON body (API key from headers only)"""
+    ticket = _admit(request)
+    try:
+        yield ticket
+    finally:
+        if not ticket.detached:
+            ticket.release()
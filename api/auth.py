@@ -3,7 +3,9 @@
 from fastapi import HTTPException, Security, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import jwt
+import hmac
 from datetime import datetime, timedelta
+from typing import Optional
 from config import API_KEY, JWT_SECRET_KEY, JWT_ALGORITHM, JWT_EXPIRATION_HOURS
 
 security = HTTPBearer()
@@ -20,6 +22,16 @@ def verify_api_key(credentials: HTTPAuthorizationCredentials = Security(security
     
     return credentials.credentials
 
+def is_valid_api_key(token: Optional[str]) -> bool:
+    """
+    Check a raw key or "Bearer <key>" value against the configured API key
+    """
+    if not token or not API_KEY:
+        return False
+    if token.lower().startswith("bearer "):
+        token = token[7:]
+    return hmac.compare_digest(token.strip(), API_KEY)
+
 def create_jwt_token(user_data: dict) -> str:
     """
     Create JWT token for user sessions
@@ -1,15 +1,25 @@
 # api/main.py
 
-from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Form
+from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Form, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, JSONResponse, StreamingResponse
 from .pipeline import InferencePipeline
-from .auth import require_api_key, create_jwt_token
+from .admission import admit_heavy_request, admit_json_request, AdmissionTicket
+from .auth import require_api_key, create_jwt_token, verify_api_key, is_valid_api_key
 from app.response_builder import ResponseBuilder
+from app.document_processor import DocumentTooLarge
+from app.sharded_store import ShardedVectorStore
+from app import metrics, profiling, executors, deadline
+from config import (
+    PROFILE_DIR, PROFILE_SAMPLE_INTERVAL_MS, BATCH_MAX_DOCUMENTS, BATCH_MAX_QUERIES,
+    REQUEST_DEADLINE_SECONDS, REQUEST_DEADLINE_MAX_SECONDS,
+)
+from pydantic import BaseModel
+from typing import List, Optional
+import asyncio
 import time
 import logging
 import json
-import requests
-import tempfile
 import os
 
 # Configure logging
@@ -33,11 +43,118 @@ app.add_middleware(
 # Load Inference Pipeline
 pipeline = InferencePipeline()
 
+@app.on_event("shutdown")
+def shutdown_executors():
+    executors.shutdown()
+    # Sharded clause indexes own worker processes
+    if isinstance(pipeline._vector_store, ShardedVectorStore):
+        pipeline._vector_store.close()
+    elif pipeline._vector_store is not None:
+        # Let a background compaction finish writing the index
+        pipeline._vector_store.wait_for_compaction(timeout=30)
+    if pipeline._document_store is not None:
+        pipeline._document_store.wait_for_registrations(timeout=10)
+
+@app.exception_handler(executors.StageQueueFull)
+async def stage_queue_full_handler(request: Request, exc: executors.StageQueueFull):
+    """A pipeline stage is saturated: shed load instead of queueing without bound"""
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
+@app.exception_handler(DocumentTooLarge)
+async def document_too_large_handler(request: Request, exc: DocumentTooLarge):
+    return JSONResponse(status_code=413, content={"detail": str(exc)})
+
+# Metric label for each instrumented route
+ENDPOINT_LABELS = {
+    "/api/v1/hackrx/run": "hackrx",
+    "/api/v1/hackrx/batch": "hackrx_batch",
+    "/query/": "query",
+    "/query/batch": "query_batch",
+    "/documents/": "documents",
+}
+
+def _collect_pipeline_gauges():
+    """Refresh index and model gauges without forcing lazy components to load"""
+    store = pipeline._vector_store
+    metrics.INDEX_SIZE.set(store.ntotal if store is not None else 0)
+    embedder = pipeline._embedder
+    metrics.MODEL_LOADED.set(1 if embedder is not None and embedder._model is not None else 0)
+
+metrics.REGISTRY.add_collector(_collect_pipeline_gauges)
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    endpoint = ENDPOINT_LABELS.get(request.url.path)
+    if endpoint is None or request.method != "POST":
+        return await call_next(request)
+    with metrics.track_request(endpoint) as outcome:
+        response = await call_next(request)
+        outcome["status"] = str(response.status_code)
+        return response
+
 @app.get("/")
 async def root():
     """Health check endpoint"""
     return {"message": "Bajaj Hack 6.0 - Policy Query System is running!", "status": "healthy"}
 
+def _start_trace(request: Request, endpoint: str, form_authorization: str = None):
+    """
+    Create a per-request trace when profiling is asked for via the
+    X-Debug-Profile header or ?profile=true. Requires a valid API key.
+    """
+    flag = request.headers.get("X-Debug-Profile") or request.query_params.get("profile")
+    if not flag or flag.lower() not in ("1", "true", "yes"):
+        return None
+    if not is_valid_api_key(request.headers.get("Authorization") or form_authorization):
+        raise HTTPException(status_code=403, detail="Profiling requires a valid API key")
+    return profiling.RequestTrace(endpoint, sample_interval=PROFILE_SAMPLE_INTERVAL_MS / 1000)
+
+def _finish_trace(trace: profiling.RequestTrace) -> dict:
+    """Stop sampling, persist the full profile and return the inline summary"""
+    trace.stop()
+    trace.save(PROFILE_DIR)
+    logger.info(f"Saved request profile {trace.profile_id}")
+    return trace.to_dict()
+
+def _request_deadline(request: Request) -> Optional[deadline.Deadline]:
+    """Request deadline from the X-Request-Timeout header (seconds) or the configured default (None: no deadline)"""
+    return deadline.from_header(request.headers.get("X-Request-Timeout"),
+                                REQUEST_DEADLINE_SECONDS, REQUEST_DEADLINE_MAX_SECONDS)
+
+def _deadline_fields(request_deadline: Optional[deadline.Deadline], unanswered: list) -> dict:
+    """Response fields saying how the deadline cut the answers short (none when it did not)"""
+    if request_deadline is None:
+        return {}
+    fields = {}
+    if unanswered:
+        request_deadline.degrade("unanswered")
+        fields["partial"] = True
+        fields["unanswered"] = unanswered
+    if request_deadline.degraded:
+        fields["degraded"] = list(request_deadline.degraded)
+    return fields
+
+def _answers_response(answers: list, request_deadline: Optional[deadline.Deadline]) -> dict:
+    """Competition response; questions the deadline left unanswered get a placeholder and are flagged"""
+    unanswered = [i for i, answer in enumerate(answers) if answer is None]
+    response = {"answers": [answer if answer is not None else ResponseBuilder.build_deadline_answer()
+                            for answer in answers]}
+    response.update(_deadline_fields(request_deadline, unanswered))
+    return response
+
+@app.get("/debug/profiles/{profile_id}")
+async def get_profile(profile_id: str, api_key: str = Depends(verify_api_key)):
+    """Retrieve a saved per-request profile"""
+    data = profiling.load_profile(PROFILE_DIR, profile_id)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return data
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Prometheus text-format metrics"""
+    return PlainTextResponse(metrics.render_latest(), media_type="text/plain; version=0.0.4")
+
 @app.post("/auth/token")
 async def get_access_token(user_id: str, api_key: str = Depends(require_api_key)):
     """Get JWT token for authenticated sessions"""
@@ -58,11 +175,73 @@ async def hackrx_competition_status():
         "description": "AI-powered insurance policy analysis system ready for testing"
     }
 
+def _stream_format(request: Request, stream: str = None):
+    """Requested streaming format ("ndjson" / "sse"), or None for the default JSON body"""
+    value = (stream or request.query_params.get("stream") or "").lower()
+    if value in ("ndjson", "sse"):
+        return value
+    accept = request.headers.get("accept", "")
+    if "application/x-ndjson" in accept:
+        return "ndjson"
+    if "text/event-stream" in accept:
+        return "sse"
+    return None
+
+def _format_event(stream_format: str, event: str, data: dict) -> str:
+    if stream_format == "sse":
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    return json.dumps({"type": event, **data}) + "\n"
+
+def _stream_answers(file_path: str, questions: list, stream_format: str, start_time: float,
+                    admission: AdmissionTicket, document_name: str = None,
+                    request_deadline: deadline.Deadline = None) -> StreamingResponse:
+    """Stream answers as they are computed; owns the temp file and admission slot"""
+    async def events():
+        last = time.time()
+        unanswered = []
+        try:
+            with deadline.scope(request_deadline):
+                async for index, answer in pipeline.iter_answers(file_path, questions, endpoint="hackrx",
+                                                                 document_name=document_name):
+                    now = time.time()
+                    event = {
+                        "index": index,
+                        "answer": answer if answer is not None else ResponseBuilder.build_deadline_answer(),
+                        "answer_ms": round((now - last) * 1000, 2),
+                        "elapsed_ms": round((now - start_time) * 1000, 2),
+                    }
+                    if answer is None:
+                        event["unanswered"] = True
+                        unanswered.append(index)
+                    yield _format_event(stream_format, "answer", event)
+                    last = now
+                yield _format_event(stream_format, "done", {
+                    "count": len(questions),
+                    "total_ms": round((time.time() - start_time) * 1000, 2),
+                    **_deadline_fields(request_deadline, sorted(unanswered)),
+                })
+        except Exception as e:
+            logger.error(f"Competition stream error: {str(e)}")
+            yield _format_event(stream_format, "error", {"detail": f"Processing failed: {str(e)}"})
+        finally:
+            try:
+                os.unlink(file_path)
+            except OSError:
+                pass
+            admission.release()
+
+    media_type = "text/event-stream" if stream_format == "sse" else "application/x-ndjson"
+    return StreamingResponse(events(), media_type=media_type,
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @app.post("/api/v1/hackrx/run")
 async def hackrx_competition_endpoint(
+    request: Request,
     documents: str = Form(...),
     questions: str = Form(...),
-    authorization: str = Form(None)
+    authorization: str = Form(None),
+    stream: str = Form(None),
+    admission: AdmissionTicket = Depends(admit_heavy_request)
 ):
     """
     Competition endpoint for Bajaj Hack 6.0
@@ -70,167 +249,259 @@ async def hackrx_competition_endpoint(
     - documents: URL to policy PDF
     - questions: JSON array of questions  
     - authorization: Bearer <api_key> (optional)
+    - stream: "ndjson" or "sse" (optional, also via ?stream= or Accept header)
     
     Returns: {"answers": ["Answer 1", "Answer 2", ...]}
+    In stream mode each answer is emitted with its index and timing as soon as
+    it is ready, followed by a final "done" event.
+    Send X-Debug-Profile: 1 (with a valid API key) to add a "debug_trace"
+    (not available in stream mode).
+    With a deadline (X-Request-Timeout header in seconds, or the configured
+    default; none unless set) stages shrink their work as it runs out, and the
+    response then carries "degraded" steps, plus "partial": true and the
+    "unanswered" question indexes if some questions could not be answered.
     """
-    try:
-        start_time = time.time()
-        
-        # Parse questions
-        try:
-            question_list = json.loads(questions)
-        except json.JSONDecodeError:
-            # If it's a single question, wrap in array
-            question_list = [questions]
-        
-        logger.info(f"Processing {len(question_list)} questions for document: {documents[:100]}...")
-        
-        # Download document from URL
+    trace = _start_trace(request, "hackrx", authorization)
+    request_deadline = _request_deadline(request)
+    with profiling.tracing(trace), deadline.scope(request_deadline):
         try:
-            doc_response = requests.get(documents, timeout=30)
-            doc_response.raise_for_status()
+            start_time = time.time()
             
-            # Save to temporary file
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_file:
-                temp_file.write(doc_response.content)
-                temp_file_path = temp_file.name
-                
-            logger.info(f"Downloaded document: {len(doc_response.content)} bytes")
+            # Parse questions
+            try:
+                question_list = json.loads(questions)
+            except json.JSONDecodeError:
+                # If it's a single question, wrap in array
+                question_list = [questions]
             
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=f"Failed to download document: {str(e)}")
-        
-        # Process each question
-        answers = []
-        
-        try:
-            for i, question in enumerate(question_list):
-                logger.info(f"Processing question {i+1}: {question[:50]}...")
-                
-                # Default metadata for competition
-                metadata = {
-                    "age": 30,
-                    "policy_duration": 100,
-                    "existing_conditions": False
-                }
-                
-                # Run decision engine
-                decision = pipeline.decision_engine.evaluate_claim(question, metadata)
-                
-                # CRITICAL FIX: Also analyze the actual PDF content
-                try:
-                    # Extract text from the downloaded PDF
-                    document_text = pipeline.document_processor.extract_text(temp_file_path)
-                    
-                    # Create embeddings for the document content
-                    if document_text:
-                        # Split document into chunks
-                        text_chunks = pipeline.document_processor.chunk_text(document_text)
-                        
-                        # Generate embeddings for document chunks
-                        doc_embeddings = pipeline.embedder.get_embeddings(text_chunks)
-                        
-                        # Search for relevant chunks using question embedding
-                        question_embedding = pipeline.embedder.get_embedding(question)
-                        
-                        # Find best matching chunk
-                        similarities = []
-                        for j, chunk_embedding in enumerate(doc_embeddings):
-                            import numpy as np
-                            similarity = np.dot(question_embedding, chunk_embedding) / (
-                                np.linalg.norm(question_embedding) * np.linalg.norm(chunk_embedding)
-                            )
-                            similarities.append((similarity, text_chunks[j]))
-                        
-                        # Get the most relevant chunk
-                        if similarities:
-                            best_match = max(similarities, key=lambda x: x[0])
-                            relevant_text = best_match[1]
-                            
-                            # Enhanced answer based on actual document content
-                            if "yes" in relevant_text.lower() or "covered" in relevant_text.lower():
-                                answer = f"Yes, according to the policy document: {relevant_text[:200]}..."
-                            elif "no" in relevant_text.lower() or "not covered" in relevant_text.lower() or "excluded" in relevant_text.lower():
-                                answer = f"No, according to the policy document: {relevant_text[:200]}..."
-                            else:
-                                # Use semantic analysis for better answers
-                                if any(keyword in relevant_text.lower() for keyword in ["grace period", "30 days", "thirty days"]):
-                                    answer = f"A grace period of thirty days is provided. {relevant_text[:150]}..."
-                                elif any(keyword in relevant_text.lower() for keyword in ["maternity", "pregnancy", "childbirth"]):
-                                    answer = f"Maternity benefits are covered with waiting periods. {relevant_text[:150]}..."
-                                elif any(keyword in relevant_text.lower() for keyword in ["pre-existing", "waiting period"]):
-                                    answer = f"Pre-existing conditions have specific waiting periods. {relevant_text[:150]}..."
-                                else:
-                                    answer = f"Based on the policy: {relevant_text[:200]}..."
-                        else:
-                            answer = f"Information not clearly specified in the provided policy document."
-                    else:
-                        # Fallback to decision engine result
-                        if decision.get('claim_allowed'):
-                            answer = f"Yes, {decision.get('reason', 'this is covered under the policy.')}"
-                        else:
-                            answer = f"No, {decision.get('reason', 'this is not covered under the policy.')}"
-                except Exception as doc_error:
-                    logger.warning(f"Document analysis failed: {doc_error}")
-                    # Fallback to decision engine
-                    if decision.get('claim_allowed'):
-                        answer = f"Yes, {decision.get('reason', 'this is covered under the policy.')}"
-                    else:
-                        answer = f"No, {decision.get('reason', 'this is not covered under the policy.')}"
-                
-                answers.append(answer)
-                
-        finally:
-            # Clean up temporary file
-            if 'temp_file_path' in locals():
+            logger.info(f"Processing {len(question_list)} questions for document: {documents[:100]}...")
+            
+            # Download document from URL
+            try:
+                with metrics.timed("download", "hackrx"):
+                    temp_file_path = await pipeline.adownload_document(documents)
+                logger.info(f"Downloaded document: {os.path.getsize(temp_file_path)} bytes")
+            except executors.StageQueueFull:
+                raise
+            except Exception as e:
+                if deadline.expired():
+                    logger.warning(f"Download stopped at the request deadline: {str(e)}")
+                    return _answers_response([None] * len(question_list), request_deadline)
+                raise HTTPException(status_code=400, detail=f"Failed to download document: {str(e)}")
+            
+            stream_format = _stream_format(request, stream)
+            if stream_format:
+                return _stream_answers(temp_file_path, question_list, stream_format,
+                                       start_time, admission.detach(), documents, request_deadline)
+            
+            try:
+                answers = await pipeline.answer_questions(temp_file_path, question_list, endpoint="hackrx",
+                                                          document_name=documents)
+            finally:
+                # Clean up temporary file
                 try:
                     os.unlink(temp_file_path)
-                except:
+                except OSError:
                     pass
-        
-        # Calculate processing time
-        processing_time = round((time.time() - start_time) * 1000, 2)
-        logger.info(f"Completed processing in {processing_time}ms")
-        
-        # Return in expected competition format
-        return {"answers": answers}
-        
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Competition endpoint error: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Processing failed: {str(e)}")
+            
+            # Calculate processing time
+            processing_time = round((time.time() - start_time) * 1000, 2)
+            logger.info(f"Completed processing in {processing_time}ms")
+            
+            # Return in expected competition format
+            response = _answers_response(answers, request_deadline)
+            if trace is not None:
+                response["debug_trace"] = _finish_trace(trace)
+            return response
+            
+        except (HTTPException, executors.StageQueueFull):
+            raise
+        except Exception as e:
+            logger.error(f"Competition endpoint error: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Processing failed: {str(e)}")
+
+@app.post("/documents/")
+async def ingest_document(
+    file: UploadFile = File(...),
+    document_name: str = Form(None),
+    document_type: str = Form(None),
+    api_key: str = Depends(require_api_key),  # Require API key authentication
+    admission: AdmissionTicket = Depends(admit_heavy_request)
+):
+    """
+    Build a persistent index for a policy document and register it.
+    Returns a document_id that /query/ accepts instead of re-uploading the file.
+    """
+    start_time = time.time()
+    if not file.filename.endswith(".pdf"):
+        raise HTTPException(status_code=400, detail="Only PDF files are supported.")
+
+    temp_file_path = pipeline._save_upload(file.file)
+    try:
+        doc = await pipeline.ingest_document(temp_file_path, document_name or file.filename, document_type)
+    finally:
+        os.unlink(temp_file_path)
+    if doc is None:
+        raise HTTPException(status_code=422, detail="No text could be extracted from the document.")
+
+    processing_time = round((time.time() - start_time) * 1000, 2)
+    logger.info(f"Indexed document {doc.document_id} ({len(doc.chunks)} chunks) in {processing_time}ms")
+    return {
+        "document_id": doc.document_id,
+        "document_name": doc.info.get("document_name"),
+        "pages": doc.info.get("pages"),
+        "chunks": len(doc.chunks),
+        "processing_time_ms": processing_time,
+    }
+
+@app.get("/documents/{document_id}")
+async def get_document(document_id: int, api_key: str = Depends(verify_api_key)):
+    """Metadata of an indexed document"""
+    info = pipeline.document_store.info(document_id)
+    if info is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return info
+
+class BatchItem(BaseModel):
+    document: Optional[str] = None          # answer against this document
+    documents: Optional[List[str]] = None   # or against the union of these documents
+    questions: List[str]
+
+class BatchRequest(BaseModel):
+    items: List[BatchItem]
+
+@app.post("/api/v1/hackrx/batch")
+async def hackrx_batch_endpoint(
+    request: Request,
+    batch: BatchRequest,
+    admission: AdmissionTicket = Depends(admit_json_request)
+):
+    """
+    Answer questions for several documents in one call.
+    Body: {"items": [{"document": url, "questions": [...]},
+                     {"documents": [url1, url2], "questions": [...]}]}
+    Distinct URLs are downloaded and processed once, concurrently; items with
+    "documents" are answered against the union of those documents.
+    
+    Returns: {"results": [{"answers": [...]}, ...], "documents": [...]}
+    """
+    start_time = time.time()
+    endpoint = "hackrx_batch"
+
+    item_urls = []
+    for i, item in enumerate(batch.items):
+        urls = item.documents or ([item.document] if item.document else [])
+        if not urls:
+            raise HTTPException(status_code=400, detail=f"Item {i} has no document")
+        item_urls.append(list(dict.fromkeys(urls)))
+    distinct_urls = list(dict.fromkeys(url for urls in item_urls for url in urls))
+    if len(distinct_urls) > BATCH_MAX_DOCUMENTS:
+        raise HTTPException(status_code=400,
+                            detail=f"At most {BATCH_MAX_DOCUMENTS} distinct documents per batch")
+
+    logger.info(f"Batch of {len(batch.items)} items over {len(distinct_urls)} documents")
+
+    async def download(url):
+        with metrics.timed("download", endpoint):
+            return await pipeline.adownload_document(url)
+
+    paths = await asyncio.gather(*(download(url) for url in distinct_urls), return_exceptions=True)
+    try:
+        async def prepare(url, path):
+            if isinstance(path, BaseException):
+                return path
+            return await pipeline.prepare_document(path, endpoint, document_name=url)
+
+        prepared = await asyncio.gather(*(prepare(url, path) for url, path in zip(distinct_urls, paths)),
+                                        return_exceptions=True)
+        for result in prepared:
+            if isinstance(result, executors.StageQueueFull):
+                raise result
+
+        documents = {}
+        document_status = []
+        for url, result in zip(distinct_urls, prepared):
+            if isinstance(result, BaseException):
+                logger.warning(f"Batch document failed: {url[:100]}: {result}")
+                document_status.append({"document": url, "status": "error", "detail": str(result)})
+            elif result is None:
+                document_status.append({"document": url, "status": "empty"})
+            else:
+                documents[url] = result
+                document_status.append({"document": url, "status": "ok", "chunks": len(result[0])})
+
+        async def answer(urls, questions):
+            usable = [documents[url] for url in urls if url in documents]
+            if usable:
+                return await pipeline.answer_prepared(usable, questions, endpoint)
+            return await pipeline.answer_fallback(questions, endpoint=endpoint)
+
+        answers = await asyncio.gather(*(answer(urls, item.questions)
+                                         for urls, item in zip(item_urls, batch.items)))
+    finally:
+        for path in paths:
+            if isinstance(path, str):
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+
+    processing_time = round((time.time() - start_time) * 1000, 2)
+    logger.info(f"Completed batch in {processing_time}ms")
+
+    return {
+        "results": [{"documents": urls, "answers": item_answers}
+                    for urls, item_answers in zip(item_urls, answers)],
+        "documents": document_status,
+        "processing_time_ms": processing_time,
+    }
 
 @app.post("/query/")
 async def query_insurance(
-    file: UploadFile = File(...), 
+    request: Request,
+    file: UploadFile = File(None), 
     query: str = "",
+    document_id: int = None,
     age: int = None,
     policy_duration: int = None,
     existing_conditions: bool = False,
-    api_key: str = Depends(require_api_key)  # Require API key authentication
+    policy_type: str = None,
+    clause_type: str = None,
+    api_key: str = Depends(require_api_key),  # Require API key authentication
+    admission: AdmissionTicket = Depends(admit_heavy_request)
 ):
+    trace = _start_trace(request, "query")
     try:
         start_time = time.time()
         
         # Validate input
         if not query:
             raise HTTPException(status_code=400, detail="Query cannot be empty.")
-        if not file.filename.endswith(".pdf"):
-            raise HTTPException(status_code=400, detail="Only PDF files are supported.")
+        if document_id is None:
+            if file is None:
+                raise HTTPException(status_code=400, detail="Upload a file or pass a document_id.")
+            if not file.filename.endswith(".pdf"):
+                raise HTTPException(status_code=400, detail="Only PDF files are supported.")
 
         # Log the request
-        logger.info(f"Processing query: {query[:100]}... for file: {file.filename}")
+        source = f"document_id: {document_id}" if document_id is not None else f"file: {file.filename}"
+        logger.info(f"Processing query: {query[:100]}... for {source}")
 
         # Prepare metadata
         metadata = {
             "age": age,
             "policy_duration": policy_duration,
-            "existing_conditions": existing_conditions
+            "existing_conditions": existing_conditions,
+            "policy_type": policy_type,
+            "clause_type": clause_type
         }
 
         # Run pipeline
-        decision = pipeline.run(file.file, query, metadata)
+        with profiling.tracing(trace):
+            if document_id is not None:
+                decision = await pipeline.arun_document(document_id, query, metadata)
+            else:
+                decision = await pipeline.arun(file.file, query, metadata)
         
         # Calculate processing time
         processing_time = round((time.time() - start_time) * 1000, 2)  # milliseconds
@@ -240,8 +511,81 @@ async def query_insurance(
         logger.info(f"Query processed in {processing_time}ms. Decision: {decision.get('claim_allowed')}")
 
         # Return structured response
-        return ResponseBuilder.build_success_response(decision)
+        response = ResponseBuilder.build_success_response(decision)
+        if trace is not None:
+            response["debug_trace"] = _finish_trace(trace)
+        return response
 
+    except executors.StageQueueFull:
+        raise
     except Exception as e:
         logger.error(f"Error processing query: {str(e)}")
         return ResponseBuilder.build_error_response(str(e))
+
+@app.post("/query/batch")
+async def query_insurance_batch(
+    request: Request,
+    file: UploadFile = File(...),
+    entries: str = Form(...),
+    api_key: str = Depends(require_api_key),  # Require API key authentication
+    admission: AdmissionTicket = Depends(admit_heavy_request)
+):
+    """
+    Evaluate many claim scenarios against one uploaded PDF.
+    entries: JSON array of {"query", "age", "policy_duration", "existing_conditions"}
+        plus optional "policy_type"/"clause_type" to only match such clauses
+    Decisions come from the policy clause index like /query/, so the PDF is
+    only checked (readable, within the page limit), never parsed; all queries
+    are embedded together and each entry gets its own decision and
+    processing_time_ms.
+    """
+    trace = _start_trace(request, "query_batch")
+    try:
+        start_time = time.time()
+
+        # Validate input
+        if not file.filename.endswith(".pdf"):
+            raise HTTPException(status_code=400, detail="Only PDF files are supported.")
+        try:
+            raw_entries = json.loads(entries)
+        except json.JSONDecodeError:
+            raise HTTPException(status_code=400, detail="entries must be a JSON array.")
+        if not isinstance(raw_entries, list) or not raw_entries:
+            raise HTTPException(status_code=400, detail="entries must be a non-empty JSON array.")
+        if len(raw_entries) > BATCH_MAX_QUERIES:
+            raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_QUERIES} entries per batch.")
+
+        batch = []
+        for i, entry in enumerate(raw_entries):
+            if not isinstance(entry, dict) or not entry.get("query"):
+                raise HTTPException(status_code=400, detail=f"Entry {i}: query cannot be empty.")
+            batch.append({
+                "query": entry["query"],
+                "metadata": {
+                    "age": entry.get("age"),
+                    "policy_duration": entry.get("policy_duration"),
+                    "existing_conditions": entry.get("existing_conditions", False),
+                    "policy_type": entry.get("policy_type"),
+                    "clause_type": entry.get("clause_type")
+                }
+            })
+
+        logger.info(f"Processing batch of {len(batch)} queries for file: {file.filename}")
+
+        # Run pipeline
+        with profiling.tracing(trace):
+            decisions = await pipeline.arun_batch(file.file, batch)
+
+        processing_time = round((time.time() - start_time) * 1000, 2)
+        logger.info(f"Batch of {len(batch)} queries processed in {processing_time}ms")
+
+        response = ResponseBuilder.build_batch_response(decisions, processing_time)
+        if trace is not None:
+            response["debug_trace"] = _finish_trace(trace)
+        return response
+
+    except executors.StageQueueFull:
+        raise
+    except Exception as e:
+        logger.error(f"Error processing query batch: {str(e)}")
+        return ResponseBuilder.build_error_response(str(e))
@@ -3,90 +3,697 @@
 import io
 import tempfile
 import os
-from app.document_processor import DocumentProcessor
+import threading
+import logging
+import time
+import numpy as np
+from typing import AsyncIterator, List, Optional, Tuple
+from app.document_processor import DocumentProcessor, DocumentTooLarge
 from app.embedder import Embedder
-from app.vector_store import FAISSVectorStore
+from app.vector_store import FAISSVectorStore, EmbeddingProjection
+from app.sharded_store import ShardedVectorStore
 from app.clause_matcher import ClauseMatcher
 from app.decision_engine import DecisionEngine
-from config import EMBEDDING_MODEL_NAME, MATCH_THRESHOLD
+from app.response_builder import ResponseBuilder
+from app.document_store import DocumentIndexStore, IndexedDocument, file_sha256, stored_index_version
+from app.answer_table import AnswerTable, answer_version
+from app.singleflight import SingleFlight
+from app.span_index import SentenceSpanIndex, top_chunks, lexical_top_chunks
+from app.index_manifest import IndexManifest
+from app import metrics, executors, memory, profiling, deadline
+from config import (
+    EMBEDDING_MODEL_NAME, MATCH_THRESHOLD, DOCUMENT_INDEX_DIR, DOCUMENT_CACHE_SIZE, DOCUMENT_INDEX_MAX_MB,
+    PERSIST_DOCUMENT_INDEXES, REGISTER_DOCUMENTS_IN_DB, VECTOR_INDEX_TYPE, DOCUMENT_INDEX_TYPE,
+    PQ_M, PQ_BITS, VECTOR_COMPACT_RATIO, MAX_DOCUMENT_PAGES, EMBED_BATCH_SIZE, TORCH_THREADS,
+    EMBEDDER_IDLE_UNLOAD_SECONDS, MMAP_INDEXES, PROJECTION_DIM, PROJECTION_PATH, NORMALIZE_EMBEDDINGS,
+    USE_ANSWER_TABLE, ANSWER_TABLE_PATH,
+    VECTOR_SHARDS, SHARD_PARTITION, SHARD_DIR, SHARD_PROCESSES, MATCH_ACTIVE_ONLY, MATCH_POLICY_TYPE,
+    ANSWER_SPANS, ANSWER_SPAN_CHUNKS, ANSWER_SPAN_SENTENCES, SPAN_CACHE_CHUNKS,
+    DEADLINE_SECONDS_PER_PAGE, DEADLINE_PREPARE_SHARE, DEADLINE_SPAN_MIN_SECONDS, DEADLINE_EMBED_MIN_SECONDS,
+)
+
+# Default metadata for competition questions
+DEFAULT_METADATA = {
+    "age": 30,
+    "policy_duration": 100,
+    "existing_conditions": False
+}
+
+logger = logging.getLogger(__name__)
 
 class InferencePipeline:
     def __init__(self):
-        self.document_processor = DocumentProcessor()
+        self.document_processor = DocumentProcessor(max_pages=MAX_DOCUMENT_PAGES)
         # Lazy initialization - don't load heavy components at startup
         self._embedder = None
         self._vector_store = None
         self._clause_matcher = None
         self._decision_engine = None
-        
+        self._document_store = None
+        self._answer_table = None
+        self._span_index = None
+        # Components are created from executor threads, guard against double loads
+        self._init_lock = threading.RLock()
+        # Concurrent requests for the same document or question share one computation
+        self._download_flights = SingleFlight("download")
+        self._document_flights = SingleFlight("document")
+        self._answer_flights = SingleFlight("answer")
+        # Extraction + chunking + embedding time per page, used to cap pages under a deadline
+        self._seconds_per_page = DEADLINE_SECONDS_PER_PAGE
+
     @property
     def embedder(self):
         """Lazy load embedder only when needed"""
         if self._embedder is None:
-            self._embedder = Embedder(model_name=EMBEDDING_MODEL_NAME)
+            with self._init_lock:
+                if self._embedder is None:
+                    self._embedder = Embedder(
+                        model_name=EMBEDDING_MODEL_NAME,
+                        batch_size=EMBED_BATCH_SIZE,
+                        torch_threads=TORCH_THREADS,
+                        idle_unload_seconds=EMBEDDER_IDLE_UNLOAD_SECONDS,
+                        normalize=NORMALIZE_EMBEDDINGS
+                    )
+                    # Under memory pressure the model is the largest thing that can go
+                    memory.guard.register_relief(self._embedder.unload)
         return self._embedder
-        
+
     @property
     def vector_store(self):
         """Lazy load vector store only when needed"""
         if self._vector_store is None:
-            # Initialize vector store with embedding dimension 
-            # paraphrase-albert-small-v2 = 768, all-MiniLM-L6-v2 = 384
-            dim = 768 if "albert" in EMBEDDING_MODEL_NAME else 384
-            self._vector_store = FAISSVectorStore(
-                dim=dim, 
-                index_path="models/faiss_index/index.faiss",
-                metadata_path="models/faiss_index/metadata.pkl"
-            )
+            with self._init_lock:
+                if self._vector_store is None:
+                    dim = self.embedder.dimension
+                    projection = self._load_projection(dim)
+                    # An index built with other embedding settings is reset on load
+                    manifest = IndexManifest(
+                        model=EMBEDDING_MODEL_NAME,
+                        dim=dim,
+                        normalization=self.embedder.normalization,
+                        projection=projection.fingerprint if projection is not None else None
+                    )
+                    if VECTOR_SHARDS > 1:
+                        self._vector_store = ShardedVectorStore(
+                            dim=dim,
+                            root=SHARD_DIR,
+                            shards=VECTOR_SHARDS,
+                            partition=SHARD_PARTITION,
+                            index_type=VECTOR_INDEX_TYPE,
+                            pq_m=PQ_M,
+                            pq_bits=PQ_BITS,
+                            mmap=MMAP_INDEXES,
+                            projection_path=PROJECTION_PATH if projection is not None else None,
+                            manifest=manifest,
+                            processes=SHARD_PROCESSES
+                        )
+                        return self._vector_store
+                    self._vector_store = FAISSVectorStore(
+                        dim=dim,
+                        index_path="models/faiss_index/index.faiss",
+                        metadata_path="models/faiss_index/metadata.pkl",
+                        index_type=VECTOR_INDEX_TYPE,
+                        pq_m=PQ_M,
+                        pq_bits=PQ_BITS,
+                        mmap=MMAP_INDEXES,
+                        projection=projection,
+                        manifest=manifest,
+                        compact_ratio=VECTOR_COMPACT_RATIO
+                    )
         return self._vector_store
-        
-    @property 
+
+    @staticmethod
+    def _load_projection(dim: int) -> Optional[EmbeddingProjection]:
+        """The fitted clause-index projection, if enabled and matching the model"""
+        if not PROJECTION_DIM:
+            return None
+        if not os.path.exists(PROJECTION_PATH):
+            logger.warning(f"PROJECTION_DIM={PROJECTION_DIM} but {PROJECTION_PATH} is missing; using full dimension")
+            return None
+        projection = EmbeddingProjection.load(PROJECTION_PATH)
+        if projection.dim_in != dim or projection.dim_out != PROJECTION_DIM:
+            logger.warning(f"Projection {PROJECTION_PATH} maps {projection.dim_in}->{projection.dim_out}, "
+                           f"expected {dim}->{PROJECTION_DIM}; using full dimension")
+            return None
+        return projection
+
+    @property
+    def span_index(self) -> SentenceSpanIndex:
+        """Lazy load the sentence index over retrieved chunks"""
+        if self._span_index is None:
+            with self._init_lock:
+                if self._span_index is None:
+                    self._span_index = SentenceSpanIndex(self.embedder, max_chunks=SPAN_CACHE_CHUNKS)
+                    memory.guard.register_relief(self._span_index.clear)
+        return self._span_index
+
+    @property
+    def document_store(self):
+        """Lazy load the persistent per-document index store"""
+        if self._document_store is None:
+            with self._init_lock:
+                if self._document_store is None:
+                    manifest = IndexManifest(
+                        model=EMBEDDING_MODEL_NAME,
+                        dim=self.embedder.dimension,
+                        normalization=self.embedder.normalization,
+                        chunker={"chunk_size": self.document_processor.chunk_size,
+                                 "overlap": self.document_processor.overlap}
+                    )
+                    self._document_store = DocumentIndexStore(
+                        root=DOCUMENT_INDEX_DIR,
+                        dim=manifest.dim,
+                        cache_size=DOCUMENT_CACHE_SIZE,
+                        register_in_db=REGISTER_DOCUMENTS_IN_DB,
+                        index_type=DOCUMENT_INDEX_TYPE,
+                        pq_m=PQ_M,
+                        pq_bits=PQ_BITS,
+                        mmap=MMAP_INDEXES,
+                        manifest=manifest,
+                        embed=self.embedder.get_embeddings,
+                        max_bytes=DOCUMENT_INDEX_MAX_MB * 1024 * 1024
+                    )
+                    memory.guard.register_relief(self._document_store.clear_cache)
+        return self._document_store
+
+    @property
+    def answer_table(self) -> Optional[AnswerTable]:
+        """Precomputed answers for frequent questions, None when disabled"""
+        if not USE_ANSWER_TABLE:
+            return None
+        if self._answer_table is None:
+            with self._init_lock:
+                if self._answer_table is None:
+                    self._answer_table = AnswerTable(ANSWER_TABLE_PATH)
+        return self._answer_table
+
+    def _index_version(self, content_hash: str) -> Optional[str]:
+        # Read from disk until the document store is loaded, so table hits never load the model
+        if self._document_store is not None:
+            return self._document_store.version(content_hash)
+        return stored_index_version(DOCUMENT_INDEX_DIR, content_hash)
+
+    def precomputed(self, content_hash: str, questions: List[str]) -> List[Optional[dict]]:
+        """Answer table entries for the questions on a document (None where there is none)"""
+        table = self.answer_table
+        if table is None or not table.has_document(content_hash):
+            return [None] * len(questions)
+        version = answer_version(self._index_version(content_hash))
+        entries = [table.lookup(content_hash, version, question) for question in questions]
+        profiling.annotate(answer_table_hits=sum(entry is not None for entry in entries))
+        return entries
+
+    async def _precomputed_for_file(self, file_path: str, questions: List[str]) -> Tuple[str, list]:
+        """(content hash, answer table entries) for a document file"""
+        content_hash = await executors.run("indexing", file_sha256, file_path)
+        table = self.answer_table
+        if table is None or not table.document_count():
+            return content_hash, [None] * len(questions)
+        return content_hash, self.precomputed(content_hash, questions)
+
+    @property
     def clause_matcher(self):
         """Lazy load clause matcher only when needed"""
         if self._clause_matcher is None:
-            self._clause_matcher = ClauseMatcher(
-                embedder=self.embedder,
-                store=self.vector_store,
-                threshold=MATCH_THRESHOLD
-            )
+            with self._init_lock:
+                if self._clause_matcher is None:
+                    filters = {}
+                    if MATCH_ACTIVE_ONLY:
+                        filters["is_active"] = True
+                    if MATCH_POLICY_TYPE:
+                        filters["policy_type"] = MATCH_POLICY_TYPE
+                    self._clause_matcher = ClauseMatcher(
+                        embedder=self.embedder,
+                        store=self.vector_store,
+                        threshold=MATCH_THRESHOLD,
+                        filters=filters
+                    )
         return self._clause_matcher
-        
+
     @property
     def decision_engine(self):
         """Lazy load decision engine only when needed"""
         if self._decision_engine is None:
-            self._decision_engine = DecisionEngine()
+            with self._init_lock:
+                if self._decision_engine is None:
+                    self._decision_engine = DecisionEngine(self.clause_matcher)
         return self._decision_engine
-    
-    def run(self, file_stream, query: str, metadata: dict = None) -> dict:
+
+    @staticmethod
+    def _save_upload(file_stream) -> str:
+        """Save an uploaded file stream to a temporary PDF and return its path"""
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_file:
+            content = file_stream.read()
+            temp_file.write(content)
+            return temp_file.name
+
+    @staticmethod
+    def fetch_document(url: str, timeout: float = 30) -> bytes:
+        # Imported on the first download rather than at API start-up
+        import requests
+        # Socket timeouts never outlast the request deadline, and a slow body
+        # stops being read once the deadline passes
+        remaining = deadline.remaining()
+        if remaining is not None:
+            timeout = max(0.1, min(timeout, remaining))
+        with requests.get(url, timeout=timeout, stream=True) as doc_response:
+            doc_response.raise_for_status()
+            content = bytearray()
+            for block in doc_response.iter_content(chunk_size=64 * 1024):
+                deadline.check("download")
+                content += block
+        return bytes(content)
+
+    @staticmethod
+    def _write_temp(content: bytes) -> str:
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_file:
+            temp_file.write(content)
+            return temp_file.name
+
+    @classmethod
+    def download_document(cls, url: str, timeout: int = 30) -> str:
+        """Download a document to a temporary PDF and return its path"""
+        return cls._write_temp(cls.fetch_document(url, timeout))
+
+    async def adownload_document(self, url: str) -> str:
+        """
+        download_document() on the download executor. Concurrent requests for
+        the same URL share one fetch; each gets its own temporary file. The
+        shared fetch runs outside any request deadline and each caller waits
+        for it only as long as its own deadline allows.
+        """
+        content = await deadline.within(self._download_flights.run(
+            url, lambda: deadline.unbounded(executors.run("download", self.fetch_document, url))), "download")
+        return await executors.run("download", self._write_temp, content)
+
+    def run(self, file_stream, query: str, metadata: dict = None, endpoint: str = "query") -> dict:
         """
         Main pipeline execution
         Args:
             file_stream: PDF file stream from FastAPI UploadFile
             query: User's insurance query
             metadata: Optional metadata (age, conditions, etc.)
+            endpoint: Label used for per-stage latency metrics
         """
         if metadata is None:
             metadata = {}
-        
+
         # Save uploaded file temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_file:
-            content = file_stream.read()
-            temp_file.write(content)
-            temp_file_path = temp_file.name
-        
+        temp_file_path = self._save_upload(file_stream)
+
         try:
             # Extract text from PDF
-            document_text = self.document_processor.extract_text(temp_file_path)
-            
+            with metrics.timed("extraction", endpoint):
+                document_text = self.document_processor.extract_text(temp_file_path)
+
             # For now, we'll use the query directly for matching
             # In future, you could analyze the document content too
-            
+
             # Evaluate the claim
-            decision = self.decision_engine.evaluate_claim(query, metadata)
-            
+            with metrics.timed("decision", endpoint):
+                decision = self.decision_engine.evaluate_claim(query, metadata)
+
             return decision
-            
+
         finally:
             # Clean up temporary file
-            os.unlink(temp_file_path)
\ No newline at end of file
+            os.unlink(temp_file_path)
+
+    def _decide_batch(self, query_embeddings, entries: List[dict], endpoint: str) -> List[dict]:
+        """Match and evaluate pre-embedded queries, timing each entry"""
+        decisions = []
+        for i, (embedding, entry) in enumerate(zip(query_embeddings, entries)):
+            start = time.perf_counter()
+            with metrics.timed("decision", endpoint, question=i):
+                metadata = entry.get("metadata", {})
+                result = self.clause_matcher.match_embedding(embedding, self.decision_engine.clause_filters(metadata))
+                decision = self.decision_engine.evaluate_match(result, metadata)
+            decision["query"] = entry["query"]
+            decision["processing_time_ms"] = round((time.perf_counter() - start) * 1000, 2)
+            decisions.append(decision)
+        return decisions
+
+    def _check_upload(self, file_path: str):
+        """
+        Open an uploaded document just far enough to count its pages: rejects
+        unreadable files and documents over the page ceiling without
+        extracting any text
+        """
+        pages = self.document_processor.page_count(file_path)
+        max_pages = self.document_processor.max_pages
+        if max_pages and pages > max_pages:
+            raise DocumentTooLarge(pages, max_pages)
+
+    def run_batch(self, file_stream, entries: List[dict], endpoint: str = "query_batch") -> List[dict]:
+        """
+        Evaluate many queries against one uploaded document.
+        Decisions come from the policy clause index, as for run(), so the
+        upload is only checked, not parsed; all queries are embedded in one call.
+        Args:
+            file_stream: PDF file stream from FastAPI UploadFile
+            entries: [{"query": str, "metadata": {age, policy_duration, existing_conditions}}]
+        """
+        temp_file_path = self._save_upload(file_stream)
+        try:
+            with metrics.timed("extraction", endpoint):
+                self._check_upload(temp_file_path)
+
+            with metrics.timed("embedding", endpoint):
+                query_embeddings = self.embedder.get_embeddings([entry["query"] for entry in entries])
+
+            return self._decide_batch(query_embeddings, entries, endpoint)
+        finally:
+            os.unlink(temp_file_path)
+
+    async def arun_batch(self, file_stream, entries: List[dict], endpoint: str = "query_batch") -> List[dict]:
+        """Same as run_batch(), with blocking stages dispatched to the bounded executors"""
+        temp_file_path = self._save_upload(file_stream)
+        try:
+            with metrics.timed("extraction", endpoint):
+                await executors.run("indexing", self._check_upload, temp_file_path)
+
+            with metrics.timed("embedding", endpoint):
+                query_embeddings = await executors.run(
+                    "embedding", self.embedder.get_embeddings, [entry["query"] for entry in entries])
+
+            return await executors.run("decision", self._decide_batch, query_embeddings, entries, endpoint)
+        finally:
+            os.unlink(temp_file_path)
+
+    async def arun(self, file_stream, query: str, metadata: dict = None, endpoint: str = "query") -> dict:
+        """Same as run(), with blocking stages dispatched to the bounded executors"""
+        if metadata is None:
+            metadata = {}
+
+        temp_file_path = self._save_upload(file_stream)
+        try:
+            with metrics.timed("extraction", endpoint):
+                await executors.extract_text(self.document_processor, temp_file_path)
+
+            with metrics.timed("decision", endpoint):
+                return await executors.run("decision", self.decision_engine.evaluate_claim, query, metadata)
+        finally:
+            os.unlink(temp_file_path)
+
+    async def prepare_document(self, file_path: str, endpoint: str = "hackrx", document_name: str = None,
+                               content_hash: str = None):
+        """
+        Extract, chunk and embed a document once.
+        Returns (text_chunks, chunk_embeddings), or None when it has no text.
+        Documents seen before are served from their persistent index. Under a
+        request deadline a document too long to index in time is read only up
+        to the pages that fit, and that partial index is not persisted.
+        """
+        prepared, _ = await self._prepare_document(file_path, endpoint, document_name, content_hash)
+        return prepared
+
+    async def _prepare_document(self, file_path: str, endpoint: str, document_name: Optional[str],
+                                content_hash: Optional[str]) -> Tuple[Optional[tuple], Optional[int]]:
+        """prepare_document and the page cap it applied (None when the whole document was read)"""
+        if content_hash is None:
+            content_hash = await executors.run("indexing", file_sha256, file_path)
+
+        page_cap = await self._deadline_page_cap(file_path, content_hash)
+        if page_cap is not None:
+            deadline.degrade("pages")
+            profiling.annotate(page_cap=page_cap)
+            prepared = await deadline.within(self._document_flights.run(
+                ("prepare", content_hash, page_cap),
+                lambda: deadline.unbounded(self._prepare_unpersisted(file_path, endpoint, stop=page_cap))),
+                "extraction")
+            return prepared, page_cap
+
+        if PERSIST_DOCUMENT_INDEXES:
+            doc = await self.ingest_document(file_path, document_name or os.path.basename(file_path),
+                                             endpoint=endpoint, content_hash=content_hash)
+            return ((doc.chunks, doc.embeddings) if doc is not None else None), None
+
+        prepared = await deadline.within(self._document_flights.run(
+            ("prepare", content_hash), lambda: deadline.unbounded(self._prepare_unpersisted(file_path, endpoint))),
+            "extraction")
+        return prepared, None
+
+    async def _deadline_page_cap(self, file_path: str, content_hash: str) -> Optional[int]:
+        """Pages that can be prepared in the remaining request time, None when the whole document can"""
+        remaining = deadline.remaining()
+        if remaining is None:
+            return None
+        if PERSIST_DOCUMENT_INDEXES and self._index_version(content_hash) is not None:
+            return None  # already indexed, nothing to extract
+        budget = int(remaining * DEADLINE_PREPARE_SHARE / self._seconds_per_page)
+        pages = await executors.run("indexing", self.document_processor.page_count, file_path)
+        return max(1, budget) if pages > budget else None
+
+    def _observe_page_cost(self, seconds: float, pages: int):
+        """Fold a prepared document's cost into the per-page estimate"""
+        if pages:
+            self._seconds_per_page = 0.8 * self._seconds_per_page + 0.2 * (seconds / pages)
+
+    async def _prepare_unpersisted(self, file_path: str, endpoint: str, stop: int = None):
+        start = time.perf_counter()
+        with metrics.timed("extraction", endpoint):
+            pages = await executors.extract_pages(self.document_processor, file_path, stop)
+        if not any(page.strip() for page in pages):
+            return None
+
+        with metrics.timed("chunking", endpoint):
+            text_chunks, _ = await executors.run("chunking", self.document_processor.chunk_pages, pages)
+
+        with metrics.timed("embedding", endpoint):
+            doc_embeddings = await executors.run("embedding", self.embedder.get_embeddings, text_chunks)
+        self._observe_page_cost(time.perf_counter() - start, len(pages))
+        return text_chunks, doc_embeddings
+
+    async def ingest_document(self, file_path: str, document_name: str, document_type: str = None,
+                              endpoint: str = "documents", content_hash: str = None) -> Optional[IndexedDocument]:
+        """
+        Turn a document into a persistent per-document index (chunks, embeddings,
+        page provenance) and return it; an already indexed file is reused as-is.
+        Returns None when the document has no text. Indexing is shared with
+        concurrent callers and runs outside any request deadline; this caller
+        waits for it only as long as its own deadline allows.
+        """
+        if content_hash is None:
+            content_hash = await executors.run("indexing", file_sha256, file_path)
+        return await deadline.within(self._document_flights.run(
+            ("index", content_hash),
+            lambda: deadline.unbounded(self._ingest(file_path, content_hash, document_name, document_type,
+                                                    endpoint))),
+            "extraction")
+
+    async def _ingest(self, file_path: str, content_hash: str, document_name: str, document_type: Optional[str],
+                      endpoint: str) -> Optional[IndexedDocument]:
+        doc = await executors.run("indexing", self.document_store.get_by_hash, content_hash)
+        if doc is not None:
+            metrics.CACHE_REQUESTS.inc(cache="document_index", result="hit")
+            return doc
+        metrics.CACHE_REQUESTS.inc(cache="document_index", result="miss")
+
+        start = time.perf_counter()
+        with metrics.timed("extraction", endpoint):
+            pages = await executors.extract_pages(self.document_processor, file_path)
+        if not any(page.strip() for page in pages):
+            return None
+
+        with metrics.timed("chunking", endpoint):
+            text_chunks, chunk_pages = await executors.run("chunking", self.document_processor.chunk_pages, pages)
+
+        with metrics.timed("embedding", endpoint):
+            doc_embeddings = await executors.run("embedding", self.embedder.get_embeddings, text_chunks)
+        self._observe_page_cost(time.perf_counter() - start, len(pages))
+
+        with metrics.timed("indexing", endpoint):
+            return await executors.run("indexing", self.document_store.save, content_hash, text_chunks,
+                                       chunk_pages, doc_embeddings, document_name, document_type, len(pages))
+
+    def document_decision_engine(self, doc: IndexedDocument) -> DecisionEngine:
+        """Decision engine that matches against one document's own index"""
+        engine = getattr(doc, "decision_engine", None)
+        if engine is None:
+            matcher = ClauseMatcher(embedder=self.embedder, store=doc.store, threshold=MATCH_THRESHOLD)
+            engine = doc.decision_engine = DecisionEngine(matcher, filter_keys=())
+        return engine
+
+    async def arun_document(self, document_id: int, query: str, metadata: dict = None,
+                            endpoint: str = "query") -> dict:
+        """Evaluate a query against a previously ingested document: one vector search, no parsing"""
+        if metadata is None:
+            metadata = {}
+        content_hash = self.document_store.content_hash_for_id(document_id)
+        entry = self.precomputed(content_hash, [query])[0] if content_hash is not None else None
+        if entry is not None:
+            return DecisionEngine.evaluate_match(entry["match"], metadata)
+
+        doc = await executors.run("indexing", self.document_store.get, document_id)
+        if doc is None:
+            raise KeyError(f"Unknown document_id: {document_id}")
+        engine = self.document_decision_engine(doc)
+        with metrics.timed("decision", endpoint):
+            return await executors.run("decision", engine.evaluate_claim, query, metadata)
+
+    async def _fallback_answer(self, question: str, metadata: dict, endpoint: str, index: int) -> Optional[str]:
+        if deadline.expired():
+            return None
+        with metrics.timed("decision", endpoint, question=index):
+            decision = await executors.run("decision", self.decision_engine.evaluate_claim, question, metadata)
+        return ResponseBuilder.build_decision_answer(decision)
+
+    async def answer_questions(self, file_path: str, questions: List[str], metadata: dict = None,
+                               endpoint: str = "hackrx", document_name: str = None) -> List[Optional[str]]:
+        """
+        Answer questions against one downloaded document.
+        Questions in the precomputed answer table are answered from it. For the
+        rest, the document is extracted, chunked and embedded once and all
+        questions are embedded in a single batch. Falls back to the decision
+        engine when the document cannot be analysed.
+        Questions left unanswered when the request deadline runs out are None.
+        """
+        if metadata is None:
+            metadata = dict(DEFAULT_METADATA)
+        if not questions:
+            return []
+
+        content_hash, precomputed = await self._precomputed_for_file(file_path, questions)
+        remaining = [question for question, entry in zip(questions, precomputed) if entry is None]
+        if not remaining:
+            return [entry["answer"] for entry in precomputed]
+
+        answers = None
+        try:
+            prepared, page_cap = await self._prepare_document(file_path, endpoint, document_name, content_hash)
+            if prepared:
+                answers = await self._answer_flights.run_many(
+                    [self._answer_key(content_hash, page_cap, question) for question in remaining],
+                    lambda keys: self.answer_prepared([prepared], [key[-1] for key in keys], endpoint))
+        except executors.StageQueueFull:
+            raise
+        except deadline.DeadlineExceeded as exceeded:
+            logger.warning(f"Document analysis stopped: {exceeded}")
+        except Exception as doc_error:
+            logger.warning(f"Document analysis failed: {doc_error}")
+
+        if answers is None:
+            answers = await self.answer_fallback(remaining, metadata, endpoint)
+        answers = iter(answers)
+        return [entry["answer"] if entry is not None else next(answers) for entry in precomputed]
+
+    @staticmethod
+    def _answer_key(content_hash: str, page_cap: Optional[int], question: str) -> tuple:
+        """
+        Coalescing key of one answer. A coalesced caller gets the leader's
+        answer, which depends on the pages read and, under a deadline, on how
+        answers are built with the time left (lexical match, top chunk or
+        sentence span); callers only share answers built the same way.
+        """
+        if deadline.short_of(DEADLINE_EMBED_MIN_SECONDS, "lexical"):
+            mode = "lexical"
+        elif ANSWER_SPANS and not deadline.short_of(DEADLINE_SPAN_MIN_SECONDS, "spans"):
+            mode = "spans"
+        else:
+            mode = "top_chunk"
+        return content_hash, page_cap, mode, question
+
+    async def answer_prepared(self, prepared_documents: list, questions: List[str],
+                              endpoint: str = "hackrx") -> List[str]:
+        """
+        Answer questions against one or more prepared documents, searching the
+        union of their chunks. Questions are embedded in a single batch.
+        """
+        if len(prepared_documents) == 1:
+            text_chunks, doc_embeddings = prepared_documents[0]
+        else:
+            text_chunks = [chunk for chunks, _ in prepared_documents for chunk in chunks]
+            doc_embeddings = np.vstack([embeddings for _, embeddings in prepared_documents])
+        return await self._answer_chunks(text_chunks, doc_embeddings, questions, endpoint)
+
+    async def _answer_chunks(self, text_chunks: List[str], doc_embeddings, questions: List[str],
+                             endpoint: str, index: int = None) -> List[str]:
+        """Embed the questions and answer them from the chunks, lexically when the deadline is too close"""
+        attrs = {"question": index} if index is not None else {}
+        if deadline.short_of(DEADLINE_EMBED_MIN_SECONDS, "lexical"):
+            with metrics.timed("search", endpoint, **attrs):
+                candidates = await executors.run("search", lexical_top_chunks, text_chunks, questions, 1)
+            return [ResponseBuilder.build_document_answer(text_chunks[chunks[0]]) for chunks in candidates]
+
+        with metrics.timed("embedding", endpoint, **attrs):
+            question_embeddings = await executors.run("embedding", self.embedder.get_embeddings, questions)
+        return await self._answers_from_chunks(text_chunks, doc_embeddings, question_embeddings, endpoint, index)
+
+    async def _answers_from_chunks(self, text_chunks: List[str], doc_embeddings, question_embeddings,
+                                   endpoint: str, index: int = None) -> List[str]:
+        """Retrieve the top chunks for pre-embedded questions and build their answers"""
+        # Close to the deadline: single top chunk, no sentence embedding
+        spans = ANSWER_SPANS and not deadline.short_of(DEADLINE_SPAN_MIN_SECONDS, "spans")
+        count = ANSWER_SPAN_CHUNKS if spans else 1
+        attrs = {"question": index} if index is not None else {}
+        with metrics.timed("search", endpoint, **attrs):
+            candidates = await executors.run("search", top_chunks, doc_embeddings, question_embeddings, count)
+
+        if not spans:
+            with metrics.timed("answer", endpoint, **attrs):
+                return [ResponseBuilder.build_document_answer(text_chunks[chunks[0]]) for chunks in candidates]
+
+        # Sentences of chunks retrieved for the first time are embedded here, then cached
+        with metrics.timed("answer", endpoint, **attrs):
+            spans = await executors.run("embedding", self.document_answer_spans, text_chunks, candidates,
+                                        question_embeddings)
+        return [ResponseBuilder.build_span_answer(span) for span in spans]
+
+    def document_answer_spans(self, text_chunks: List[str], candidates: List[List[int]],
+                              question_embeddings) -> List[str]:
+        """Best sentence span for each question within its candidate chunks"""
+        return self.span_index.best_spans(question_embeddings,
+                                          [[text_chunks[i] for i in chunks] for chunks in candidates],
+                                          max_sentences=ANSWER_SPAN_SENTENCES)
+
+    async def answer_fallback(self, questions: List[str], metadata: dict = None,
+                              endpoint: str = "hackrx") -> List[Optional[str]]:
+        """Answer from the decision engine when no document content is usable (None once the deadline passed)"""
+        if metadata is None:
+            metadata = dict(DEFAULT_METADATA)
+        return [await self._fallback_answer(question, metadata, endpoint, i)
+                for i, question in enumerate(questions)]
+
+    async def _answer_one(self, prepared: tuple, question: str, endpoint: str, index: int) -> str:
+        text_chunks, doc_embeddings = prepared
+        answers = await self._answer_chunks(text_chunks, doc_embeddings, [question], endpoint, index)
+        return answers[0]
+
+    async def iter_answers(self, file_path: str, questions: List[str], metadata: dict = None, endpoint: str = "hackrx",
+                           document_name: str = None) -> AsyncIterator[Tuple[int, Optional[str]]]:
+        """
+        Streaming variant of answer_questions: yields (index, answer) as soon as
+        each question is answered instead of batching all questions together.
+        Questions that need the decision engine get None once the deadline has passed.
+        """
+        if metadata is None:
+            metadata = dict(DEFAULT_METADATA)
+
+        # Precomputed answers go out before the document is even parsed
+        content_hash, precomputed = await self._precomputed_for_file(file_path, questions)
+        for i, entry in enumerate(precomputed):
+            if entry is not None:
+                yield i, entry["answer"]
+        if all(entry is not None for entry in precomputed):
+            return
+
+        prepared, page_cap = None, None
+        try:
+            prepared, page_cap = await self._prepare_document(file_path, endpoint, document_name, content_hash)
+        except executors.StageQueueFull:
+            raise
+        except deadline.DeadlineExceeded as exceeded:
+            logger.warning(f"Document analysis stopped: {exceeded}")
+        except Exception as doc_error:
+            logger.warning(f"Document analysis failed: {doc_error}")
+
+        for i, question in enumerate(questions):
+            if precomputed[i] is not None:
+                continue
+            if prepared:
+                answer = await self._answer_flights.run(
+                    self._answer_key(content_hash, page_cap, question),
+                    lambda: self._answer_one(prepared, question, endpoint, i))
+            else:
+                answer = await self._fallback_answer(question, metadata, endpoint, i)
+            yield i, answer
@@ -0,0 +1,145 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from app import metrics
+from config import ANSWER_SPANS, ANSWER_SPAN_CHUNKS, ANSWER_SPAN_SENTENCES
+
+logger = logging.getLogger(__name__)
+
+TABLE_VERSION = 1
+
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+
+
+def normalize_question(question: str) -> str:
+    """Lookup key for a question: lowercase words, punctuation and spacing ignored"""
+    return _NON_WORD.sub(" ", question.lower()).strip()
+
+
+def answer_version(index_version: Optional[str]) -> Optional[str]:
+    """
+    Version a document's answers are stored and looked up under: its index
+    version plus how answers are built (top chunk, or sentence spans over how
+    many chunks and sentences), so changing the answer settings misses too
+    """
+    if index_version is None:
+        return None
+    mode = f"spans-{ANSWER_SPAN_CHUNKS}x{ANSWER_SPAN_SENTENCES}" if ANSWER_SPANS else "top_chunk"
+    return f"{index_version}+{mode}"
+
+
+class AnswerTable:
+    """
+    Precomputed answers for frequent questions, per document content hash.
+
+    Built offline by scripts/build_answer_table.py. Each document entry records
+    the answer_version() it was computed under; a lookup against a document
+    whose index has since been rebuilt (new file content, model or chunking)
+    or with other answer settings misses.
+    On disk each distinct answer is stored once and every known phrasing of
+    the question maps to it:
+
+        {"documents": {content_hash: {"index_version": ..., "answers": [...],
+                                      "keys": {normalized question: answer index}}}}
+    """
+
+    def __init__(self, path: str, reload_interval: float = 30.0):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._documents: Dict[str, Dict] = {}
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.reload()
+
+    def __len__(self) -> int:
+        return sum(len(entry["keys"]) for entry in self._documents.values())
+
+    def reload(self):
+        """Load the table from disk, or start empty when there is none"""
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            self._documents, self._mtime = {}, None
+            return
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable answer table {self.path}: {e}")
+            return
+        self._documents = data.get("documents", {})
+        self._mtime = mtime
+        logger.info(f"Loaded {len(self)} precomputed answers for {len(self._documents)} documents")
+
+    def _maybe_reload(self):
+        # The offline job replaces the file; pick it up without a restart
+        now = time.monotonic()
+        if now - self._checked_at < self.reload_interval:
+            return
+        with self._lock:
+            if now - self._checked_at < self.reload_interval:
+                return
+            self._checked_at = now
+            try:
+                mtime = os.path.getmtime(self.path)
+            except OSError:
+                mtime = None
+            if mtime != self._mtime:
+                self.reload()
+
+    def lookup(self, content_hash: str, index_version: Optional[str], question: str) -> Optional[Dict]:
+        """Precomputed entry for a question on a document, or None"""
+        self._maybe_reload()
+        entry = self._documents.get(content_hash)
+        if entry is None:
+            return None
+        if entry.get("index_version") != index_version:
+            metrics.CACHE_REQUESTS.inc(cache="answer_table", result="stale")
+            return None
+        answer_index = entry["keys"].get(normalize_question(question))
+        if answer_index is None:
+            metrics.CACHE_REQUESTS.inc(cache="answer_table", result="miss")
+            return None
+        metrics.CACHE_REQUESTS.inc(cache="answer_table", result="hit")
+        return entry["answers"][answer_index]
+
+    def document_count(self) -> int:
+        self._maybe_reload()
+        return len(self._documents)
+
+    def has_document(self, content_hash: str) -> bool:
+        self._maybe_reload()
+        return content_hash in self._documents
+
+    def put(self, content_hash: str, index_version: str, questions: List[str], answer: Dict):
+        """Store one answer under every phrasing in `questions`"""
+        entry = self._documents.get(content_hash)
+        if entry is None or entry.get("index_version") != index_version:
+            entry = self._documents[content_hash] = {"index_version": index_version, "answers": [], "keys": {}}
+        entry["answers"].append(answer)
+        for question in questions:
+            entry["keys"][normalize_question(question)] = len(entry["answers"]) - 1
+
+    def invalidate(self, content_hash: str):
+        self._documents.pop(content_hash, None)
+
+    def drop_stale(self, version_of: Callable[[str], Optional[str]]) -> int:
+        """Remove documents whose index version changed; returns how many were dropped"""
+        stale = [content_hash for content_hash, entry in self._documents.items()
+                 if entry.get("index_version") != version_of(content_hash)]
+        for content_hash in stale:
+            self.invalidate(content_hash)
+        return len(stale)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path + ".tmp", "w") as f:
+            json.dump({"version": TABLE_VERSION, "documents": self._documents}, f, separators=(",", ":"))
+        os.replace(self.path + ".tmp", self.path)
+        self._mtime = os.path.getmtime(self.path)
@@ -0,0 +1,188 @@
+import multiprocessing
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from app import profiling
+from app.document_processor import DocumentProcessor
+from app.index_manifest import text_hash
+
+# Keywords that indicate policy clauses
+CLAUSE_KEYWORDS = [
+    'exclusion', 'excluded', 'not covered', 'waiting period', 'coverage', 'covered',
+    'benefit', 'claim', 'premium', 'policy', 'insured', 'treatment', 'medical',
+    'hospitalization', 'condition', 'illness', 'accident', 'death', 'maternity',
+    'dental', 'pre-existing', 'deductible', 'copay', 'sum insured'
+]
+
+# First match wins; checked against the lowercased clause
+CLAUSE_TYPE_RULES = [
+    ('exclusion', ['exclusion', 'excluded', 'not covered']),
+    ('coverage', ['coverage', 'covered', 'benefit']),
+    ('condition', ['waiting period', 'condition', 'require']),
+]
+SECTION_RULES = [
+    ('Exclusions', ['exclusion']),
+    ('Benefits', ['benefit', 'coverage']),
+    ('Conditions', ['condition']),
+]
+
+# Tokens whose trailing period does not end a sentence
+ABBREVIATIONS = {
+    'e.g', 'i.e', 'etc', 'viz', 'vs', 'no', 'nos', 'rs', 'inr', 'dr', 'mr', 'mrs', 'ms', 'sr', 'st',
+    'approx', 'incl', 'max', 'min', 'fig', 'sec', 'cl', 'art', 'ltd', 'co', 'pvt',
+}
+
+# A numbered clause ("3.", "4.2.1", "(b)", "iv)") at the start of a line
+_NUMBERED_CLAUSE = r'\n(?=[ \t]*(?:\d+(?:\.\d+)*[.)]?|\([a-zA-Z0-9]{1,4}\)|[a-z]{1,4}\))[ \t]+\S)'
+# Sentence punctuation followed by a new sentence, a blank line, or a numbered clause
+_BOUNDARY = re.compile(r'[.?!](?=\s+["\'(]?[A-Z0-9])|\n[ \t]*\n|' + _NUMBERED_CLAUSE)
+# Text that is only a clause number, so its period belongs to the clause that follows
+_CLAUSE_NUMBER = re.compile(r'\s*(?:\d+(?:\.\d+)*|[a-zA-Z]{1,4}|\([a-zA-Z0-9]{1,4}\))')
+
+
+def _matcher(words: List[str]) -> "re.Pattern":
+    """One compiled alternation, equivalent to any(word in text for word in words)"""
+    return re.compile('|'.join(re.escape(word) for word in sorted(words, key=len, reverse=True)))
+
+
+_KEYWORDS = _matcher(CLAUSE_KEYWORDS)
+_CLAUSE_TYPES = [(name, _matcher(words)) for name, words in CLAUSE_TYPE_RULES]
+_SECTIONS = [(name, _matcher(words)) for name, words in SECTION_RULES]
+
+
+def segment(text: str) -> Iterator[Tuple[int, int]]:
+    """
+    Split page text into sentences and numbered clauses; yields (start, end)
+    character offsets. Decimals ("2.5") and common abbreviations ("e.g.",
+    "Rs.") do not end a sentence.
+    """
+    start = 0
+    for match in _BOUNDARY.finditer(text):
+        end = match.end()
+        if text[match.start()] == '.':
+            word_start = max(text.rfind(' ', start, match.start()), text.rfind('\n', start, match.start())) + 1
+            if text[word_start:match.start()].lstrip('("\'').lower() in ABBREVIATIONS:
+                continue
+            if _CLAUSE_NUMBER.fullmatch(text, start, match.start()):
+                continue
+        else:
+            end = match.start()
+        if end > start:
+            yield start, end
+        start = match.end()
+    if start < len(text):
+        yield start, len(text)
+
+
+def classify(clause_lower: str) -> Tuple[str, str]:
+    """(clause_type, section) for a lowercased clause"""
+    clause_type = next((name for name, pattern in _CLAUSE_TYPES if pattern.search(clause_lower)), 'condition')
+    section = next((name for name, pattern in _SECTIONS if pattern.search(clause_lower)), 'General')
+    return clause_type, section
+
+
+def extract_page_clauses(page_text: str, page_number: int, min_length: int = 50) -> List[Dict]:
+    """Policy clauses on one page, with 1-based page/line numbers and the character offset"""
+    clauses = []
+    line_number = 1
+    counted_to = 0
+    for start, end in segment(page_text):
+        raw = page_text[start:end]
+        clause_text = ' '.join(raw.split())
+        if len(clause_text) < min_length:
+            continue
+        clause_lower = clause_text.lower()
+        if not _KEYWORDS.search(clause_lower):
+            continue
+
+        offset = start + (len(raw) - len(raw.lstrip()))
+        line_number += page_text.count('\n', counted_to, offset)
+        counted_to = offset
+        clause_type, section = classify(clause_lower)
+        clauses.append({
+            'clause_text': clause_text,
+            'section': section,
+            'clause_type': clause_type,
+            'page_number': page_number,
+            'line_number': line_number,
+            'char_offset': offset,
+        })
+    return clauses
+
+
+def _extract_page_range(file_path: str, start: int, stop: int, min_length: int) -> List[Dict]:
+    """Process-pool entry point: parse and segment pages [start, stop) of one document"""
+    processor = DocumentProcessor()
+    if file_path.lower().endswith('.pdf'):
+        pages = processor.iter_pdf_pages(file_path, max_pages=0, start=start, stop=stop)
+    else:
+        pages = processor.extract_pages(file_path)
+    clauses = []
+    for page_number, page_text in enumerate(pages, start=start + 1):
+        clauses.extend(extract_page_clauses(page_text, page_number, min_length))
+    return clauses
+
+
+class ClauseExtractor:
+    """
+    Pulls policy clauses out of a wording document. Pages are parsed and
+    segmented in contiguous ranges on a process pool, so a multi-hundred-page
+    PDF uses every core; each clause keeps its page, line and offset.
+    """
+
+    def __init__(self, policy_type: str = 'health', code_prefix: str = 'Bajaj', min_length: int = 50,
+                 processes: Optional[int] = None, pages_per_task: int = 16):
+        """
+        processes: worker processes (None = one per core, 0/1 = in-process)
+        """
+        self.policy_type = policy_type
+        self.code_prefix = code_prefix
+        self.min_length = min_length
+        self.processes = multiprocessing.cpu_count() if processes is None else processes
+        self.pages_per_task = max(1, pages_per_task)
+
+    def _ranges(self, page_count: int) -> List[Tuple[int, int]]:
+        # Enough tasks to balance uneven pages across workers, few enough to amortize opening the PDF
+        size = min(self.pages_per_task, max(1, -(-page_count // max(1, self.processes * 4))))
+        return [(start, min(start + size, page_count)) for start in range(0, page_count, size)]
+
+    def _code(self, clause: Dict, seen: Dict[str, int]) -> str:
+        """
+        Clause code derived from the clause text, so it survives clauses being
+        added or removed elsewhere in the document; a repeated text gets a suffix.
+        """
+        code = f"{self.code_prefix}-{clause['clause_type'].title()}-{text_hash(clause['clause_text'])[:10]}"
+        seen[code] = seen.get(code, 0) + 1
+        return code if seen[code] == 1 else f"{code}-{seen[code]}"
+
+    def extract(self, file_path: str) -> List[Dict]:
+        page_count = DocumentProcessor().page_count(file_path)
+        profiling.annotate(pages=page_count)
+        ranges = self._ranges(page_count)
+
+        if self.processes <= 1 or len(ranges) == 1:
+            page_clauses = [_extract_page_range(file_path, start, stop, self.min_length) for start, stop in ranges]
+        else:
+            # spawn avoids forking a process that already holds torch/FAISS threads
+            with ProcessPoolExecutor(max_workers=min(self.processes, len(ranges)),
+                                     mp_context=multiprocessing.get_context('spawn')) as pool:
+                page_clauses = list(pool.map(_extract_page_range, [file_path] * len(ranges),
+                                             [start for start, _ in ranges], [stop for _, stop in ranges],
+                                             [self.min_length] * len(ranges)))
+
+        clauses = []
+        seen = {}
+        for chunk in page_clauses:
+            for clause in chunk:
+                clauses.append({
+                    'clause_text': clause['clause_text'],
+                    'section': clause['section'],
+                    'code': self._code(clause, seen),
+                    'clause_type': clause['clause_type'],
+                    'policy_type': self.policy_type,
+                    'page_number': clause['page_number'],
+                    'line_number': clause['line_number'],
+                    'char_offset': clause['char_offset'],
+                })
+        return clauses
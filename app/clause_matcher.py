@@ -1,18 +1,28 @@
 from app.embedder import Embedder
 from app.vector_store import FAISSVectorStore
-from typing import Dict
+from typing import Dict, Optional
 
 
 class ClauseMatcher:
-    def __init__(self, embedder: Embedder, store: FAISSVectorStore, threshold: float = 0.35):
+    def __init__(self, embedder: Embedder, store: FAISSVectorStore, threshold: float = 0.35,
+                 filters: Optional[Dict] = None):
+        """
+        filters: clause filters applied to every search (e.g. {"is_active": True});
+            per-call filters are added on top and win for the same field
+        """
         self.embedder = embedder
         self.store = store
         self.threshold = threshold
+        self.filters = filters or {}
         self.store.load_index()
 
-    def match_query(self, query: str) -> Dict:
+    def match_query(self, query: str, filters: Optional[Dict] = None) -> Dict:
         query_embedding = self.embedder.get_embeddings([query])[0]
-        matches = self.store.search(query_embedding, top_k=3)
+        return self.match_embedding(query_embedding, filters)
+
+    def match_embedding(self, query_embedding, filters: Optional[Dict] = None) -> Dict:
+        """Match an already-embedded query (lets callers embed many queries in one call)"""
+        matches = self.store.search(query_embedding, top_k=3, filters={**self.filters, **(filters or {})})
 
         if not matches:
             return {
@@ -0,0 +1,157 @@
+import asyncio
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Awaitable, List, Optional
+
+from app import metrics, profiling
+
+_current_deadline: contextvars.ContextVar = contextvars.ContextVar("request_deadline", default=None)
+
+DEADLINE_DEGRADATIONS = metrics.REGISTRY.register(metrics.Counter(
+    "bajaj_deadline_degradations_total",
+    "Work skipped or reduced to stay within a request deadline, by step "
+    "(pages, spans, lexical, unanswered)", ("step",)))
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a stage is about to start after the request deadline has passed"""
+
+    def __init__(self, stage: str):
+        super().__init__(f"Request deadline reached before '{stage}'")
+        self.stage = stage
+
+
+class Deadline:
+    """
+    Time budget of one request. Stages read the remaining time to shrink
+    their work (fewer pages, no sentence spans, lexical matching) and record
+    each such step, so the response can say how it was degraded.
+    """
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+        self.degraded: List[str] = []
+        self._lock = threading.Lock()
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def check(self, stage: str):
+        if self.expired():
+            raise DeadlineExceeded(stage)
+
+    def degrade(self, step: str):
+        """Record a degradation step (counted once per request)"""
+        with self._lock:
+            if step in self.degraded:
+                return
+            self.degraded.append(step)
+        DEADLINE_DEGRADATIONS.inc(step=step)
+        profiling.annotate(degraded=list(self.degraded))
+
+
+def current() -> Optional[Deadline]:
+    return _current_deadline.get()
+
+
+@contextmanager
+def scope(deadline: Optional[Deadline]):
+    """Make `deadline` the active request deadline for the enclosed block (no-op when None)"""
+    if deadline is None:
+        yield None
+        return
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left in the active deadline, None without one"""
+    deadline = _current_deadline.get()
+    return deadline.remaining() if deadline is not None else None
+
+
+def expired() -> bool:
+    deadline = _current_deadline.get()
+    return deadline is not None and deadline.expired()
+
+
+def check(stage: str):
+    """Raise DeadlineExceeded if the active deadline has passed"""
+    deadline = _current_deadline.get()
+    if deadline is not None:
+        deadline.check(stage)
+
+
+def short_of(seconds: float, step: str) -> bool:
+    """
+    True when less than `seconds` are left; the caller then takes the cheaper
+    path and `step` is recorded as a degradation.
+    """
+    deadline = _current_deadline.get()
+    if deadline is None or deadline.remaining() >= seconds:
+        return False
+    deadline.degrade(step)
+    return True
+
+
+def degrade(step: str):
+    deadline = _current_deadline.get()
+    if deadline is not None:
+        deadline.degrade(step)
+
+
+async def unbounded(awaitable: Awaitable):
+    """
+    Await work shared between requests (single-flight) outside any request
+    deadline, so it never stops at whichever caller started it; each caller
+    bounds its own wait with within().
+    """
+    token = _current_deadline.set(None)
+    try:
+        return await awaitable
+    finally:
+        _current_deadline.reset(token)
+
+
+async def within(awaitable: Awaitable, stage: str):
+    """
+    Await `awaitable` for at most the time left in the active deadline;
+    raises DeadlineExceeded(stage) when it runs out (the awaitable is
+    cancelled, which leaves shared work running for its other waiters).
+    """
+    deadline = _current_deadline.get()
+    if deadline is None:
+        return await awaitable
+    if deadline.expired():
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()  # never started
+        raise DeadlineExceeded(stage)
+    try:
+        return await asyncio.wait_for(awaitable, deadline.remaining())
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded(stage) from None
+
+
+def from_header(value: Optional[str], default: float, maximum: float) -> Optional[Deadline]:
+    """
+    Deadline from a request timeout header in seconds, else `default`; capped
+    at `maximum`. None when neither gives a positive budget.
+    """
+    seconds = default
+    if value:
+        try:
+            seconds = float(value)
+        except ValueError:
+            pass
+    if maximum > 0:
+        seconds = min(seconds, maximum)
+    return Deadline(seconds) if seconds > 0 else None
@@ -1,9 +1,14 @@
 from app.clause_matcher import ClauseMatcher
 from typing import Dict
 
+# Query metadata keys that restrict which clauses can match
+CLAUSE_FILTER_KEYS = ("policy_type", "clause_type", "section")
+
 class DecisionEngine:
-    def __init__(self, clause_matcher: ClauseMatcher):
+    def __init__(self, clause_matcher: ClauseMatcher, filter_keys=CLAUSE_FILTER_KEYS):
+        """filter_keys: metadata keys passed on as clause filters (none for a document's own chunks)"""
         self.matcher = clause_matcher
+        self.filter_keys = filter_keys
 
     def evaluate_claim(self, user_query: str, metadata: Dict) -> Dict:
         """
@@ -13,9 +18,18 @@ class DecisionEngine:
             - city
             - policy_duration
             - existing_conditions
+            - policy_type / clause_type / section (only match such clauses)
         """
-        result = self.matcher.match_query(user_query)
+        result = self.matcher.match_query(user_query, self.clause_filters(metadata))
+        return self.evaluate_match(result, metadata)
+
+    def clause_filters(self, metadata: Dict) -> Dict:
+        """Clause search filters requested in the query metadata"""
+        return {key: metadata[key] for key in self.filter_keys if metadata.get(key)}
 
+    @staticmethod
+    def evaluate_match(result: Dict, metadata: Dict) -> Dict:
+        """Apply the business rules to a ClauseMatcher result"""
         if not result.get("match_found"):
             return {
                 "claim_allowed": False,
@@ -1,23 +1,72 @@
 import os
-import fitz  # PyMuPDF
-import docx2txt
-import email
-from bs4 import BeautifulSoup
-from typing import List
+from typing import Iterator, List, Optional, Tuple
 from email import policy
 from email.parser import BytesParser
+from app import profiling
+
+# Format libraries (PyMuPDF, docx2txt, BeautifulSoup) are imported by the loader that needs
+# them, so a process that never reads a given format never imports its library
+
+
+class DocumentTooLarge(ValueError):
+    """The document has more pages than the configured ceiling"""
+
+    def __init__(self, pages: int, max_pages: int):
+        super().__init__(f"Document has {pages} pages, the limit is {max_pages}")
+        self.pages = pages
+        self.max_pages = max_pages
+
+    def __reduce__(self):
+        # Raised inside extraction worker processes; keep it picklable
+        return DocumentTooLarge, (self.pages, self.max_pages)
 
 
 class DocumentProcessor:
-    def __init__(self, chunk_size=300, overlap=50):
+    def __init__(self, chunk_size=300, overlap=50, max_pages=0):
         self.chunk_size = chunk_size
         self.overlap = overlap
+        self.max_pages = max_pages  # 0 = no page ceiling
+
+    def load_pdf(self, path: str, max_pages: Optional[int] = None, stop: Optional[int] = None) -> str:
+        return "\n".join(self.iter_pdf_pages(path, max_pages, stop=stop))
+
+    def load_pdf_pages(self, path: str, max_pages: Optional[int] = None, stop: Optional[int] = None) -> List[str]:
+        return list(self.iter_pdf_pages(path, max_pages, stop=stop))
 
-    def load_pdf(self, path: str) -> str:
+    def iter_pdf_pages(self, path: str, max_pages: Optional[int] = None,
+                       start: int = 0, stop: Optional[int] = None) -> Iterator[str]:
+        """
+        Yield page texts one at a time so only the current page is parsed in
+        memory. The pages to be read are checked against the ceiling before
+        any text is extracted, so a long document read only up to `stop`
+        (e.g. under a request deadline) is accepted. start/stop select a
+        0-based page range.
+        """
+        import fitz  # PyMuPDF
+        max_pages = self.max_pages if max_pages is None else max_pages
         doc = fitz.open(path)
-        return "\n".join([page.get_text() for page in doc])
+        try:
+            profiling.annotate(pages=len(doc))
+            end = len(doc) if stop is None else min(stop, len(doc))
+            if max_pages and end > max_pages:
+                raise DocumentTooLarge(len(doc), max_pages)
+            for page_number in range(start, end):
+                page = doc.load_page(page_number)
+                yield page.get_text()
+                del page
+        finally:
+            doc.close()
+
+    def page_count(self, file_path: str) -> int:
+        """Number of pages; formats without pages count as one"""
+        if os.path.splitext(file_path)[1].lower() != '.pdf':
+            return 1
+        import fitz  # PyMuPDF
+        with fitz.open(file_path) as doc:
+            return len(doc)
 
     def load_docx(self, path: str) -> str:
+        import docx2txt
         return docx2txt.process(path)
 
     def load_eml(self, path: str) -> str:
@@ -25,13 +74,15 @@ class DocumentProcessor:
             msg = BytesParser(policy=policy.default).parse(f)
         body = msg.get_body(preferencelist=('plain', 'html'))
         if body.get_content_type() == 'text/html':
+            from bs4 import BeautifulSoup
             return BeautifulSoup(body.get_content(), 'html.parser').get_text()
         return body.get_content()
 
-    def extract_text(self, file_path: str) -> str:
+    def extract_text(self, file_path: str, max_pages: Optional[int] = None, stop: Optional[int] = None) -> str:
+        """stop: only read the first `stop` pages of a PDF (the max_pages ceiling still applies)"""
         ext = os.path.splitext(file_path)[1].lower()
         if ext == '.pdf':
-            return self.load_pdf(file_path)
+            return self.load_pdf(file_path, max_pages, stop)
         elif ext == '.docx':
             return self.load_docx(file_path)
         elif ext == '.eml':
@@ -39,10 +90,38 @@ class DocumentProcessor:
         else:
             raise ValueError(f"Unsupported file type: {ext}")
 
+    def extract_pages(self, file_path: str, max_pages: Optional[int] = None,
+                      stop: Optional[int] = None) -> List[str]:
+        """Text per page; formats without pages are returned as a single page"""
+        if os.path.splitext(file_path)[1].lower() == '.pdf':
+            return self.load_pdf_pages(file_path, max_pages, stop)
+        return [self.extract_text(file_path)]
+
     def chunk_text(self, text: str) -> List[str]:
         words = text.split()
         chunks = []
         for i in range(0, len(words), self.chunk_size - self.overlap):
             chunk = " ".join(words[i:i + self.chunk_size])
             chunks.append(chunk)
+        profiling.annotate(words=len(words), chunks=len(chunks))
         return chunks
+
+    def chunk_pages(self, pages: List[str]) -> Tuple[List[str], List[int]]:
+        """
+        Same chunks as chunk_text("\n".join(pages)), plus the 1-based page
+        number each chunk starts on.
+        """
+        words = []
+        word_pages = []
+        for page_number, page_text in enumerate(pages, start=1):
+            page_words = page_text.split()
+            words.extend(page_words)
+            word_pages.extend([page_number] * len(page_words))
+
+        chunks = []
+        chunk_pages = []
+        for i in range(0, len(words), self.chunk_size - self.overlap):
+            chunks.append(" ".join(words[i:i + self.chunk_size]))
+            chunk_pages.append(word_pages[i])
+        profiling.annotate(words=len(words), chunks=len(chunks))
+        return chunks, chunk_pages
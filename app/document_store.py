@@ -0,0 +1,484 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Set
+
+import numpy as np
+
+from app.index_manifest import IndexManifest
+from app.vector_store import FAISSVectorStore
+
+logger = logging.getLogger(__name__)
+
+# Last local document id handed out, so ids of evicted documents are never reused
+LOCAL_ID_FILE = "last_local_id"
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def index_version(store: FAISSVectorStore, chunks: List[str]) -> str:
+    """Fingerprint of what a document index answers from: its chunks and embedding settings"""
+    digest = hashlib.sha256()
+    settings = store.manifest.settings().to_dict() if store.manifest is not None else {}
+    settings = {key: value for key, value in settings.items() if key not in ("created_at", "updated_at")}
+    digest.update(json.dumps([settings, store.index_type], sort_keys=True).encode("utf-8"))
+    for chunk in chunks:
+        digest.update(hashlib.sha256(chunk.encode("utf-8")).digest())
+    return digest.hexdigest()[:16]
+
+
+def stored_index_version(root: str, content_hash: str) -> Optional[str]:
+    """index_version of a persisted document, read without opening a DocumentIndexStore"""
+    try:
+        with open(os.path.join(root, content_hash, "document.json"), "r") as f:
+            info = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return info.get("index_version") or info.get("created_at")
+
+
+class IndexedDocument:
+    """A persisted per-document index: chunks, their embeddings and page provenance"""
+
+    def __init__(self, document_id: int, content_hash: str, info: Dict, store: FAISSVectorStore,
+                 pages: List[int]):
+        self.document_id = document_id
+        self.content_hash = content_hash
+        self.info = info
+        self.store = store
+        self.pages = pages
+        self._embeddings = None
+
+    @property
+    def chunks(self) -> List[str]:
+        return self.store.metadata
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        if self._embeddings is None:
+            self._embeddings = self.store.reconstruct_all()
+        return self._embeddings
+
+
+class DocumentIndexStore:
+    """
+    Persistent per-document vector indexes under `root/<content_hash>/`.
+    Each document gets a local document_id, negative and never reused. With
+    register_in_db it is also recorded in policy_documents by a background
+    thread, off the request path; its (positive) database id then resolves
+    to the same document. Chunks and their pages live only in the document's
+    index. Loaded indexes are kept in a small LRU so repeat queries cost a
+    single vector search, and on disk the least recently used documents are
+    deleted once their directories take more than max_bytes.
+    """
+
+    def __init__(self, root: str, dim: int, cache_size: int = 8, register_in_db: bool = False,
+                 index_type: str = "flat", pq_m: int = 16, pq_bits: int = 8, mmap: bool = False,
+                 manifest: Optional[IndexManifest] = None,
+                 embed: Optional[Callable[[List[str]], np.ndarray]] = None, max_bytes: int = 0):
+        """
+        manifest: current embedding settings; indexes built with another model
+            are re-embedded from their stored chunks with `embed` on load
+        max_bytes: disk budget for all document directories (0 = unlimited)
+        """
+        self.root = root
+        self.dim = dim
+        self.index_type = index_type
+        self.pq_m = pq_m
+        self.pq_bits = pq_bits
+        self.mmap = mmap
+        self.manifest = manifest
+        self.embed = embed
+        self.cache_size = cache_size
+        self.register_in_db = register_in_db
+        self.max_bytes = max_bytes
+        self._lock = threading.RLock()
+        self._cache: "OrderedDict[int, IndexedDocument]" = OrderedDict()
+        self._ids: Dict[int, str] = {}
+        self._hashes: Dict[str, int] = {}
+        self._versions: Dict[str, str] = {}
+        self._db_ids: Dict[int, str] = {}
+        # Bytes on disk per content hash, least recently used first
+        self._disk: "OrderedDict[str, int]" = OrderedDict()
+        self._registrations: Set[Future] = set()
+        # Per-document locks so a document is loaded (or re-embedded) once at a time
+        self._loading: Dict[str, threading.Lock] = {}
+        os.makedirs(root, exist_ok=True)
+        self._scan()
+
+    def _scan(self):
+        found = []
+        for entry in os.listdir(self.root):
+            info_path = os.path.join(self.root, entry, "document.json")
+            if not os.path.exists(info_path):
+                continue
+            try:
+                with open(info_path, "r") as f:
+                    info = json.load(f)
+                self._ids[info["document_id"]] = info["content_hash"]
+                self._hashes[info["content_hash"]] = info["document_id"]
+                self._versions[info["content_hash"]] = info.get("index_version") or info.get("created_at")
+                if info.get("db_document_id") is not None:
+                    self._db_ids[info["db_document_id"]] = info["content_hash"]
+                # document.json's mtime is bumped on every use
+                found.append((os.path.getmtime(info_path), info["content_hash"]))
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Skipping unreadable document index {entry}: {e}")
+        for _, content_hash in sorted(found):
+            self._disk[content_hash] = _dir_bytes(self._dir(content_hash))
+
+    def _dir(self, content_hash: str) -> str:
+        return os.path.join(self.root, content_hash)
+
+    def _resolve(self, document_id: int) -> Optional[str]:
+        """Content hash of a local or database document id"""
+        content_hash = self._ids.get(document_id)
+        return content_hash if content_hash is not None else self._db_ids.get(document_id)
+
+    def _touch(self, content_hash: str):
+        """Mark a document as just used, for disk eviction (also across restarts)"""
+        if content_hash in self._disk:
+            self._disk.move_to_end(content_hash)
+        try:
+            os.utime(os.path.join(self._dir(content_hash), "document.json"))
+        except OSError:
+            pass
+
+    def _new_local_id(self) -> int:
+        """Next local id: counts down from -1 and is never handed out twice, even after eviction"""
+        path = os.path.join(self.root, LOCAL_ID_FILE)
+        last = 0
+        try:
+            with open(path, "r") as f:
+                last = int(f.read().strip())
+        except (OSError, ValueError):
+            pass
+        document_id = min(last, min(self._ids, default=0), 0) - 1
+        with open(path + ".tmp", "w") as f:
+            f.write(str(document_id))
+        os.replace(path + ".tmp", path)
+        return document_id
+
+    def _evict(self, keep: str):
+        """Delete least recently used documents (never `keep`) until the directories fit max_bytes"""
+        if not self.max_bytes:
+            return
+        total = sum(self._disk.values())
+        for content_hash in list(self._disk):
+            if total <= self.max_bytes:
+                break
+            if content_hash == keep:
+                continue
+            total -= self._disk.pop(content_hash)
+            document_id = self._hashes.pop(content_hash, None)
+            self._ids.pop(document_id, None)
+            self._cache.pop(document_id, None)
+            self._versions.pop(content_hash, None)
+            self._loading.pop(content_hash, None)
+            for db_id in [db_id for db_id, owner in self._db_ids.items() if owner == content_hash]:
+                del self._db_ids[db_id]
+            shutil.rmtree(self._dir(content_hash), ignore_errors=True)
+            logger.info(f"Evicted document index {document_id} ({content_hash[:12]}) to stay within "
+                        f"{self.max_bytes} bytes")
+
+    def document_id_for_hash(self, content_hash: str) -> Optional[int]:
+        return self._hashes.get(content_hash)
+
+    def content_hash_for_id(self, document_id: int) -> Optional[str]:
+        return self._resolve(document_id)
+
+    def version(self, content_hash: str) -> Optional[str]:
+        """Changes whenever the document's index is rebuilt with different content or settings"""
+        return self._versions.get(content_hash)
+
+    def document_ids(self) -> List[int]:
+        return sorted(self._ids)
+
+    def info(self, document_id: int) -> Optional[Dict]:
+        content_hash = self._resolve(document_id)
+        if content_hash is None:
+            return None
+        with open(os.path.join(self._dir(content_hash), "document.json"), "r") as f:
+            return json.load(f)
+
+    def get(self, document_id: int) -> Optional[IndexedDocument]:
+        """Load a document index (LRU cached), or None if the id is unknown"""
+        with self._lock:
+            content_hash = self._resolve(document_id)
+            if content_hash is None:
+                return None
+            document_id = self._hashes[content_hash]
+            self._touch(content_hash)
+            doc = self._cached(document_id)
+            if doc is not None:
+                return doc
+            loading = self._loading.setdefault(content_hash, threading.Lock())
+
+        # Loading (and re-embedding a stale index) runs outside self._lock so other documents
+        # stay available; concurrent loads of this document wait for the first one
+        with loading:
+            with self._lock:
+                doc = self._cached(document_id)
+                if doc is not None:
+                    return doc
+            return self._load(document_id, content_hash)
+
+    def _cached(self, document_id: int) -> Optional[IndexedDocument]:
+        doc = self._cache.get(document_id)
+        if doc is not None:
+            self._cache.move_to_end(document_id)
+        return doc
+
+    def _load(self, document_id: int, content_hash: str) -> Optional[IndexedDocument]:
+        directory = self._dir(content_hash)
+        try:
+            with open(os.path.join(directory, "document.json"), "r") as f:
+                info = json.load(f)
+            store = FAISSVectorStore(
+                dim=info.get("dim", self.dim),
+                index_path=os.path.join(directory, "index.faiss"),
+                metadata_path=os.path.join(directory, "metadata.pkl"),
+                index_type=info.get("index_type", "flat"),
+                pq_m=self.pq_m,
+                pq_bits=self.pq_bits,
+                mmap=self.mmap,
+            )
+            store.load_index()
+            with open(os.path.join(directory, "pages.json"), "r") as f:
+                pages = json.load(f)
+        except OSError as e:
+            # Evicted while it was being loaded
+            logger.warning(f"Document {document_id} index is gone: {e}")
+            return None
+
+        problems = self._embedding_problems(store.manifest)
+        if problems:
+            if self.embed is None:
+                logger.warning(f"Document {document_id} index is stale ({'; '.join(problems)})")
+                return None
+            logger.info(f"Re-embedding document {document_id}: {'; '.join(problems)}")
+            chunks = list(store.metadata)
+            embeddings = self.embed(chunks)
+            with self._lock:
+                if self._hashes.get(content_hash) != document_id:
+                    return None
+                return self._write(document_id, content_hash, chunks, pages, embeddings, info)
+
+        with self._lock:
+            if self._hashes.get(content_hash) != document_id:
+                return None
+            doc = IndexedDocument(document_id, content_hash, info, store, pages)
+            self._remember(doc)
+            return doc
+
+    def _embedding_problems(self, built: Optional[IndexManifest]) -> List[str]:
+        """Differences that make stored vectors unusable with the current model (chunking aside)"""
+        if self.manifest is None or built is None:
+            return []
+        return [p for p in self.manifest.incompatibilities(built) if not p.startswith("chunker")]
+
+    def get_by_hash(self, content_hash: str) -> Optional[IndexedDocument]:
+        """
+        Index for a file's content hash, or None if unknown or chunked with
+        other settings (the caller has the file and can re-ingest it).
+        """
+        document_id = self._hashes.get(content_hash)
+        doc = self.get(document_id) if document_id is not None else None
+        if doc is not None and self.manifest is not None and self.manifest.chunker is not None:
+            built = doc.store.manifest
+            if built is not None and built.chunker is not None and built.chunker != self.manifest.chunker:
+                return None
+        return doc
+
+    def clear_cache(self):
+        """Drop all loaded indexes; they are reloaded from disk on next use"""
+        with self._lock:
+            self._cache.clear()
+
+    def _remember(self, doc: IndexedDocument):
+        self._cache[doc.document_id] = doc
+        self._cache.move_to_end(doc.document_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def save(self, content_hash: str, chunks: List[str], pages: List[int], embeddings: np.ndarray,
+             document_name: str, document_type: Optional[str] = None, page_count: int = 0) -> IndexedDocument:
+        """Persist a new document index and register it; idempotent per content hash"""
+        # Outside self._lock: checking may load or re-embed the existing index
+        existing = self.get_by_hash(content_hash)
+        if existing is not None:
+            return existing
+        with self._lock:
+            # A stale index for this content is rebuilt under its existing ids
+            document_id = self._hashes.get(content_hash)
+            if document_id is None:
+                document_id = self._new_local_id()
+            db_id = next((db_id for db_id, owner in self._db_ids.items() if owner == content_hash), None)
+
+            info = {
+                "document_id": document_id,
+                "content_hash": content_hash,
+                "document_name": document_name,
+                "document_type": document_type,
+                "pages": page_count or (max(pages) if pages else 0),
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            }
+            if db_id is not None:
+                info["db_document_id"] = db_id
+            doc = self._write(document_id, content_hash, chunks, pages, embeddings, info)
+            if self.register_in_db and db_id is None:
+                future = _registry().submit(self._register, content_hash, document_name, document_type)
+                self._registrations.add(future)
+                future.add_done_callback(self._registrations.discard)
+            return doc
+
+    def _register(self, content_hash: str, document_name: str, document_type: Optional[str]):
+        """Record a saved document in policy_documents and remember its database id"""
+        db_id = register_document(document_name, document_type, self._dir(content_hash), content_hash)
+        if db_id is None:
+            return
+        with self._lock:
+            document_id = self._hashes.get(content_hash)
+            if document_id is None:
+                return  # evicted in the meantime
+            info_path = os.path.join(self._dir(content_hash), "document.json")
+            with open(info_path, "r") as f:
+                info = json.load(f)
+            info["db_document_id"] = db_id
+            with open(info_path + ".tmp", "w") as f:
+                json.dump(info, f, indent=2)
+            os.replace(info_path + ".tmp", info_path)
+            self._db_ids[db_id] = content_hash
+            doc = self._cache.get(document_id)
+            if doc is not None:
+                doc.info["db_document_id"] = db_id
+
+    def wait_for_registrations(self, timeout: Optional[float] = None) -> bool:
+        """Wait for background database registrations; False if some are still running after `timeout`"""
+        _, pending = wait(list(self._registrations), timeout=timeout)
+        return not pending
+
+    def _write(self, document_id: int, content_hash: str, chunks: List[str], pages: List[int],
+               embeddings: np.ndarray, info: Dict) -> IndexedDocument:
+        directory = self._dir(content_hash)
+        tmp_directory = directory + ".tmp"
+        shutil.rmtree(tmp_directory, ignore_errors=True)
+        os.makedirs(tmp_directory)
+
+        embeddings = np.asarray(embeddings, dtype="float32")
+        store = FAISSVectorStore(
+            dim=embeddings.shape[1] if len(embeddings) else self.dim,
+            index_path=os.path.join(tmp_directory, "index.faiss"),
+            metadata_path=os.path.join(tmp_directory, "metadata.pkl"),
+            index_type=self.index_type,
+            pq_m=self.pq_m,
+            pq_bits=self.pq_bits,
+            mmap=self.mmap,
+            manifest=self.manifest,
+        )
+        if len(embeddings) < store.min_training_size:
+            # Too few chunks to train a product quantizer; fp16 needs no training
+            store.index_type = "fp16"
+            store.index = store._new_index()
+        store.add_embeddings([{"text": chunk, "embedding": embedding}
+                              for chunk, embedding in zip(chunks, embeddings)])
+        with open(os.path.join(tmp_directory, "pages.json"), "w") as f:
+            json.dump(pages, f)
+
+        info = dict(info, dim=store.dim, index_type=store.index_type, chunks=len(chunks),
+                    model=self.manifest.model if self.manifest is not None else None)
+        info["index_version"] = index_version(store, chunks)
+        with open(os.path.join(tmp_directory, "document.json"), "w") as f:
+            json.dump(info, f, indent=2)
+
+        # Publish atomically so a crash never leaves a half-written index
+        shutil.rmtree(directory, ignore_errors=True)
+        os.replace(tmp_directory, directory)
+        store.index_path = os.path.join(directory, "index.faiss")
+        store.metadata_path = os.path.join(directory, "metadata.pkl")
+
+        self._ids[document_id] = content_hash
+        self._hashes[content_hash] = document_id
+        self._versions[content_hash] = info["index_version"]
+        doc = IndexedDocument(document_id, content_hash, info, store, pages)
+        if store.index_type == "flat":
+            doc._embeddings = embeddings
+        self._remember(doc)
+        self._disk[content_hash] = _dir_bytes(directory)
+        self._disk.move_to_end(content_hash)
+        self._evict(keep=content_hash)
+        return doc
+
+
+def _dir_bytes(directory: str) -> int:
+    total = 0
+    for entry in os.scandir(directory):
+        if entry.is_file():
+            total += entry.stat().st_size
+    return total
+
+
+_db_disabled = False
+_registry_pool: Optional[ThreadPoolExecutor] = None
+_registry_lock = threading.Lock()
+
+
+def _registry() -> ThreadPoolExecutor:
+    """Single background thread for policy_documents registration"""
+    global _registry_pool
+    with _registry_lock:
+        if _registry_pool is None:
+            _registry_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="document-registry")
+        return _registry_pool
+
+
+def register_document(document_name: str, document_type: Optional[str], index_dir: str,
+                      content_hash: str) -> Optional[int]:
+    """
+    Register a document in policy_documents; its chunks stay in the index
+    at index_dir (file_path), out of policy_clauses. Returns the
+    policy_documents.id, or None when the database is unavailable (after the
+    first failure it is not retried).
+    """
+    global _db_disabled
+    if _db_disabled:
+        return None
+    try:
+        import psycopg2
+        from config import DATABASE_URL
+        conn = psycopg2.connect(DATABASE_URL, connect_timeout=3)
+    except Exception as e:
+        logger.warning(f"Document registry database unavailable, using local ids: {e}")
+        _db_disabled = True
+        return None
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            INSERT INTO policy_documents (document_name, document_type, file_path, version, content_hash)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (content_hash) DO UPDATE SET file_path = EXCLUDED.file_path
+            RETURNING id
+        """, (document_name, document_type, index_dir, content_hash[:20], content_hash))
+        document_id = cursor.fetchone()[0]
+        conn.commit()
+        return document_id
+    except Exception as e:
+        conn.rollback()
+        logger.warning(f"Failed to register document in database, using local id: {e}")
+        return None
+    finally:
+        cursor.close()
+        conn.close()
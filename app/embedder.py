@@ -1,22 +1,127 @@
-from sentence_transformers import SentenceTransformer
+import logging
 import numpy as np
+import threading
+import time
 from typing import List
+from app import memory, profiling
+from app.embedding_server import EmbeddingClient, EmbeddingServerError
+from config import EMBEDDING_SERVER_SOCKET, EMBEDDING_SERVER_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+# After the embedding server fails, the local model is used this long before trying it again
+SERVER_RETRY_SECONDS = 60
 
 
 class Embedder:
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2", batch_size: int = 32,
+                 torch_threads: int = 0, idle_unload_seconds: int = 0, normalize: bool = False,
+                 server: str = EMBEDDING_SERVER_SOCKET):
+        """
+        torch_threads: cap on torch intra-op threads (0 = torch default)
+        idle_unload_seconds: free the model after this long without use (0 = keep loaded)
+        normalize: L2-normalize embeddings
+        server: Unix socket of a shared embedding server running the same model; the
+            model is then only loaded here while the server is unreachable ("" = always load here)
+        """
         self.model_name = model_name
+        self.batch_size = batch_size
+        self.normalize = normalize
+        self.torch_threads = torch_threads
+        self.idle_unload_seconds = idle_unload_seconds
         self._model = None  # Lazy loading
+        self._dimension = None
+        self._lock = threading.Lock()
+        self._active = 0
+        self._last_used = time.monotonic()
+        self._reaper = None
+        self._client = EmbeddingClient(server, timeout=EMBEDDING_SERVER_TIMEOUT) if server else None
+        self._server_retry_at = 0.0
 
     @property
     def model(self):
         """Lazy load the model only when needed"""
         if self._model is None:
-            self._model = SentenceTransformer(self.model_name)
+            with self._lock:
+                if self._model is None:
+                    # Imported here so processes served by an embedding server never load torch
+                    from sentence_transformers import SentenceTransformer
+                    if self.torch_threads > 0:
+                        import torch
+                        torch.set_num_threads(self.torch_threads)
+                    self._model = SentenceTransformer(self.model_name)
+                    self._start_reaper()
         return self._model
 
+    @property
+    def dimension(self) -> int:
+        """Embedding dimension, read from the model once"""
+        if self._dimension is None and self._use_server():
+            try:
+                info = self._client.info()
+                if info["model"] != self.model_name:
+                    raise EmbeddingServerError(f"server runs {info['model']}, not {self.model_name}")
+                self._dimension = info["dimension"]
+            except (EmbeddingServerError, EOFError, OSError) as e:
+                self._server_failed(e)
+        if self._dimension is None:
+            self._dimension = self.model.get_sentence_embedding_dimension()
+        return self._dimension
+
+    @property
+    def normalization(self) -> str:
+        return "l2" if self.normalize else "none"
+
+    def _use_server(self) -> bool:
+        return self._client is not None and time.monotonic() >= self._server_retry_at
+
+    def _server_failed(self, error: Exception):
+        logger.warning(f"Embedding server at {self._client.socket_path} unavailable ({error}); "
+                       f"using a local model for {SERVER_RETRY_SECONDS}s")
+        self._server_retry_at = time.monotonic() + SERVER_RETRY_SECONDS
+
+    def _start_reaper(self):
+        if self.idle_unload_seconds <= 0 or (self._reaper is not None and self._reaper.is_alive()):
+            return
+        self._reaper = threading.Thread(target=self._reap_idle, name="embedder-reaper", daemon=True)
+        self._reaper.start()
+
+    def _reap_idle(self):
+        interval = min(30.0, self.idle_unload_seconds / 4)
+        while self._model is not None:
+            time.sleep(interval)
+            if time.monotonic() - self._last_used >= self.idle_unload_seconds:
+                self.unload()
+
+    def unload(self) -> bool:
+        """Free the model unless an encode is running; it reloads on next use"""
+        with self._lock:
+            if self._model is None or self._active:
+                return False
+            self._model = None
+        memory.trim_heap()
+        return True
+
     def get_embeddings(self, chunks: List[str]) -> List[np.ndarray]:
-        return self.model.encode(chunks, show_progress_bar=False, convert_to_numpy=True)
+        profiling.append("embed_batch_sizes", len(chunks))
+        if self._use_server():
+            try:
+                return self._client.embed(chunks, self.model_name, self.normalize)
+            except (EmbeddingServerError, EOFError, OSError) as e:
+                self._server_failed(e)
+        with self._lock:
+            self._active += 1
+        try:
+            return self.model.encode(chunks, batch_size=memory.guard.batch_size(self.batch_size),
+                                     normalize_embeddings=self.normalize,
+                                     show_progress_bar=False, convert_to_numpy=True)
+        finally:
+            with self._lock:
+                self._active -= 1
+                self._last_used = time.monotonic()
+
+    def get_embedding(self, text: str) -> np.ndarray:
+        return self.get_embeddings([text])[0]
 
     def embed_and_pack(self, chunks: List[str]) -> List[dict]:
         embeddings = self.get_embeddings(chunks)
@@ -0,0 +1,240 @@
+import json
+import logging
+import os
+import threading
+from multiprocessing import resource_tracker, shared_memory
+from multiprocessing.connection import Client, Listener
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingServerError(Exception):
+    """The embedding server answered with an error (e.g. it serves another model)"""
+
+
+def _send(conn, message: Dict):
+    # Requests and headers are JSON, so neither side unpickles what the other sends
+    conn.send_bytes(json.dumps(message).encode("utf-8"))
+
+
+def _receive(conn) -> Dict:
+    return json.loads(conn.recv_bytes().decode("utf-8"))
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before Python 3.13 attaching registers the segment with this process's resource
+        # tracker, which would unlink it again at exit; the server owns it
+        segment = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(segment._name, "shared_memory")
+        return segment
+
+
+class EmbeddingServer:
+    """
+    One embedding model shared by every process on the machine, served over
+    a Unix domain socket (scripts/run_embedding_server.py).
+
+    Each client connection gets a thread; at most `concurrency` encodes run
+    at once. Results under shm_min_bytes are sent inline on the socket;
+    larger matrices are written to a shared memory segment that the client
+    copies out and releases, after which the server unlinks it.
+    """
+
+    def __init__(self, embedder, socket_path: str, shm_min_bytes: int = 65536, concurrency: int = 1):
+        """embedder: a local Embedder; clients ask for normalization per request, so it should not normalize"""
+        self.embedder = embedder
+        self.socket_path = socket_path
+        self.shm_min_bytes = shm_min_bytes
+        self._slots = threading.Semaphore(max(1, concurrency))
+        self._listener = None
+
+    def _listen(self) -> Listener:
+        if os.path.exists(self.socket_path):
+            try:
+                Client(self.socket_path, family="AF_UNIX").close()
+            except OSError:
+                # Left behind by a server that did not shut down cleanly
+                os.unlink(self.socket_path)
+            else:
+                raise RuntimeError(f"An embedding server is already listening on {self.socket_path}")
+        directory = os.path.dirname(self.socket_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Only processes of this user may connect
+        umask = os.umask(0o177)
+        try:
+            return Listener(self.socket_path, family="AF_UNIX")
+        finally:
+            os.umask(umask)
+
+    def serve_forever(self):
+        self._listener = self._listen()
+        try:
+            while self._listener is not None:
+                try:
+                    conn = self._listener.accept()
+                except OSError:
+                    continue
+                threading.Thread(target=self._serve, args=(conn,), name="embedding-client", daemon=True).start()
+        finally:
+            self.close()
+
+    def close(self):
+        listener, self._listener = self._listener, None
+        if listener is not None:
+            # Also removes the socket file
+            listener.close()
+
+    def _serve(self, conn):
+        with conn:
+            while True:
+                try:
+                    request = _receive(conn)
+                except (EOFError, OSError):
+                    return
+                try:
+                    self._handle(conn, request)
+                except (EOFError, OSError):
+                    return
+                except Exception as e:
+                    logger.warning(f"Embedding request failed: {type(e).__name__}: {e}")
+                    try:
+                        _send(conn, {"status": "error", "error": f"{type(e).__name__}: {e}"})
+                    except OSError:
+                        return
+
+    def _handle(self, conn, request: Dict):
+        op = request.get("op")
+        if op == "info":
+            _send(conn, {"status": "ok", "model": self.embedder.model_name, "dimension": self.embedder.dimension})
+            return
+        if op != "embed":
+            raise ValueError(f"Unknown operation: {op}")
+        if request.get("model") != self.embedder.model_name:
+            raise ValueError(f"This server runs {self.embedder.model_name}, not {request.get('model')}")
+
+        if not request["texts"]:
+            vectors = np.zeros((0, self.embedder.dimension), dtype="float32")
+        else:
+            with self._slots:
+                vectors = np.asarray(self.embedder.get_embeddings(request["texts"]), dtype="float32")
+        if request.get("normalize"):
+            # Same as normalize_embeddings=True in SentenceTransformer.encode
+            vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        vectors = np.ascontiguousarray(vectors)
+        header = {"status": "ok", "shape": list(vectors.shape), "dtype": vectors.dtype.str}
+        segment = None
+        if vectors.nbytes >= max(1, self.shm_min_bytes):
+            try:
+                segment = shared_memory.SharedMemory(create=True, size=vectors.nbytes)
+            except OSError as e:
+                logger.warning(f"No shared memory for a {vectors.nbytes} byte result ({e}); sending it inline")
+        if segment is None:
+            _send(conn, header)
+            conn.send_bytes(vectors.tobytes())
+            return
+
+        try:
+            view = np.ndarray(vectors.shape, dtype=vectors.dtype, buffer=segment.buf)
+            view[:] = vectors
+            del view
+            _send(conn, {**header, "shm": segment.name})
+            # The client has copied the result once it says so (or hung up)
+            try:
+                conn.recv_bytes()
+            except EOFError:
+                pass
+        finally:
+            segment.close()
+            segment.unlink()
+
+
+class EmbeddingClient:
+    """
+    Client of an EmbeddingServer. Connections are pooled, one request at a
+    time each, so threads of one process embed concurrently.
+    """
+
+    def __init__(self, socket_path: str, timeout: float = 120.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._idle: List = []
+        self._lock = threading.Lock()
+
+    def _connect(self) -> Tuple[object, bool]:
+        """A connection and whether it came from the pool"""
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+        return Client(self.socket_path, family="AF_UNIX"), False
+
+    def _release(self, conn):
+        with self._lock:
+            self._idle.append(conn)
+
+    def _reply(self, conn) -> Dict:
+        if not conn.poll(self.timeout):
+            raise TimeoutError(f"Embedding server at {self.socket_path} did not answer within {self.timeout:.0f}s")
+        reply = _receive(conn)
+        if reply.get("status") != "ok":
+            raise EmbeddingServerError(reply.get("error", "unknown error"))
+        return reply
+
+    def _call(self, message: Dict, read: Callable):
+        for attempt in range(2):
+            conn, pooled = self._connect()
+            try:
+                _send(conn, message)
+                result = read(conn, self._reply(conn))
+            except EmbeddingServerError:
+                # The exchange completed; the connection is still usable
+                self._release(conn)
+                raise
+            except TimeoutError:
+                conn.close()
+                raise
+            except (EOFError, OSError):
+                conn.close()
+                if pooled and attempt == 0:
+                    # The server restarted since the pooled connections were opened
+                    self.close()
+                    continue
+                raise
+            except BaseException:
+                conn.close()
+                raise
+            self._release(conn)
+            return result
+
+    def info(self) -> Dict:
+        """{"model", "dimension"} of the served model"""
+        return self._call({"op": "info"}, lambda conn, reply: reply)
+
+    def embed(self, texts: List[str], model: str, normalize: bool) -> np.ndarray:
+        message = {"op": "embed", "texts": list(texts), "model": model, "normalize": normalize}
+        return self._call(message, self._read_vectors)
+
+    @staticmethod
+    def _read_vectors(conn, reply: Dict) -> np.ndarray:
+        shape, dtype = tuple(reply["shape"]), np.dtype(reply["dtype"])
+        if not reply.get("shm"):
+            return np.frombuffer(conn.recv_bytes(), dtype=dtype).reshape(shape).copy()
+        segment = _attach(reply["shm"])
+        try:
+            vectors = np.ndarray(shape, dtype=dtype, buffer=segment.buf).copy()
+        finally:
+            segment.close()
+            _send(conn, {"op": "release"})
+        return vectors
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
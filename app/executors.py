@@ -0,0 +1,165 @@
+import asyncio
+import contextvars
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app import memory, metrics, profiling
+from app.document_processor import DocumentProcessor
+from config import (
+    CPU_THREAD_WORKERS, EXTRACTION_PROCESSES, STAGE_CONCURRENCY, STAGE_QUEUE_LIMIT,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class StageQueueFull(Exception):
+    """Raised when a stage already has its maximum number of waiting jobs"""
+
+    def __init__(self, stage: str):
+        super().__init__(f"Too many pending '{stage}' jobs, try again shortly")
+        self.stage = stage
+
+
+class StageExecutor:
+    """
+    Runs blocking work for one pipeline stage on a shared pool, with an explicit
+    concurrency limit and a bounded wait queue so the event loop never blocks and
+    overload fails fast instead of piling up.
+    """
+
+    def __init__(self, name: str, pool: Executor, max_concurrency: int, max_queue: int,
+                 in_process: bool = True):
+        self.name = name
+        self.pool = pool
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max_queue
+        self.in_process = in_process
+        self._waiting = 0
+        self._semaphores: Dict[int, asyncio.Semaphore] = {}
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        # Semaphores are bound to an event loop; keep one per running loop
+        loop = asyncio.get_running_loop()
+        sem = self._semaphores.get(id(loop))
+        if sem is None:
+            sem = self._semaphores[id(loop)] = asyncio.Semaphore(self.max_concurrency)
+        return sem
+
+    async def run(self, fn: Callable, *args):
+        sem = self._semaphore()
+        if sem.locked() and self._waiting >= self.max_queue:
+            raise StageQueueFull(self.name)
+
+        self._waiting += 1
+        metrics.QUEUE_DEPTH.inc(stage=self.name)
+        try:
+            await sem.acquire()
+        finally:
+            self._waiting -= 1
+            metrics.QUEUE_DEPTH.dec(stage=self.name)
+
+        try:
+            loop = asyncio.get_running_loop()
+            if not self.in_process:
+                return await loop.run_in_executor(self.pool, fn, *args)
+            ctx = contextvars.copy_context()
+            return await loop.run_in_executor(self.pool, ctx.run, _traced_call, fn, args)
+        finally:
+            sem.release()
+
+
+def _traced_call(fn: Callable, args: Tuple):
+    """Run fn in a worker thread, attaching it to the active request profile if any"""
+    trace = profiling.current_trace()
+    if trace is not None:
+        trace.attach_current_thread()
+    try:
+        return fn(*args)
+    finally:
+        if trace is not None:
+            trace.detach_current_thread()
+
+
+def _extract_in_worker(method: str, file_path: str, max_pages: int,
+                       stop: Optional[int] = None) -> Tuple[object, Dict]:
+    """Process-pool entry point: run a DocumentProcessor extraction method, return result and annotations"""
+    trace = profiling.RequestTrace("worker", sampling=False)
+    with profiling.tracing(trace):
+        result = getattr(DocumentProcessor(), method)(file_path, max_pages, stop)
+    return result, trace.annotations
+
+
+_lock = threading.Lock()
+_thread_pool: Optional[ThreadPoolExecutor] = None
+_process_pool: Optional[ProcessPoolExecutor] = None
+_executors: Dict[str, StageExecutor] = {}
+
+
+def get_executor(stage: str) -> StageExecutor:
+    """Return the executor for a stage, creating the shared pools on first use"""
+    global _thread_pool, _process_pool
+    executor = _executors.get(stage)
+    if executor is not None:
+        return executor
+
+    with _lock:
+        if stage in _executors:
+            return _executors[stage]
+        if _thread_pool is None:
+            _thread_pool = ThreadPoolExecutor(max_workers=CPU_THREAD_WORKERS,
+                                              thread_name_prefix="pipeline")
+        concurrency = STAGE_CONCURRENCY.get(stage, CPU_THREAD_WORKERS)
+        if stage == "extraction" and EXTRACTION_PROCESSES > 0:
+            if _process_pool is None:
+                # spawn avoids forking a process that already holds torch/FAISS threads
+                _process_pool = ProcessPoolExecutor(max_workers=EXTRACTION_PROCESSES,
+                                                    mp_context=multiprocessing.get_context("spawn"))
+            executor = StageExecutor(stage, _process_pool, min(concurrency, EXTRACTION_PROCESSES),
+                                     STAGE_QUEUE_LIMIT, in_process=False)
+        else:
+            executor = StageExecutor(stage, _thread_pool, concurrency, STAGE_QUEUE_LIMIT)
+        _executors[stage] = executor
+        return executor
+
+
+async def run(stage: str, fn: Callable, *args):
+    """Run a blocking callable on the bounded executor for `stage`"""
+    return await get_executor(stage).run(fn, *args)
+
+
+async def _extract(document_processor: DocumentProcessor, method: str, file_path: str,
+                   stop: Optional[int] = None):
+    executor = get_executor("extraction")
+    # Lower page ceiling while the process is close to its memory budget
+    max_pages = memory.guard.page_limit(document_processor.max_pages)
+    if executor.in_process:
+        return await executor.run(getattr(document_processor, method), file_path, max_pages, stop)
+    result, annotations = await executor.run(_extract_in_worker, method, file_path, max_pages, stop)
+    profiling.annotate(**annotations)
+    return result
+
+
+async def extract_text(document_processor: DocumentProcessor, file_path: str, stop: Optional[int] = None) -> str:
+    """Extract document text on the extraction executor (process pool when enabled)"""
+    return await _extract(document_processor, "extract_text", file_path, stop)
+
+
+async def extract_pages(document_processor: DocumentProcessor, file_path: str,
+                        stop: Optional[int] = None) -> List[str]:
+    """Extract text per page (the first `stop` pages) on the extraction executor"""
+    return await _extract(document_processor, "extract_pages", file_path, stop)
+
+
+def shutdown():
+    global _thread_pool, _process_pool
+    with _lock:
+        _executors.clear()
+        if _thread_pool is not None:
+            _thread_pool.shutdown(wait=False, cancel_futures=True)
+            _thread_pool = None
+        if _process_pool is not None:
+            _process_pool.shutdown(wait=False, cancel_futures=True)
+            _process_pool = None
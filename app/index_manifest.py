@@ -0,0 +1,93 @@
+import hashlib
+import json
+import os
+import time
+from typing import Dict, List, Optional
+
+MANIFEST_VERSION = 1
+
+
+def text_hash(text: str) -> str:
+    """Content hash of one clause, used to find which clauses need re-embedding"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def manifest_path(index_path: str) -> str:
+    return os.path.splitext(index_path)[0] + ".manifest.json"
+
+
+class IndexManifest:
+    """
+    Record of how an index was built: embedding model, dimension,
+    normalization, projection and chunker settings, plus a content hash per
+    stored row. Stored as JSON next to the index file.
+    """
+
+    def __init__(self, model: str, dim: int, normalization: str = "none", chunker: Optional[Dict] = None,
+                 projection: Optional[str] = None, clause_hashes: Optional[List[str]] = None,
+                 created_at: Optional[str] = None):
+        self.model = model
+        self.dim = dim
+        self.normalization = normalization
+        self.chunker = chunker
+        self.projection = projection
+        self.clause_hashes = list(clause_hashes or [])
+        self.created_at = created_at or time.strftime("%Y-%m-%dT%H:%M:%S")
+
+    def settings(self) -> "IndexManifest":
+        """Copy with the build settings only (no per-row hashes)"""
+        return IndexManifest(self.model, self.dim, self.normalization, self.chunker, self.projection)
+
+    def incompatibilities(self, built: "IndexManifest") -> List[str]:
+        """Reasons vectors in an index built as `built` cannot be mixed with ones embedded as self"""
+        problems = []
+        if built.model != self.model:
+            problems.append(f"model {built.model} != {self.model}")
+        if built.dim != self.dim:
+            problems.append(f"dim {built.dim} != {self.dim}")
+        if built.normalization != self.normalization:
+            problems.append(f"normalization {built.normalization} != {self.normalization}")
+        if built.projection != self.projection:
+            problems.append(f"projection {built.projection} != {self.projection}")
+        if self.chunker is not None and built.chunker is not None and built.chunker != self.chunker:
+            problems.append(f"chunker {built.chunker} != {self.chunker}")
+        return problems
+
+    def to_dict(self) -> Dict:
+        return {
+            "version": MANIFEST_VERSION,
+            "model": self.model,
+            "dim": self.dim,
+            "normalization": self.normalization,
+            "chunker": self.chunker,
+            "projection": self.projection,
+            "created_at": self.created_at,
+            "updated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "clauses": len(self.clause_hashes),
+            "clause_hashes": self.clause_hashes,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "IndexManifest":
+        return cls(
+            model=data["model"],
+            dim=data["dim"],
+            normalization=data.get("normalization", "none"),
+            chunker=data.get("chunker"),
+            projection=data.get("projection"),
+            clause_hashes=data.get("clause_hashes"),
+            created_at=data.get("created_at"),
+        )
+
+    @classmethod
+    def load(cls, path: str) -> Optional["IndexManifest"]:
+        """Read a manifest, or None for indexes built before manifests existed"""
+        if not os.path.exists(path):
+            return None
+        with open(path, "r") as f:
+            return cls.from_dict(json.load(f))
+
+    def save(self, path: str):
+        with open(path + ".tmp", "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        os.replace(path + ".tmp", path)
@@ -0,0 +1,118 @@
+import ctypes
+import ctypes.util
+import gc
+import logging
+import threading
+from typing import Callable, List
+
+from app import metrics
+from config import MEMORY_SOFT_LIMIT_MB, MEMORY_DEGRADE_RATIO
+
+logger = logging.getLogger(__name__)
+
+OK, DEGRADED, CRITICAL = "ok", "degraded", "critical"
+
+MEMORY_PRESSURE = metrics.REGISTRY.register(metrics.Gauge(
+    "bajaj_memory_pressure", "Memory pressure level (0 ok, 1 degraded, 2 critical)"))
+
+
+class MemoryPressure(Exception):
+    """Raised when RSS stays above the soft budget even after releasing caches"""
+
+    def __init__(self, rss_mb: float, limit_mb: int):
+        super().__init__(f"Server memory is at {rss_mb:.0f}MB of a {limit_mb}MB budget, retry shortly")
+        self.rss_mb = rss_mb
+        self.limit_mb = limit_mb
+
+
+def _load_libc():
+    try:
+        return ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6")
+    except OSError:
+        return None
+
+
+_libc = _load_libc()
+
+
+def trim_heap():
+    """Return freed heap pages to the OS (glibc only; a no-op elsewhere)"""
+    gc.collect()
+    if _libc is not None and hasattr(_libc, "malloc_trim"):
+        _libc.malloc_trim(0)
+
+
+class MemoryGuard:
+    """
+    Soft RSS budget for a memory-capped instance. Between degrade_ratio and the
+    limit, requests run with smaller page and batch limits; above the limit,
+    registered caches are dropped and, if that is not enough, new heavy
+    requests are refused instead of letting the kernel OOM-kill the process.
+    """
+
+    def __init__(self, soft_limit_mb: int, degrade_ratio: float = 0.85):
+        self.soft_limit_mb = soft_limit_mb
+        self.degrade_ratio = degrade_ratio
+        self._reliefs: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.soft_limit_mb > 0
+
+    def rss_mb(self) -> float:
+        return metrics.current_rss_bytes() / (1024 * 1024)
+
+    def level(self) -> str:
+        if not self.enabled:
+            return OK
+        rss = self.rss_mb()
+        if rss >= self.soft_limit_mb:
+            level = CRITICAL
+        elif rss >= self.soft_limit_mb * self.degrade_ratio:
+            level = DEGRADED
+        else:
+            level = OK
+        MEMORY_PRESSURE.set((OK, DEGRADED, CRITICAL).index(level))
+        return level
+
+    def register_relief(self, fn: Callable[[], None]):
+        """Register a callback that frees memory (drop a cache, unload an idle model)"""
+        self._reliefs.append(fn)
+
+    def relieve(self):
+        with self._lock:
+            for fn in self._reliefs:
+                try:
+                    fn()
+                except Exception as e:
+                    logger.warning(f"Memory relief callback failed: {e}")
+            trim_heap()
+
+    def check(self):
+        """Admission check for heavy requests; raises MemoryPressure when over budget"""
+        if self.level() != CRITICAL:
+            return
+        before = self.rss_mb()
+        self.relieve()
+        after = self.rss_mb()
+        logger.warning(f"RSS over soft limit: {before:.0f}MB -> {after:.0f}MB after releasing caches")
+        if self.level() == CRITICAL:
+            raise MemoryPressure(after, self.soft_limit_mb)
+
+    def page_limit(self, max_pages: int) -> int:
+        """Page ceiling for the next document; halved under pressure (0 = no limit)"""
+        if self.level() == OK:
+            return max_pages
+        return max(1, max_pages // 2) if max_pages else 0
+
+    def batch_size(self, batch_size: int) -> int:
+        """Encode batch size; shrunk under pressure to cap activation memory"""
+        if self.level() == OK:
+            return batch_size
+        return max(1, batch_size // 4)
+
+
+guard = MemoryGuard(MEMORY_SOFT_LIMIT_MB, MEMORY_DEGRADE_RATIO)
+
+metrics.REGISTRY.add_collector(guard.level)
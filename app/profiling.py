@@ -0,0 +1,178 @@
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("request_trace", default=None)
+
+
+class StackSampler(threading.Thread):
+    """
+    Minimal sampling profiler: periodically captures the Python stacks of the
+    threads attached to one request and counts identical (collapsed) stacks.
+    """
+
+    def __init__(self, interval: float = 0.005, max_depth: int = 64):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.max_depth = max_depth
+        self.thread_ids = set()
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def attach(self, thread_id: int):
+        self.thread_ids.add(thread_id)
+
+    def detach(self, thread_id: int):
+        self.thread_ids.discard(thread_id)
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id in list(self.thread_ids):
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+                self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join(timeout=1)
+
+
+class RequestTrace:
+    """Stage timings and annotations for a single request, optionally with a sampling profile"""
+
+    def __init__(self, endpoint: str, sample_interval: float = 0.005, sampling: bool = True):
+        self.profile_id = uuid.uuid4().hex
+        self.endpoint = endpoint
+        self.started = time.time()
+        self.events: List[Dict] = []
+        self.annotations: Dict = {}
+        self._lock = threading.Lock()
+        self.sampler = StackSampler(sample_interval) if sampling else None
+
+    def start(self):
+        if self.sampler:
+            self.sampler.attach(threading.get_ident())
+            self.sampler.start()
+
+    def stop(self):
+        if self.sampler:
+            self.sampler.stop()
+
+    def attach_current_thread(self):
+        """Include the calling (worker) thread in the sampling profile"""
+        if self.sampler:
+            self.sampler.attach(threading.get_ident())
+
+    def detach_current_thread(self):
+        if self.sampler:
+            self.sampler.detach(threading.get_ident())
+
+    def record(self, stage: str, seconds: float, **attrs):
+        event = {"stage": stage, "ms": round(seconds * 1000, 3),
+                 "at_ms": round((time.time() - self.started) * 1000 - seconds * 1000, 3)}
+        event.update(attrs)
+        with self._lock:
+            self.events.append(event)
+
+    def annotate(self, **values):
+        with self._lock:
+            self.annotations.update(values)
+
+    def append(self, key: str, value):
+        with self._lock:
+            self.annotations.setdefault(key, []).append(value)
+
+    def stage_totals(self) -> Dict[str, float]:
+        totals: Dict[str, float] = {}
+        for event in self.events:
+            totals[event["stage"]] = round(totals.get(event["stage"], 0.0) + event["ms"], 3)
+        return totals
+
+    def to_dict(self, top_stacks: int = 20) -> Dict:
+        result = {
+            "profile_id": self.profile_id,
+            "endpoint": self.endpoint,
+            "total_ms": round((time.time() - self.started) * 1000, 3),
+            "stage_totals_ms": self.stage_totals(),
+            "annotations": self.annotations,
+            "events": self.events,
+        }
+        if self.sampler:
+            result["profile"] = {
+                "samples": self.sampler.samples,
+                "interval_ms": self.sampler.interval * 1000,
+                "top_stacks": [{"stack": stack, "samples": count}
+                               for stack, count in self.sampler.stacks.most_common(top_stacks)],
+            }
+        return result
+
+    def save(self, directory: str) -> str:
+        """Write the full trace, including all collapsed stacks, to <directory>/<profile_id>.json"""
+        os.makedirs(directory, exist_ok=True)
+        data = self.to_dict(top_stacks=0)
+        if self.sampler:
+            # Collapsed-stack format, loadable by flamegraph.pl / speedscope
+            data["profile"]["collapsed"] = [f"{stack} {count}" for stack, count in self.sampler.stacks.items()]
+            data["profile"].pop("top_stacks", None)
+        path = os.path.join(directory, f"{self.profile_id}.json")
+        with open(path, "w") as f:
+            json.dump(data, f, indent=2, default=str)
+        return path
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def tracing(trace: Optional[RequestTrace]):
+    """Make `trace` the active trace for the enclosed block (no-op when None)"""
+    if trace is None:
+        yield None
+        return
+    token = _current_trace.set(trace)
+    trace.start()
+    try:
+        yield trace
+    finally:
+        trace.stop()
+        _current_trace.reset(token)
+
+
+def annotate(**values):
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.annotate(**values)
+
+
+def append(key: str, value):
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.append(key, value)
+
+
+def load_profile(directory: str, profile_id: str) -> Optional[Dict]:
+    # Profile ids are uuid4 hex, reject anything else to avoid path traversal
+    if len(profile_id) != 32 or not all(c in "0123456789abcdef" for c in profile_id):
+        return None
+    path = os.path.join(directory, f"{profile_id}.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
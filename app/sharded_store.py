@@ -0,0 +1,490 @@
+import heapq
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.index_manifest import IndexManifest
+from app.vector_store import FILTER_FIELDS, FAISSVectorStore, EmbeddingProjection
+
+logger = logging.getLogger(__name__)
+
+PARTITIONS = ("hash", "policy_type", "document")
+LAYOUT_FILE = "shards.json"
+
+
+def partition_key(item: Dict, partition: str) -> str:
+    """Partition value of one clause ({"text", "embedding", "policy_type", "document_id"})"""
+    if partition == "policy_type":
+        return str(item.get("policy_type") or "unknown")
+    if partition == "document":
+        return str(item.get("document_id") or item.get("document") or "unknown")
+    return str(zlib.crc32(item["text"].encode("utf-8")))
+
+
+def assign_shards(sizes: Dict[str, int], shards: int, partition: str) -> Dict[str, int]:
+    """
+    Map partition values to shards. Hash keys spread uniformly; named
+    partitions are packed largest-first onto the least loaded shard so that
+    shard sizes stay balanced when the corpus is rebuilt.
+    """
+    if partition == "hash":
+        return {key: int(key) % shards for key in sizes}
+    loads = [(0, shard) for shard in range(shards)]
+    heapq.heapify(loads)
+    assignment = {}
+    for key in sorted(sizes, key=lambda key: (-sizes[key], key)):
+        load, shard = heapq.heappop(loads)
+        assignment[key] = shard
+        heapq.heappush(loads, (load + sizes[key], shard))
+    return assignment
+
+
+def _shard_item(item: Dict) -> Dict:
+    """What a shard stores for one clause: text, embedding, id and filter fields"""
+    fields = {field: item[field] for field in FILTER_FIELDS if field in item}
+    if item.get("id"):
+        fields["id"] = item["id"]
+    return {"text": item["text"], "embedding": item["embedding"], **fields}
+
+
+def _open_store(settings: Dict) -> FAISSVectorStore:
+    settings = dict(settings)
+    projection_path = settings.pop("projection_path", None)
+    manifest = settings.pop("manifest", None)
+    return FAISSVectorStore(
+        projection=EmbeddingProjection.load(projection_path) if projection_path else None,
+        manifest=IndexManifest.from_dict(manifest) if manifest else None,
+        **settings,
+    )
+
+
+def _handle(state: Dict, op: str, args: tuple):
+    """One shard operation; shared by shard processes and in-process shards"""
+    if op == "load":
+        store = state["store"] = _open_store(args[0])
+        store.load_index()
+        return store.ntotal
+    if op == "build":
+        settings, items = args
+        store = _open_store(settings)
+        if store.min_training_size > max(1, len(items)):
+            # Too few clauses on this shard to train a quantizer; fp16 needs no training
+            store.index_type = "fp16"
+            store.index = store._new_index()
+        if items:
+            store.add_embeddings(items)
+        else:
+            store._save_index()
+        state["store"] = store
+        return {"vectors": store.ntotal, "index_type": store.index_type}
+    store = state["store"]
+    if op == "search":
+        queries, top_k, filters = args
+        return store.search_many(queries, top_k, filters) if store.ntotal else [[] for _ in queries]
+    if op == "add":
+        store.add_embeddings(args[0])
+        return store.ntotal
+    if op == "remove":
+        return store.remove(args[0]), store.ntotal
+    if op == "upsert":
+        ids, embeddings, metadata, drop_ids = args
+        # Ids routed to another shard by this upsert leave this one
+        moved = store.remove(drop_ids)
+        return store.upsert(ids, embeddings, metadata), moved, store.ntotal
+    if op == "update_attributes":
+        return store.update_attributes(args[0])
+    if op == "stats":
+        return {"vectors": store.ntotal, "bytes": store.memory_bytes()}
+    raise ValueError(f"Unknown shard operation: {op}")
+
+
+def _shard_worker(conn):
+    """Shard process main loop: one request at a time over a pipe"""
+    state = {}
+    while True:
+        try:
+            op, args = conn.recv()
+        except EOFError:
+            return
+        if op == "close":
+            if "store" in state:
+                state["store"].wait_for_compaction()
+            return
+        try:
+            conn.send(("ok", _handle(state, op, args)))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+class LocalShard:
+    """A shard searched on a thread of this process"""
+
+    def __init__(self, settings: Dict):
+        self.settings = settings
+        self._state = {}
+        self._lock = threading.Lock()
+
+    def call(self, op: str, *args):
+        with self._lock:
+            return _handle(self._state, op, args)
+
+    def close(self):
+        with self._lock:
+            if "store" in self._state:
+                self._state["store"].wait_for_compaction()
+            self._state.clear()
+
+
+class ProcessShard:
+    """
+    A shard owned by a local worker process, so its index memory and search
+    CPU are separate from the API process. A crashed worker is restarted and
+    reloaded on the next call.
+    """
+
+    def __init__(self, settings: Dict):
+        self.settings = settings
+        self._lock = threading.Lock()
+        self._process = None
+        self._conn = None
+
+    def _start(self):
+        # spawn avoids forking a process that already holds torch/FAISS threads
+        ctx = multiprocessing.get_context("spawn")
+        self._conn, child = ctx.Pipe()
+        self._process = ctx.Process(target=_shard_worker, args=(child,), daemon=True, name="vector-shard")
+        self._process.start()
+        child.close()
+
+    def _request(self, op: str, args: tuple):
+        self._conn.send((op, args))
+        status, result = self._conn.recv()
+        if status == "error":
+            raise RuntimeError(f"Shard {self.settings['index_path']}: {result}")
+        return result
+
+    def call(self, op: str, *args):
+        with self._lock:
+            if self._process is None or not self._process.is_alive():
+                if self._process is not None:
+                    logger.warning(f"Shard worker for {self.settings['index_path']} died, restarting")
+                self._start()
+                if op not in ("load", "build"):
+                    self._request("load", (self.settings,))
+            try:
+                return self._request(op, args)
+            except (EOFError, BrokenPipeError, ConnectionResetError):
+                self._process = None
+                raise RuntimeError(f"Shard worker for {self.settings['index_path']} exited")
+
+    def close(self):
+        with self._lock:
+            if self._process is not None and self._process.is_alive():
+                try:
+                    self._conn.send(("close", ()))
+                except (BrokenPipeError, OSError):
+                    pass
+                self._process.join(timeout=5)
+                if self._process.is_alive():
+                    self._process.terminate()
+            self._process = None
+
+
+class ShardedVectorStore:
+    """
+    Clause index split across shards that are searched in parallel; the
+    coordinator merges each shard's top-k into the global top-k. Searches
+    return the same (text, L2 distance) results as FAISSVectorStore.
+
+    Layout under `root`: shards.json names the current generation directory
+    and which partition values live on which shard; each shard is a normal
+    FAISSVectorStore in gen-<n>/shard-<i>/. rebuild() writes a new
+    generation with freshly balanced shards and switches to it atomically.
+
+    Shards run in local worker processes by default; ProcessShard is the
+    only part that knows how a shard is reached, so remote shards can
+    implement the same call() interface.
+    """
+
+    def __init__(self, dim: int, root: str, shards: int = 2, partition: str = "hash", index_type: str = "flat",
+                 pq_m: int = 16, pq_bits: int = 8, mmap: bool = False, projection_path: Optional[str] = None,
+                 manifest: Optional[IndexManifest] = None, processes: bool = True):
+        if partition not in PARTITIONS:
+            raise ValueError(f"Unsupported partition: {partition}. Use one of {', '.join(PARTITIONS)}")
+        self.dim = dim
+        self.root = root
+        self.shard_count = max(1, shards)
+        self.partition = partition
+        self.index_type = index_type
+        self.pq_m = pq_m
+        self.pq_bits = pq_bits
+        self.mmap = mmap
+        self.projection_path = projection_path
+        self.manifest = manifest.settings() if manifest is not None else None
+        self.processes = processes
+        self.layout: Dict = {"generation": 0, "partition": partition, "shards": [], "assignment": {}}
+        self._shards: List = []
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.RLock()
+        # Guards swapping the serving generation (layout, shards, pool) without waiting for
+        # self._lock, which a rebuild holds while it builds; also counts scatters per pool so a
+        # replaced pool is shut down only once none are running on it
+        self._generation = threading.Condition()
+        self._in_flight: Dict[ThreadPoolExecutor, int] = {}
+        os.makedirs(root, exist_ok=True)
+
+    def _settings(self, generation: int, shard: int, index_type: Optional[str] = None) -> Dict:
+        directory = os.path.join(self.root, f"gen-{generation}", f"shard-{shard}")
+        os.makedirs(directory, exist_ok=True)
+        return {
+            "dim": self.dim,
+            "index_path": os.path.join(directory, "index.faiss"),
+            "metadata_path": os.path.join(directory, "metadata.pkl"),
+            "index_type": index_type or self.index_type,
+            "pq_m": self.pq_m,
+            "pq_bits": self.pq_bits,
+            "mmap": self.mmap,
+            "projection_path": self.projection_path,
+            "manifest": self.manifest.to_dict() if self.manifest is not None else None,
+        }
+
+    def _new_shards(self, settings: List[Dict]) -> Tuple[list, ThreadPoolExecutor]:
+        shard_class = ProcessShard if self.processes else LocalShard
+        shards = [shard_class(shard_settings) for shard_settings in settings]
+        return shards, ThreadPoolExecutor(max_workers=max(1, len(shards)), thread_name_prefix="shard")
+
+    def _swap_shards(self, shards: list, pool: Optional[ThreadPoolExecutor], layout: Optional[Dict] = None):
+        # Searches already scattered to the old shards finish before those shards close
+        with self._generation:
+            old_shards, old_pool = self._shards, self._pool
+            self._shards, self._pool = shards, pool
+            if layout is not None:
+                self.layout = layout
+                self.shard_count = len(shards)
+            if old_pool is not None:
+                self._generation.wait_for(lambda: old_pool not in self._in_flight)
+        if old_pool is not None:
+            old_pool.shutdown(wait=True)
+        for shard in old_shards:
+            shard.close()
+
+    def _scatter(self, op: str, *args, matching: Optional[Dict] = None) -> list:
+        """Run op on every shard of the current generation (that can hold matches for `matching`)"""
+        with self._generation:
+            shards, pool = self._shards, self._pool
+            only = self._shards_for(matching)
+            if pool is None or only == []:
+                return []
+            if only is not None:
+                shards = [shards[i] for i in only]
+            self._in_flight[pool] = self._in_flight.get(pool, 0) + 1
+        try:
+            return list(pool.map(lambda shard: shard.call(op, *args), shards))
+        finally:
+            with self._generation:
+                self._in_flight[pool] -= 1
+                if not self._in_flight[pool]:
+                    del self._in_flight[pool]
+                    self._generation.notify_all()
+
+    def _shards_for(self, filters: Optional[Dict]) -> Optional[List[int]]:
+        """Shards that can hold matches, when a policy_type filter rules some out"""
+        if self.partition != "policy_type" or not filters or "policy_type" not in filters:
+            return None
+        wanted = filters["policy_type"]
+        if not isinstance(wanted, (list, tuple, set, frozenset)):
+            wanted = [wanted]
+        assignment = self.layout.get("assignment", {})
+        return sorted({assignment[str(value or "unknown")] for value in wanted
+                       if str(value or "unknown") in assignment})
+
+    def _save_layout(self, layout: Dict):
+        layout_path = os.path.join(self.root, LAYOUT_FILE)
+        with open(layout_path + ".tmp", "w") as f:
+            json.dump(layout, f, indent=2)
+        os.replace(layout_path + ".tmp", layout_path)
+
+    def load_index(self):
+        with self._lock:
+            layout_path = os.path.join(self.root, LAYOUT_FILE)
+            if not os.path.exists(layout_path):
+                print(f"No shard layout at {layout_path}. Starting with empty shards.")
+                self.rebuild([])
+                return
+            with open(layout_path, "r") as f:
+                layout = json.load(f)
+            if layout.get("partition") != self.partition:
+                print(f"Shards at {self.root} are partitioned by {layout.get('partition')}, not {self.partition}; "
+                      f"rebuild them to change partitioning.")
+            shards, pool = self._new_shards([self._settings(layout["generation"], i, shard["index_type"])
+                                             for i, shard in enumerate(layout["shards"])])
+            counts = list(pool.map(lambda shard: shard.call("load", shard.settings), shards))
+            for shard, count in zip(layout["shards"], counts):
+                shard["vectors"] = count
+            self._swap_shards(shards, pool, layout)
+
+    def rebuild(self, embedding_data: List[dict], shards: Optional[int] = None) -> List[Dict]:
+        """
+        Repartition the whole corpus into `shards` (default: the configured
+        count) balanced shards, built in parallel, then switch to them.
+        Items are {"text", "embedding"} plus "policy_type"/"document_id" for
+        those partitionings. Returns per-shard {"vectors", "index_type"}.
+        """
+        with self._lock:
+            count = max(1, shards or self.shard_count)
+            keys = [partition_key(item, self.partition) for item in embedding_data]
+            sizes: Dict[str, int] = {}
+            for key in keys:
+                sizes[key] = sizes.get(key, 0) + 1
+            assignment = assign_shards(sizes, count, self.partition)
+            buckets: List[List[dict]] = [[] for _ in range(count)]
+            for key, item in zip(keys, embedding_data):
+                buckets[assignment[key]].append(_shard_item(item))
+
+            previous = self.layout.get("generation", 0)
+            generation = previous + 1
+            # The new generation is built alongside the one still serving searches
+            settings = [self._settings(generation, i) for i in range(count)]
+            shards, pool = self._new_shards(settings)
+            try:
+                built = list(pool.map(lambda job: job[0].call("build", job[1], job[2]),
+                                      zip(shards, settings, buckets)))
+            except Exception:
+                for shard in shards:
+                    shard.close()
+                pool.shutdown(wait=False)
+                shutil.rmtree(os.path.join(self.root, f"gen-{generation}"), ignore_errors=True)
+                raise
+            for i, shard in enumerate(shards):
+                shard.settings = self._settings(generation, i, built[i]["index_type"])
+
+            layout = {
+                "generation": generation,
+                "partition": self.partition,
+                "shards": built,
+                # Hash keys are recomputed from the text; only named partitions need recording
+                "assignment": assignment if self.partition != "hash" else {},
+            }
+            self._save_layout(layout)
+            self._swap_shards(shards, pool, layout)
+
+            # Older generations are no longer referenced
+            for entry in os.listdir(self.root):
+                if entry.startswith("gen-") and entry != f"gen-{generation}":
+                    shutil.rmtree(os.path.join(self.root, entry), ignore_errors=True)
+            return built
+
+    def _route(self, item: Dict) -> int:
+        """Shard of one clause (new partition values go to the smallest shard)"""
+        key = partition_key(item, self.partition)
+        if self.partition == "hash":
+            return int(key) % len(self._shards)
+        assignment = self.layout.setdefault("assignment", {})
+        if key not in assignment:
+            sizes = [shard["vectors"] for shard in self.layout["shards"]]
+            assignment[key] = int(np.argmin(sizes))
+        return assignment[key]
+
+    def add_embeddings(self, embedding_data: List[dict]):
+        """Route new clauses to their shards (new partition values go to the smallest shard)"""
+        with self._lock:
+            if not self._shards:
+                self.load_index()
+            buckets: List[List[dict]] = [[] for _ in self._shards]
+            for item in embedding_data:
+                buckets[self._route(item)].append(_shard_item(item))
+            for i, (shard, bucket) in enumerate(zip(self._shards, buckets)):
+                if bucket:
+                    self.layout["shards"][i]["vectors"] = shard.call("add", bucket)
+            self._save_layout(self.layout)
+
+    def remove(self, ids: List[str]) -> int:
+        """FAISSVectorStore.remove on every shard; returns clauses removed"""
+        with self._lock:
+            if not self._shards:
+                self.load_index()
+            results = self._scatter("remove", list(ids))
+            for shard, (_, count) in zip(self.layout["shards"], results):
+                shard["vectors"] = count
+            self._save_layout(self.layout)
+            return sum(removed for removed, _ in results)
+
+    def upsert(self, ids: List[str], embeddings: np.ndarray, metadata: List[dict]) -> Dict[str, int]:
+        """
+        FAISSVectorStore.upsert routed like add_embeddings(). An id is removed
+        from every other shard, so a clause whose partition value changed moves
+        to its new shard.
+        """
+        stats = {"inserted": 0, "replaced": 0, "unchanged": 0}
+        if not len(ids):
+            return stats
+        with self._lock:
+            if not self._shards:
+                self.load_index()
+            embeddings = np.asarray(embeddings, dtype="float32").reshape(len(ids), -1)
+            buckets: List[List[int]] = [[] for _ in self._shards]
+            for i, item in enumerate(metadata):
+                buckets[self._route(item)].append(i)
+            for i, (shard, bucket) in enumerate(zip(self._shards, buckets)):
+                drop_ids = [ids[k] for j, other in enumerate(buckets) if j != i for k in other]
+                shard_stats, moved, count = shard.call("upsert", [ids[k] for k in bucket], embeddings[bucket],
+                                                       [metadata[k] for k in bucket], drop_ids)
+                self.layout["shards"][i]["vectors"] = count
+                for key, value in shard_stats.items():
+                    stats[key] += value
+                # A clause that left this shard was inserted into its new one: count it as replaced
+                stats["inserted"] -= moved
+                stats["replaced"] += moved
+            self._save_layout(self.layout)
+            return stats
+
+    def search(self, query_embedding: np.ndarray, top_k: int = 5,
+               filters: Optional[Dict] = None) -> List[Tuple[str, float]]:
+        return self.search_many(np.array([query_embedding]), top_k, filters)[0]
+
+    def search_many(self, query_embeddings: np.ndarray, top_k: int = 5,
+                    filters: Optional[Dict] = None) -> List[List[Tuple[str, float]]]:
+        """
+        Scatter the queries to every shard, gather each shard's top-k and merge
+        by distance. Each shard applies `filters` inside its own search; with
+        policy_type partitioning, shards holding none of the wanted policy
+        types are not queried at all.
+        """
+        query_embeddings = np.asarray(query_embeddings, dtype="float32")
+        per_shard = self._scatter("search", query_embeddings, top_k, filters, matching=filters)
+        if not per_shard:
+            # No shard to ask (none loaded, closed, or filtered out)
+            return [[] for _ in query_embeddings]
+        return [heapq.nsmallest(top_k, (hit for shard_hits in hits for hit in shard_hits), key=lambda hit: hit[1])
+                for hits in zip(*per_shard)]
+
+    def update_attributes(self, updates: Dict[str, Dict]) -> int:
+        """FAISSVectorStore.update_attributes on every shard; returns rows changed"""
+        if self.partition == "policy_type" and any("policy_type" in fields for fields in updates.values()):
+            # A clause's shard follows its policy_type; moving it between shards needs a rebuild
+            logger.warning("policy_type changes are ignored on policy_type shards; rebuild them to apply")
+            updates = {digest: {field: value for field, value in fields.items() if field != "policy_type"}
+                       for digest, fields in updates.items()}
+        return sum(self._scatter("update_attributes", updates))
+
+    @property
+    def ntotal(self) -> int:
+        return sum(shard.get("vectors", 0) for shard in self.layout.get("shards", []))
+
+    def stats(self) -> List[Dict]:
+        return self._scatter("stats")
+
+    def memory_bytes(self) -> int:
+        return sum(shard["bytes"] for shard in self.stats())
+
+    def close(self):
+        with self._lock:
+            self._swap_shards([], None)
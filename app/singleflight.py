@@ -0,0 +1,150 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Hashable, List, Tuple
+
+from app import metrics
+
+logger = logging.getLogger(__name__)
+
+SINGLEFLIGHT_CALLS = metrics.REGISTRY.register(metrics.Counter(
+    "bajaj_singleflight_calls_total",
+    "Calls by flight and role (leader computed, coalesced waited on a leader's in-flight work)",
+    ("flight", "role")))
+SINGLEFLIGHT_RETRIES = metrics.REGISTRY.register(metrics.Counter(
+    "bajaj_singleflight_retries_total", "Coalesced calls recomputed after their leader was cancelled",
+    ("flight",)))
+
+
+class _Flight:
+    def __init__(self, task: asyncio.Future):
+        self.task = task
+        self.waiters = 0
+        self.owner_cancelled = False
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent async calls with the same key: the first caller
+    starts the work as a task and later callers await that same task instead
+    of repeating it. Nothing is cached once the work finishes, and errors
+    reach every waiter without being remembered for later calls.
+
+    The task outlives a cancelled caller as long as someone else is still
+    waiting; it is cancelled when its last waiter goes away.
+
+    The work runs in the leader's context (contextvars such as the request
+    deadline), so the key must cover whatever in that context changes the
+    result.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._flights: Dict[Tuple[int, Hashable], _Flight] = {}
+
+    def _key(self, key: Hashable) -> Tuple[int, Hashable]:
+        # Tasks belong to one event loop; never share them across loops
+        return id(asyncio.get_running_loop()), key
+
+    def _join(self, key: Hashable):
+        flight = self._flights.get(self._key(key))
+        if flight is not None:
+            SINGLEFLIGHT_CALLS.inc(flight=self.name, role="coalesced")
+        return flight
+
+    def _start(self, key: Hashable, awaitable: Awaitable) -> _Flight:
+        full_key = self._key(key)
+        flight = _Flight(asyncio.ensure_future(awaitable))
+        self._flights[full_key] = flight
+
+        def finished(task):
+            if self._flights.get(full_key) is flight:
+                del self._flights[full_key]
+            if not task.cancelled():
+                task.exception()  # retrieved here in case every waiter was cancelled
+
+        flight.task.add_done_callback(finished)
+        SINGLEFLIGHT_CALLS.inc(flight=self.name, role="leader")
+        return flight
+
+    def _abandon(self, flight: _Flight):
+        for full_key, current in list(self._flights.items()):
+            if current is flight:
+                del self._flights[full_key]
+        flight.task.cancel()
+
+    async def _wait(self, flight: _Flight, owner: bool):
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.task.done():
+                raise
+            # This caller was cancelled; the work carries on for anyone still waiting
+            if owner:
+                flight.owner_cancelled = True
+            if flight.waiters == 1:
+                self._abandon(flight)
+            raise
+        finally:
+            flight.waiters -= 1
+
+    async def run(self, key: Hashable, fn: Callable[[], Awaitable]):
+        """Result of fn(), shared with concurrent calls for the same key"""
+        flight = self._join(key)
+        owner = flight is None
+        if owner:
+            flight = self._start(key, fn())
+        try:
+            return await self._wait(flight, owner)
+        except Exception:
+            # Work started by a caller that went away may depend on its resources (e.g. a temp file)
+            if owner or not flight.owner_cancelled:
+                raise
+            SINGLEFLIGHT_RETRIES.inc(flight=self.name)
+            logger.info(f"Recomputing '{self.name}' work abandoned by a cancelled caller")
+            return await self.run(key, fn)
+
+    async def run_many(self, keys: List[Hashable], fn: Callable[[List[Hashable]], Awaitable[List]]) -> List:
+        """
+        Batch variant: keys already in flight are awaited, the remaining ones are
+        computed by a single fn(remaining_keys) call that returns results in order.
+        Duplicate keys in `keys` are computed once. The batch is cancelled once
+        every key it computes has been abandoned.
+        """
+        flights = {}
+        lead = []
+        for key in dict.fromkeys(keys):
+            flight = self._join(key)
+            if flight is None:
+                lead.append(key)
+            else:
+                flights[key] = flight
+
+        if lead:
+            batch = asyncio.ensure_future(fn(lead))
+            batch.add_done_callback(lambda task: task.cancelled() or task.exception())
+            for i, key in enumerate(lead):
+                flights[key] = self._start(key, _pick(batch, i))
+            _cancel_when_abandoned(batch, [flights[key].task for key in lead])
+
+        results = await asyncio.gather(*(self._wait(flights[key], key in lead) for key in dict.fromkeys(keys)))
+        by_key = dict(zip(dict.fromkeys(keys), results))
+        return [by_key[key] for key in keys]
+
+
+def _cancel_when_abandoned(batch: asyncio.Future, picks: List[asyncio.Future]):
+    """Cancel `batch` when all of its picks end before it does, i.e. were all cancelled"""
+    pending = [len(picks)]
+
+    def pick_done(_):
+        pending[0] -= 1
+        if not pending[0] and not batch.done():
+            batch.cancel()
+
+    for pick in picks:
+        pick.add_done_callback(pick_done)
+
+
+async def _pick(batch: asyncio.Future, i: int):
+    # Shielded so one abandoned key does not cancel the batch for the others
+    return (await asyncio.shield(batch))[i]
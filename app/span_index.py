@@ -0,0 +1,150 @@
+import math
+import re
+import threading
+from collections import Counter, OrderedDict
+from typing import List, Tuple
+
+import numpy as np
+
+from app import metrics
+from app.clause_extractor import segment
+from app.index_manifest import text_hash
+
+
+def top_chunks(chunk_embeddings: np.ndarray, question_embeddings: np.ndarray, count: int) -> List[List[int]]:
+    """Indexes of the `count` most similar chunks (cosine) for each question, best first"""
+    chunks = np.asarray(chunk_embeddings, dtype="float32")
+    questions = np.asarray(question_embeddings, dtype="float32")
+    chunks = chunks / np.maximum(np.linalg.norm(chunks, axis=1, keepdims=True), 1e-12)
+    questions = questions / np.maximum(np.linalg.norm(questions, axis=1, keepdims=True), 1e-12)
+    scores = questions @ chunks.T
+    count = min(count, scores.shape[1])
+    nearest = np.argpartition(-scores, count - 1, axis=1)[:, :count]
+    order = np.argsort(-np.take_along_axis(scores, nearest, axis=1), axis=1)
+    return np.take_along_axis(nearest, order, axis=1).tolist()
+
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def _terms(text: str) -> set:
+    return {word for word in _WORD.findall(text.lower()) if len(word) > 2}
+
+
+def lexical_top_chunks(chunks: List[str], questions: List[str], count: int) -> List[List[int]]:
+    """
+    Same as top_chunks() without embeddings: chunks ranked by the summed IDF
+    weights of the question terms they contain. Used when there is no time
+    left to embed the questions.
+    """
+    chunk_terms = [_terms(chunk) for chunk in chunks]
+    frequency = Counter(term for terms in chunk_terms for term in terms)
+    count = min(count, len(chunks))
+    ranked = []
+    for question in questions:
+        weights = {term: math.log((1 + len(chunks)) / (1 + frequency[term])) + 1
+                   for term in _terms(question)}
+        scores = [sum(weight for term, weight in weights.items() if term in terms) for terms in chunk_terms]
+        ranked.append(sorted(range(len(chunks)), key=lambda i: -scores[i])[:count])
+    return ranked
+
+
+class SentenceSpanIndex:
+    """
+    Second-level index over retrieved chunks: the sentence segmentation and
+    sentence embeddings of each chunk, computed the first time the chunk is
+    retrieved and cached by chunk content hash, so every later question on
+    the same document (or any document sharing the chunk) reuses them.
+
+    best_spans() scores the sentences of each question's top chunks with one
+    matrix product and returns the best sentence, plus an adjacent one when
+    it scores nearly as well.
+    """
+
+    def __init__(self, embedder, max_chunks: int = 5000, min_words: int = 4):
+        self.embedder = embedder
+        self.max_chunks = max_chunks
+        self.min_words = min_words
+        # chunk hash -> (sentences, L2-normalised float16 sentence embeddings)
+        self._chunks: "OrderedDict[str, Tuple[List[str], np.ndarray]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._chunks)
+
+    def clear(self):
+        with self._lock:
+            self._chunks.clear()
+
+    def sentences(self, chunk: str) -> List[str]:
+        """Sentences of a chunk; a chunk without usable sentence breaks is one sentence"""
+        sentences = [' '.join(chunk[start:end].split()) for start, end in segment(chunk)]
+        sentences = [sentence for sentence in sentences if len(sentence.split()) >= self.min_words]
+        return sentences or [' '.join(chunk.split())]
+
+    def _entries(self, chunks: List[str]) -> List[Tuple[List[str], np.ndarray]]:
+        """Cached entries for the chunks; sentences of all missing chunks are embedded in one call"""
+        keys = [text_hash(chunk) for chunk in chunks]
+        with self._lock:
+            found = {key: self._chunks[key] for key in keys if key in self._chunks}
+            for key in found:
+                self._chunks.move_to_end(key)
+        missing = {key: chunk for key, chunk in zip(keys, chunks) if key not in found}
+        metrics.CACHE_REQUESTS.inc(len(keys) - len(missing), cache="sentence_spans", result="hit")
+
+        if missing:
+            metrics.CACHE_REQUESTS.inc(len(missing), cache="sentence_spans", result="miss")
+            split = {key: self.sentences(chunk) for key, chunk in missing.items()}
+            flat = [sentence for sentences in split.values() for sentence in sentences]
+            vectors = np.asarray(self.embedder.get_embeddings(flat), dtype="float32")
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+            offset = 0
+            with self._lock:
+                for key, sentences in split.items():
+                    entry = (sentences, vectors[offset:offset + len(sentences)].astype(np.float16))
+                    offset += len(sentences)
+                    found[key] = self._chunks[key] = entry
+                while len(self._chunks) > self.max_chunks:
+                    self._chunks.popitem(last=False)
+        return [found[key] for key in keys]
+
+    def best_spans(self, question_embeddings: np.ndarray, candidates: List[List[str]],
+                   max_sentences: int = 2, margin: float = 0.9) -> List[str]:
+        """
+        For each question, the best-matching span among the sentences of its
+        candidate chunks. A neighbouring sentence of the same chunk is appended
+        (in document order) when it scores at least `margin` of the best one.
+        """
+        unique = list(dict.fromkeys(chunk for chunks in candidates for chunk in chunks))
+        entries = self._entries(unique)
+        position = {chunk: i for i, chunk in enumerate(unique)}
+
+        # One sentence matrix for every candidate chunk of every question
+        owners = np.concatenate([np.full(len(sentences), i) for i, (sentences, _) in enumerate(entries)])
+        starts = np.cumsum([0] + [len(sentences) for sentences, _ in entries])
+        matrix = np.vstack([vectors for _, vectors in entries]).astype("float32")
+        questions = np.asarray(question_embeddings, dtype="float32")
+        questions = questions / np.maximum(np.linalg.norm(questions, axis=1, keepdims=True), 1e-12)
+        scores = questions @ matrix.T
+
+        allowed = np.zeros(scores.shape, dtype=bool)
+        for q, chunks in enumerate(candidates):
+            allowed[q] = np.isin(owners, [position[chunk] for chunk in chunks])
+        scores = np.where(allowed, scores, -np.inf)
+
+        spans = []
+        for q, best in enumerate(np.argmax(scores, axis=1)):
+            owner = owners[best]
+            sentences = entries[owner][0]
+            local = best - starts[owner]
+            chosen = [local]
+            while len(chosen) < max_sentences and scores[q, best] > 0:
+                neighbours = [i for i in (min(chosen) - 1, max(chosen) + 1) if 0 <= i < len(sentences)]
+                if not neighbours:
+                    break
+                neighbour = max(neighbours, key=lambda i: scores[q, starts[owner] + i])
+                if scores[q, starts[owner] + neighbour] < margin * scores[q, best]:
+                    break
+                chosen.append(neighbour)
+            spans.append(' '.join(sentences[i] for i in sorted(chosen)))
+        return spans
@@ -1,48 +1,916 @@
-import faiss
+import hashlib
 import numpy as np
+import os
 import pickle
-from typing import List, Tuple
+import threading
+from collections.abc import Sequence
+from typing import Callable, Dict, List, Optional, Tuple
+from app.index_manifest import IndexManifest, manifest_path, text_hash
+from app.lazy_import import LazyModule
+
+# Imported on first use, so importing the API does not load FAISS
+faiss = LazyModule("faiss")
+
+# Supported index layouts, from exact to most compressed
+INDEX_TYPES = ("flat", "fp16", "sq8", "pq", "opq")
+
+# Clause fields that searches can be filtered on
+FILTER_FIELDS = ("clause_type", "policy_type", "section", "is_active")
+
+
+def mmap_flag() -> int:
+    """read_index flag that maps vector codes from disk instead of reading them into memory"""
+    return getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+
+
+class MappedTexts(Sequence):
+    """Read-only list of strings backed by a memory-mapped UTF-8 blob and an offsets array"""
+
+    def __init__(self, path: str):
+        self._offsets = np.load(path + ".offsets.npy", mmap_mode="r")
+        size = int(self._offsets[-1])
+        self._blob = np.memmap(path + ".blob", dtype=np.uint8, mode="r") if size else np.empty(0, np.uint8)
+
+    @staticmethod
+    def write(path: str, texts: List[str]):
+        encoded = [text.encode("utf-8") for text in texts]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        with open(path + ".blob.tmp", "wb") as f:
+            for b in encoded:
+                f.write(b)
+        with open(path + ".offsets.tmp", "wb") as f:
+            np.save(f, offsets)
+        os.replace(path + ".blob.tmp", path + ".blob")
+        os.replace(path + ".offsets.tmp", path + ".offsets.npy")
+
+    @staticmethod
+    def is_current(path: str) -> bool:
+        """True if the mapped copy exists and is not older than the pickle it mirrors"""
+        try:
+            return os.path.getmtime(path + ".offsets.npy") >= os.path.getmtime(path)
+        except OSError:
+            return False
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return bytes(self._blob[self._offsets[i]:self._offsets[i + 1]]).decode("utf-8")
+
+
+class ClauseAttributes:
+    """
+    Per-row clause fields used to filter searches, stored column-wise as small
+    integer codes next to the metadata file. One bitset per (field, value) is
+    built whenever the columns change, so a filter resolves to a row bitmap
+    with a few vectorised ORs/ANDs instead of a pass over the rows.
+    """
+
+    # Rows indexed without a value count as active; other fields are None
+    DEFAULTS = {"clause_type": None, "policy_type": None, "section": None, "is_active": True}
+
+    def __init__(self, values: Optional[Dict[str, list]] = None, codes: Optional[Dict[str, np.ndarray]] = None):
+        self.values = values or {field: [] for field in FILTER_FIELDS}
+        self.codes = codes or {field: np.empty(0, dtype=np.int32) for field in FILTER_FIELDS}
+        self._build_bitsets()
+
+    def __len__(self) -> int:
+        return len(self.codes[FILTER_FIELDS[0]])
+
+    @staticmethod
+    def path(metadata_path: str) -> str:
+        return metadata_path + ".attrs"
+
+    @classmethod
+    def defaults(cls, rows: int) -> "ClauseAttributes":
+        attributes = cls()
+        attributes.extend([{}] * rows)
+        return attributes
+
+    @classmethod
+    def load(cls, metadata_path: str, rows: int) -> "ClauseAttributes":
+        """Stored attributes, or defaults when there are none for these rows"""
+        try:
+            with open(cls.path(metadata_path), "rb") as f:
+                data = pickle.load(f)
+        except FileNotFoundError:
+            return cls.defaults(rows)
+        attributes = cls(data["values"], data["codes"])
+        if len(attributes) != rows:
+            print(f"Clause attributes for {metadata_path} are out of date. Using defaults.")
+            return cls.defaults(rows)
+        return attributes
+
+    def save(self, metadata_path: str):
+        path = self.path(metadata_path)
+        with open(path + ".tmp", "wb") as f:
+            pickle.dump({"values": self.values, "codes": self.codes}, f)
+        os.replace(path + ".tmp", path)
+
+    def _code(self, field: str, value) -> int:
+        values = self.values[field]
+        try:
+            return values.index(value)
+        except ValueError:
+            values.append(value)
+            return len(values) - 1
+
+    def _build_bitsets(self):
+        self._bitsets = {field: [self.codes[field] == code for code in range(len(self.values[field]))]
+                         for field in FILTER_FIELDS}
+
+    def extend(self, items: List[dict]):
+        """Append one row per item, taking each field from the item when present"""
+        for field in FILTER_FIELDS:
+            new_codes = [self._code(field, item.get(field, self.DEFAULTS[field])) for item in items]
+            self.codes[field] = np.concatenate([self.codes[field], np.asarray(new_codes, dtype=np.int32)])
+        self._build_bitsets()
+
+    def row(self, i: int) -> Dict:
+        return {field: self.values[field][self.codes[field][i]] for field in FILTER_FIELDS}
+
+    def set_rows(self, rows: Dict[int, Dict]):
+        """Overwrite fields of existing rows: {row: {field: value}}"""
+        for i, attributes in rows.items():
+            for field, value in attributes.items():
+                if field in FILTER_FIELDS:
+                    self.codes[field][i] = self._code(field, value)
+        self._build_bitsets()
+
+    def select(self, keep: np.ndarray) -> "ClauseAttributes":
+        """Attributes of the rows set in the boolean mask `keep`, in row order"""
+        return ClauseAttributes({field: list(values) for field, values in self.values.items()},
+                                {field: codes[keep] for field, codes in self.codes.items()})
+
+    def matching(self, filters: Dict) -> Optional[np.ndarray]:
+        """
+        Boolean row mask for {field: value or [values]} (values of one field are
+        OR-ed, fields AND-ed), or None when the filter excludes nothing.
+        """
+        mask = None
+        for field, wanted in filters.items():
+            if field not in FILTER_FIELDS:
+                raise ValueError(f"Unsupported filter field: {field}. Use one of {', '.join(FILTER_FIELDS)}")
+            if not isinstance(wanted, (list, tuple, set, frozenset)):
+                wanted = [wanted]
+            field_mask = np.zeros(len(self), dtype=bool)
+            for value in wanted:
+                if value in self.values[field]:
+                    field_mask |= self._bitsets[field][self.values[field].index(value)]
+            mask = field_mask if mask is None else mask & field_mask
+        if mask is None or mask.all():
+            return None
+        return mask
+
+
+class EmbeddingProjection:
+    """
+    PCA projection (optionally whitened) fitted on the clause corpus. Applied
+    to embeddings before they are indexed and to queries before search, so
+    the index stores and compares dim_out-dimensional vectors.
+    """
+
+    def __init__(self, transform):
+        self.transform = transform
+
+    @classmethod
+    def fit(cls, embeddings: np.ndarray, dim: int, whiten: bool = False) -> "EmbeddingProjection":
+        embeddings = np.ascontiguousarray(embeddings, dtype="float32")
+        if dim >= embeddings.shape[1]:
+            raise ValueError(f"Projection dim {dim} must be smaller than the embedding dim {embeddings.shape[1]}")
+        if len(embeddings) < dim:
+            raise ValueError(f"Need at least {dim} embeddings to fit a {dim}-d projection, got {len(embeddings)}")
+        # eigen_power -0.5 scales each component to unit variance (whitening)
+        transform = faiss.PCAMatrix(embeddings.shape[1], dim, -0.5 if whiten else 0.0)
+        transform.train(embeddings)
+        return cls(transform)
+
+    @classmethod
+    def load(cls, path: str) -> "EmbeddingProjection":
+        return cls(faiss.read_VectorTransform(path))
+
+    def save(self, path: str):
+        faiss.write_VectorTransform(self.transform, path + ".tmp")
+        os.replace(path + ".tmp", path)
+
+    @property
+    def fingerprint(self) -> str:
+        """Identifies the fitted projection in index manifests"""
+        digest = hashlib.sha256()
+        digest.update(faiss.vector_to_array(self.transform.A).tobytes())
+        digest.update(faiss.vector_to_array(self.transform.b).tobytes())
+        return f"pca{self.dim_out}-{digest.hexdigest()[:12]}"
+
+    @property
+    def dim_in(self) -> int:
+        return self.transform.d_in
+
+    @property
+    def dim_out(self) -> int:
+        return self.transform.d_out
+
+    def apply(self, embeddings: np.ndarray) -> np.ndarray:
+        return self.transform.apply(np.ascontiguousarray(embeddings, dtype="float32"))
+
+    def reverse(self, projected: np.ndarray) -> np.ndarray:
+        """Map projected vectors back to (an approximation in) the embedding space"""
+        return self.transform.reverse_transform(np.ascontiguousarray(projected, dtype="float32"))
 
 
 class FAISSVectorStore:
-    def __init__(self, dim: int, index_path: str = "vector_index.faiss", metadata_path: str = "metadata.pkl"):
+    """
+    Clause index: FAISS vectors plus, per row, the clause text, filter
+    fields, a stable id and a tombstone bit.
+
+    remove() and upsert() edit the index without rebuilding it: removed and
+    replaced rows are tombstoned (skipped inside every search) and new rows
+    are appended, and only the edit is written, to an append-only log next to
+    the index that load_index() replays. Once tombstones and logged rows pass
+    compact_ratio of the index, a background compaction drops the dead rows
+    and folds the log into fresh index files.
+    """
+
+    def __init__(self, dim: int, index_path: str = "vector_index.faiss", metadata_path: str = "metadata.pkl",
+                 index_type: str = "flat", pq_m: int = 16, pq_bits: int = 8, mmap: bool = False,
+                 projection: Optional[EmbeddingProjection] = None, manifest: Optional[IndexManifest] = None,
+                 compact_ratio: float = 0.2):
+        """
+        mmap: map the index codes and chunk texts from disk on load instead of
+            reading them into memory (pages are shared and reclaimable)
+        projection: reduce embeddings (dim) to projection.dim_out before indexing and search
+        manifest: how new embeddings are produced (model, normalization, ...); an
+            index on disk built differently is not loaded
+        compact_ratio: compact in the background once tombstoned plus logged rows
+            reach this share of the index (0 = only when compact() is called)
+
+        index_type:
+            flat - exact float32 (IndexFlatL2)
+            fp16 - float16 scalar quantizer, 2x smaller, near-exact
+            sq8  - 8-bit scalar quantizer, 4x smaller (trained)
+            pq   - product quantizer with pq_m sub-vectors of pq_bits each (trained)
+            opq  - rotation-optimised PQ, better recall than pq at the same size (trained)
+        """
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unsupported index_type: {index_type}. Use one of {', '.join(INDEX_TYPES)}")
+        if projection is not None and projection.dim_in != dim:
+            raise ValueError(f"Projection expects {projection.dim_in}-d embeddings, store has dim {dim}")
         self.dim = dim
+        self.projection = projection
+        if index_type in ("pq", "opq") and self.index_dim % pq_m != 0:
+            raise ValueError(f"pq_m={pq_m} must divide the index dimension {self.index_dim}")
         self.index_path = index_path
         self.metadata_path = metadata_path
-        self.index = faiss.IndexFlatL2(dim)
+        self.index_type = index_type
+        self.pq_m = pq_m
+        self.pq_bits = pq_bits
+        self.mmap = mmap
+        self.compact_ratio = compact_ratio
+        self._mapped = False
+        self.expected_manifest = manifest
+        self.manifest = manifest.settings() if manifest is not None else None
+        self.index = self._new_index()
         self.metadata = []
+        self.attributes = ClauseAttributes()
+        # Stable id and tombstone per row; _rows maps the id of each live row to it
+        self.ids: List[str] = []
+        self.deleted = np.zeros(0, dtype=bool)
+        self._rows: Dict[str, int] = {}
+        # Files on disk are one generation; log records of other generations are stale
+        self.generation = 0
+        self._base_saved = False
+        self._log_records = 0
+        self._logged_rows = 0
+        # Edits are serialised; searches only hold _swap_lock to take a consistent snapshot
+        self._write_lock = threading.RLock()
+        self._swap_lock = threading.Lock()
+        self._compaction: Optional[threading.Thread] = None
+
+    @property
+    def index_dim(self) -> int:
+        """Dimension of the vectors actually stored (after projection)"""
+        return self.projection.dim_out if self.projection is not None else self.dim
+
+    @property
+    def log_path(self) -> str:
+        return self.index_path + ".log"
+
+    @property
+    def ids_path(self) -> str:
+        return self.metadata_path + ".ids"
+
+    def _new_index(self):
+        dim = self.index_dim
+        if self.index_type == "fp16":
+            return faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_L2)
+        if self.index_type == "sq8":
+            return faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_L2)
+        if self.index_type == "pq":
+            return faiss.IndexPQ(dim, self.pq_m, self.pq_bits, faiss.METRIC_L2)
+        if self.index_type == "opq":
+            return faiss.index_factory(dim, f"OPQ{self.pq_m},PQ{self.pq_m}x{self.pq_bits}", faiss.METRIC_L2)
+        return faiss.IndexFlatL2(dim)
+
+    @property
+    def min_training_size(self) -> int:
+        """Vectors needed before a trained index can be built (PQ needs one per centroid)"""
+        if self.index_type == "opq":
+            # The OPQ rotation is fitted by SVD and needs at least dim samples
+            return max(2 ** self.pq_bits, self.index_dim)
+        if self.index_type == "pq":
+            return 2 ** self.pq_bits
+        return 1
+
+    def project(self, embeddings: np.ndarray) -> np.ndarray:
+        embeddings = np.ascontiguousarray(embeddings, dtype="float32")
+        return self.projection.apply(embeddings) if self.projection is not None else embeddings
+
+    def reconstruct_all(self) -> np.ndarray:
+        """All stored vectors, mapped back to the embedding space when projected"""
+        vectors = self.index.reconstruct_n(0, self.index.ntotal)
+        return self.projection.reverse(vectors) if self.projection is not None else vectors
+
+    def train(self, embeddings: np.ndarray, index=None):
+        """Train a quantized index (default: this store's) on already-projected vectors; no-op if trained"""
+        index = self.index if index is None else index
+        if index.is_trained:
+            return
+        embeddings = np.ascontiguousarray(embeddings, dtype="float32")
+        if len(embeddings) < self.min_training_size:
+            raise ValueError(
+                f"'{self.index_type}' index needs at least {self.min_training_size} vectors to train, "
+                f"got {len(embeddings)}. Lower pq_bits or use a flat/fp16 index."
+            )
+        index.train(embeddings)
+
+    def _own(self):
+        """Mapped indexes are read-only views; take an owned copy before growing them"""
+        if not self._mapped:
+            return
+        index = faiss.read_index(self.index_path)
+        with self._swap_lock:
+            self.index = index
+            self.metadata = list(self.metadata)
+            self._mapped = False
+
+    def _append(self, vectors: np.ndarray, items: List[dict]):
+        """Append already-projected vectors; items carry "text", an optional "id" and filter fields"""
+        ids = [item.get("id") or text_hash(item["text"]) for item in items]
+        start = self.index.ntotal
+        with self._swap_lock:
+            self.index.add(vectors)
+            self.metadata.extend([item["text"] for item in items])
+            self.attributes.extend(items)
+            self.ids.extend(ids)
+            self.deleted = np.concatenate([self.deleted, np.zeros(len(items), dtype=bool)])
+        for offset, clause_id in enumerate(ids):
+            self._rows[clause_id] = start + offset
+        if self.manifest is not None:
+            self.manifest.clause_hashes.extend(text_hash(item["text"]) for item in items)
 
     def add_embeddings(self, embedding_data: List[dict]):
+        """Append clauses ({"text", "embedding"}, optional "id" and filter fields) and save the index"""
         embeddings = np.array([item["embedding"] for item in embedding_data]).astype("float32")
-        self.index.add(embeddings)
-        self.metadata.extend([item["text"] for item in embedding_data])
-        self._save_index()
+        with self._write_lock:
+            self._own()
+            embeddings = self.project(embeddings)
+            self.train(embeddings)
+            self._append(embeddings, embedding_data)
+            self._save_index()
+
+    def _row_hashes(self) -> List[str]:
+        if self.manifest is not None and len(self.manifest.clause_hashes) == len(self.metadata):
+            return self.manifest.clause_hashes
+        return [text_hash(text) for text in self.metadata]
+
+    def live_ids(self) -> List[str]:
+        """Ids of the clauses that are not removed"""
+        return list(self._rows)
+
+    def _tombstone(self, rows: List[int]):
+        for row in rows:
+            if self._rows.get(self.ids[row]) == row:
+                del self._rows[self.ids[row]]
+        self.deleted[rows] = True
+
+    def _apply(self, op: str, payload: tuple):
+        """Apply one edit to the in-memory index; used by the edit methods and by log replay"""
+        if op == "remove":
+            self._tombstone(payload[0])
+        elif op == "upsert":
+            replaced, vectors, items, attribute_rows = payload
+            self._tombstone(replaced)
+            if len(items):
+                self._own()
+                self.train(vectors)
+                self._append(vectors, items)
+            if attribute_rows:
+                self.attributes.set_rows(attribute_rows)
+        elif op == "attributes":
+            self.attributes.set_rows(payload[0])
+        else:
+            raise ValueError(f"Unknown index edit: {op}")
+
+    def _persist(self, op: str, payload: tuple):
+        """Append an applied edit to the log (the whole index is written when none is on disk yet)"""
+        if not self._base_saved:
+            self._save_index()
+            return
+        with open(self.log_path, "ab") as f:
+            pickle.dump((self.generation, op, payload), f, protocol=pickle.HIGHEST_PROTOCOL)
+        self._log_records += 1
+        if op == "upsert":
+            self._logged_rows += len(payload[2])
+
+    def remove(self, ids: List[str]) -> int:
+        """
+        Remove clauses by id (unknown ids are ignored). Their rows are skipped
+        by searches at once and reclaimed by compaction. Returns rows removed.
+        """
+        with self._write_lock:
+            rows = sorted({self._rows[clause_id] for clause_id in ids if clause_id in self._rows})
+            if rows:
+                self._apply("remove", (rows,))
+                self._persist("remove", (rows,))
+        if rows:
+            self._maybe_compact()
+        return len(rows)
+
+    def upsert(self, ids: List[str], embeddings: np.ndarray, metadata: List[dict]) -> Dict[str, int]:
+        """
+        Insert or replace clauses by stable id. metadata: {"text", filter
+        fields...} per id. A replaced clause's old row is tombstoned and its new
+        vector appended; an id whose text is unchanged only gets its filter
+        fields updated. Returns {"inserted", "replaced", "unchanged"}.
+        """
+        if not len(ids):
+            return {"inserted": 0, "replaced": 0, "unchanged": 0}
+        vectors = self.project(np.asarray(embeddings, dtype="float32").reshape(len(ids), -1))
+        return self._upsert_projected(list(ids), vectors, metadata)
+
+    def _upsert_projected(self, ids: List[str], vectors: np.ndarray, metadata: List[dict]) -> Dict[str, int]:
+        stats = {"inserted": 0, "replaced": 0, "unchanged": 0}
+        # The last entry wins when an id is given twice
+        latest = {clause_id: i for i, clause_id in enumerate(ids)}
+        with self._write_lock:
+            hashes = self._row_hashes()
+            appended, replaced, attribute_rows = [], [], {}
+            for clause_id, i in latest.items():
+                row = self._rows.get(clause_id)
+                if row is not None and hashes[row] == text_hash(metadata[i]["text"]):
+                    current = self.attributes.row(row)
+                    fields = {field: metadata[i][field] for field in FILTER_FIELDS
+                              if field in metadata[i] and metadata[i][field] != current[field]}
+                    if fields:
+                        attribute_rows[row] = fields
+                    stats["unchanged"] += 1
+                    continue
+                if row is not None:
+                    replaced.append(row)
+                stats["replaced" if row is not None else "inserted"] += 1
+                appended.append(i)
+
+            if not appended and not attribute_rows:
+                return stats
+            items = [{**{field: metadata[i][field] for field in FILTER_FIELDS if field in metadata[i]},
+                      "text": metadata[i]["text"], "id": ids[i]} for i in appended]
+            payload = (sorted(replaced), np.ascontiguousarray(vectors[appended], dtype="float32"), items,
+                       attribute_rows)
+            trained = self.index.is_trained
+            self._apply("upsert", payload)
+            if trained:
+                self._persist("upsert", payload)
+            else:
+                # The quantizer was trained by this edit; write it instead of retraining on replay
+                self._save_index()
+        self._maybe_compact()
+        return stats
+
+    def sync_ids(self, ids: List[str], texts: List[str], embed: Callable[[List[str]], np.ndarray],
+                 attributes: Optional[List[Dict]] = None, keep_existing: bool = False) -> Dict[str, int]:
+        """
+        Make the index hold `texts` under their stable `ids` (plus the other
+        current clauses with keep_existing) through upsert() and remove(), so
+        only rows whose id or text changed are written. A text already stored
+        in any row (under another id, or removed but not yet compacted away)
+        reuses that row's vector, so only texts new to the index are embedded.
+        Clauses indexed before they had an id (their id is their text hash) are
+        taken over by the id with the same text.
+        attributes: filter fields for each of `texts` (see FILTER_FIELDS)
+        Returns {"inserted", "replaced", "unchanged", "removed", "embedded"}.
+        """
+        attributes = attributes or [{}] * len(ids)
+        with self._write_lock:
+            hashes = self._row_hashes()
+            # Stored vector per text hash, preferring live rows
+            stored = {}
+            for row, digest in enumerate(hashes):
+                if digest not in stored or (self.deleted[stored[digest]] and not self.deleted[row]):
+                    stored[digest] = row
+            vectors = np.zeros((len(ids), self.index_dim), dtype="float32")
+            to_embed, adopted = [], []
+            for i, (clause_id, text) in enumerate(zip(ids, texts)):
+                digest = text_hash(text)
+                row = self._rows.get(clause_id)
+                if row is not None and hashes[row] == digest:
+                    continue
+                source = stored.get(digest)
+                if source is None:
+                    to_embed.append(i)
+                    continue
+                vectors[i] = self.index.reconstruct(int(source))
+                if self.ids[source] == digest and not self.deleted[source]:
+                    adopted.append(digest)
+            if to_embed:
+                vectors[to_embed] = self.project(np.asarray(embed([texts[i] for i in to_embed]), dtype="float32"))
+
+            metadata = [{**fields, "text": text} for fields, text in zip(attributes, texts)]
+            stats = self._upsert_projected(list(ids), vectors, metadata)
+            wanted = set(ids)
+            self.remove([clause_id for clause_id in adopted if clause_id not in wanted])
+            removed = 0
+            if not keep_existing:
+                removed = self.remove([clause_id for clause_id in self._rows if clause_id not in wanted])
+        stats.update(removed=removed, embedded=len(to_embed))
+        return stats
+
+    def sync_texts(self, texts: List[str], embed: Callable[[List[str]], np.ndarray],
+                   keep_existing: bool = False, attributes: Optional[List[Dict]] = None) -> Dict[str, int]:
+        """
+        Make the index hold exactly `texts` (or the current rows plus `texts`
+        with keep_existing), embedding only texts whose content hash is not
+        already indexed. Vectors of unchanged texts are reused, so an update
+        costs embeddings proportional to the diff. Duplicate texts are stored once.
+        attributes: filter fields for each of `texts` (see FILTER_FIELDS);
+            rows that are kept without new attributes keep their current ones
+        The index is rewritten without tombstones; use sync_ids() to edit it in place.
+        """
+        with self._write_lock:
+            # Prefer live rows, but a removed row's vector is as good for the same text
+            rows = {}
+            for row, digest in enumerate(self._row_hashes()):
+                if digest not in rows or (self.deleted[rows[digest]] and not self.deleted[row]):
+                    rows[digest] = row
+            live = np.flatnonzero(~self.deleted)
+            existing = len(live)
+
+            wanted = ([self.metadata[row] for row in live] if keep_existing else []) + list(texts)
+            final_texts, final_hashes, seen = [], [], set()
+            for text in wanted:
+                digest = text_hash(text)
+                if digest not in seen:
+                    seen.add(digest)
+                    final_texts.append(text)
+                    final_hashes.append(digest)
+            reused_rows = [rows[digest] for digest in final_hashes if digest in rows]
+            new_texts = [text for text, digest in zip(final_texts, final_hashes) if digest not in rows]
+            stats = {"total": len(final_texts), "reused": len(reused_rows), "embedded": len(new_texts),
+                     "removed": existing - len([row for row in reused_rows if not self.deleted[row]])}
+            updates = {}
+            for text, item in zip(texts, attributes or []):
+                updates[text_hash(text)] = item
+            if not new_texts and reused_rows == list(range(self.index.ntotal)) and not self.deleted.any():
+                if updates:
+                    self.update_attributes(updates)
+                return stats
+
+            vectors = np.empty((len(final_texts), self.index_dim), dtype="float32")
+            if reused_rows:
+                stored = self.index.reconstruct_n(0, self.index.ntotal)
+            if new_texts:
+                new_vectors = iter(self.project(np.asarray(embed(new_texts), dtype="float32")))
+            for i, digest in enumerate(final_hashes):
+                vectors[i] = stored[rows[digest]] if digest in rows else next(new_vectors)
+
+            index = self._new_index()
+            previous = self.attributes
+            previous_ids = self.ids
+            # Rows that already existed keep their id and attributes unless new attributes were given
+            attributes = ClauseAttributes()
+            attributes.extend([{**(previous.row(rows[digest]) if digest in rows else {}), **updates.get(digest, {})}
+                               for digest in final_hashes])
+            # A removed row's id may belong to its replacement by now
+            ids = [previous_ids[rows[digest]] if digest in rows and not self.deleted[rows[digest]] else digest
+                   for digest in final_hashes]
+            self.train(vectors, index)
+            index.add(vectors)
+            with self._swap_lock:
+                self.index = index
+                self.metadata = final_texts
+                self.attributes = attributes
+                self.ids = ids
+                self.deleted = np.zeros(len(ids), dtype=bool)
+                self._mapped = False
+            self._rows = {clause_id: row for row, clause_id in enumerate(ids)}
+            if self.manifest is not None:
+                self.manifest.clause_hashes = final_hashes
+            self._save_index()
+            return stats
+
+    def update_attributes(self, updates: Dict[str, Dict]) -> int:
+        """
+        Change filter fields of indexed clauses without touching their vectors,
+        e.g. to deactivate a clause. `updates` maps a clause's text hash to
+        {field: value}. Returns how many rows changed.
+        """
+        with self._write_lock:
+            changed = {}
+            for row, digest in enumerate(self._row_hashes()):
+                fields = updates.get(digest)
+                if fields and any(self.attributes.row(row).get(field) != value for field, value in fields.items()):
+                    changed[row] = fields
+            if changed:
+                self.attributes.set_rows(changed)
+                if self._log_records:
+                    # The attributes file must stay in step with the logged edits replayed over it
+                    self._persist("attributes", (changed,))
+                else:
+                    self.attributes.save(self.metadata_path)
+            return len(changed)
 
-    def search(self, query_embedding: np.ndarray, top_k: int = 5) -> List[Tuple[str, float]]:
-        query_embedding = np.array([query_embedding]).astype("float32")
-        distances, indices = self.index.search(query_embedding, top_k)
+    def _needs_compaction(self) -> bool:
+        rows = self.index.ntotal
+        return rows > 0 and int(self.deleted.sum()) + self._logged_rows >= self.compact_ratio * rows
+
+    def _maybe_compact(self):
+        """Start a background compaction when enough of the index is tombstoned or only in the log"""
+        if self.compact_ratio <= 0 or not self._needs_compaction():
+            return
+        if self._compaction is not None and self._compaction.is_alive():
+            return
+        self._compaction = threading.Thread(target=self._compact_in_background, name="vector-compaction",
+                                            daemon=True)
+        self._compaction.start()
+
+    def _compact_in_background(self):
+        try:
+            reclaimed = self.compact()
+            print(f"Compacted {self.index_path}: reclaimed {reclaimed} removed rows")
+        except Exception as e:
+            print(f"Compaction of {self.index_path} failed: {e}")
+
+    def wait_for_compaction(self, timeout: Optional[float] = None):
+        """Block until a running background compaction has finished (call before exiting)"""
+        compaction = self._compaction
+        if compaction is not None:
+            compaction.join(timeout)
+
+    def compact(self) -> int:
+        """
+        Rewrite the index without tombstoned rows and fold the edit log into
+        fresh index files. Searches keep using the current index until the
+        compacted one is swapped in. Returns the number of rows reclaimed.
+        """
+        with self._write_lock:
+            dead = np.flatnonzero(self.deleted)
+            if not len(dead) and not self._log_records:
+                return 0
+            index = self.index
+            if len(dead):
+                # Compact an owned copy; the current index may be mapped and is still being searched
+                index = faiss.deserialize_index(faiss.serialize_index(self.index))
+                index.remove_ids(faiss.IDSelectorBatch(dead.astype("int64")))
+            keep = ~self.deleted
+            live = np.flatnonzero(keep)
+            hashes = self._row_hashes()
+            metadata = [self.metadata[row] for row in live]
+            ids = [self.ids[row] for row in live]
+            attributes = self.attributes.select(keep)
+            with self._swap_lock:
+                self.index = index
+                self.metadata = metadata
+                self.attributes = attributes
+                self.ids = ids
+                self.deleted = np.zeros(len(ids), dtype=bool)
+                self._mapped = self._mapped and not len(dead)
+            self._rows = {clause_id: row for row, clause_id in enumerate(ids)}
+            if self.manifest is not None:
+                self.manifest.clause_hashes = [hashes[row] for row in live]
+            self._save_index()
+            if self.mmap:
+                index = faiss.read_index(self.index_path, mmap_flag())
+                metadata = MappedTexts(self.metadata_path)
+                with self._swap_lock:
+                    self.index, self.metadata, self._mapped = index, metadata, True
+            return len(dead)
+
+    def search(self, query_embedding: np.ndarray, top_k: int = 5,
+               filters: Optional[Dict] = None) -> List[Tuple[str, float]]:
+        return self.search_many(np.array([query_embedding]), top_k, filters)[0]
+
+    def search_many(self, query_embeddings: np.ndarray, top_k: int = 5,
+                    filters: Optional[Dict] = None) -> List[List[Tuple[str, float]]]:
+        """
+        (text, L2 distance) neighbours for each query, from one index search call.
+        filters: {field: value or [values]} over FILTER_FIELDS, e.g.
+            {"policy_type": "health", "is_active": True}. Excluded and removed
+            rows are skipped inside the search, so they never take top-k slots.
+        """
+        query_embeddings = self.project(np.asarray(query_embeddings, dtype="float32"))
+        with self._swap_lock:
+            index, metadata, attributes, deleted = self.index, self.metadata, self.attributes, self.deleted
+        mask = attributes.matching(filters) if filters else None
+        if deleted.any():
+            mask = ~deleted if mask is None else mask & ~deleted
+        if mask is None:
+            distances, indices = index.search(query_embeddings, top_k)
+        elif not mask.any():
+            return [[] for _ in query_embeddings]
+        else:
+            distances, indices = self._search_rows(index, query_embeddings, top_k, mask)
         results = []
-        for idx, dist in zip(indices[0], distances[0]):
-            if idx < len(self.metadata):
-                results.append((self.metadata[idx], float(dist)))
+        for row_indices, row_distances in zip(indices, distances):
+            results.append([(metadata[idx], float(dist)) for idx, dist in zip(row_indices, row_distances)
+                            if 0 <= idx < len(metadata)])
         return results
 
+    def _search_rows(self, index, query_embeddings: np.ndarray, top_k: int, mask: np.ndarray):
+        """Search restricted to the rows set in `mask`"""
+        if self.index_type in ("pq", "opq"):
+            # IndexPQ does not take ID selectors; scan the selected codes directly
+            return self._search_pq_rows(index, query_embeddings, top_k, np.flatnonzero(mask))
+        bitmap = np.packbits(mask, bitorder="little")
+        selector = faiss.IDSelectorBitmap(len(mask), faiss.swig_ptr(bitmap))
+        return index.search(query_embeddings, top_k, params=faiss.SearchParameters(sel=selector))
+
+    def _search_pq_rows(self, index, query_embeddings: np.ndarray, top_k: int, rows: np.ndarray):
+        """
+        Asymmetric distances from the queries to the PQ codes of `rows`, the
+        same distances IndexPQ computes over the whole index
+        """
+        if self.index_type == "opq":
+            for i in range(index.chain.size()):
+                query_embeddings = index.chain.at(i).apply(query_embeddings)
+            index = faiss.downcast_index(index.index)
+        pq = index.pq
+        tables = np.empty((len(query_embeddings), pq.M, pq.ksub), dtype="float32")
+        pq.compute_distance_tables(len(query_embeddings), faiss.swig_ptr(np.ascontiguousarray(query_embeddings)),
+                                   faiss.swig_ptr(tables))
+        codes = faiss.vector_to_array(index.codes).reshape(index.ntotal, pq.code_size)[rows]
+        # Codes are pq.nbits-wide centroid ids packed little-endian
+        bits = np.unpackbits(codes, axis=1, bitorder="little")[:, :pq.M * pq.nbits].reshape(len(rows), pq.M, pq.nbits)
+        centroids = (bits.astype(np.int64) << np.arange(pq.nbits)).sum(axis=2)
+        distances = tables[:, np.arange(pq.M), centroids].sum(axis=2)  # (queries, rows)
+
+        k = min(top_k, len(rows))
+        nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        nearest_distances = np.take_along_axis(distances, nearest, axis=1)
+        order = np.argsort(nearest_distances, axis=1)
+        out_distances = np.full((len(query_embeddings), top_k), np.inf, dtype="float32")
+        out_indices = np.full((len(query_embeddings), top_k), -1, dtype=np.int64)
+        out_distances[:, :k] = np.take_along_axis(nearest_distances, order, axis=1)
+        out_indices[:, :k] = rows[np.take_along_axis(nearest, order, axis=1)]
+        return out_distances, out_indices
+
+    @property
+    def ntotal(self) -> int:
+        """Live (not removed) clauses"""
+        return self.index.ntotal - int(self.deleted.sum())
+
+    def memory_bytes(self) -> int:
+        """Serialized size of the index, a close proxy for its in-memory footprint"""
+        return int(faiss.serialize_index(self.index).size)
+
     def _save_index(self):
-        faiss.write_index(self.index, self.index_path)
-        with open(self.metadata_path, "wb") as f:
-            pickle.dump(self.metadata, f)
+        # Write then rename, so readers that mapped the old files keep a valid copy
+        self.generation += 1
+        faiss.write_index(self.index, self.index_path + ".tmp")
+        os.replace(self.index_path + ".tmp", self.index_path)
+        with open(self.metadata_path + ".tmp", "wb") as f:
+            pickle.dump(list(self.metadata), f)
+        os.replace(self.metadata_path + ".tmp", self.metadata_path)
+        if self.mmap:
+            MappedTexts.write(self.metadata_path, self.metadata)
+        self.attributes.save(self.metadata_path)
+        if self.manifest is not None:
+            self.manifest.save(manifest_path(self.index_path))
+        with open(self.ids_path + ".tmp", "wb") as f:
+            pickle.dump({"generation": self.generation, "ids": list(self.ids),
+                         "deleted": np.packbits(self.deleted, bitorder="little")}, f)
+        os.replace(self.ids_path + ".tmp", self.ids_path)
+        # Everything logged so far is now part of the files
+        if os.path.exists(self.log_path):
+            os.remove(self.log_path)
+        self._log_records = 0
+        self._logged_rows = 0
+        self._base_saved = True
+
+    def _load_ids(self):
+        """Stored ids and tombstones; rows without them get their text hash as id"""
+        rows = len(self.metadata)
+        try:
+            with open(self.ids_path, "rb") as f:
+                data = pickle.load(f)
+        except FileNotFoundError:
+            data = None
+        if data is None or len(data["ids"]) != rows:
+            if data is not None:
+                print(f"Clause ids for {self.metadata_path} are out of date. Using content hashes.")
+            self.ids = list(self._row_hashes())
+            self.deleted = np.zeros(rows, dtype=bool)
+            self.generation = 0
+            return
+        self.ids = list(data["ids"])
+        self.deleted = np.unpackbits(data["deleted"], count=rows, bitorder="little").astype(bool)
+        self.generation = data["generation"]
+
+    def _replay_log(self):
+        """Re-apply the edits logged since the index files were written"""
+        self._log_records = 0
+        self._logged_rows = 0
+        try:
+            f = open(self.log_path, "rb")
+        except FileNotFoundError:
+            return
+        with f:
+            while True:
+                try:
+                    generation, op, payload = pickle.load(f)
+                except EOFError:
+                    break
+                except Exception as e:
+                    # A record cut short by a crash; everything before it is intact
+                    print(f"Stopped replaying {self.log_path} at a damaged record: {e}")
+                    break
+                if generation != self.generation:
+                    continue
+                self._apply(op, payload)
+                self._log_records += 1
+                if op == "upsert":
+                    self._logged_rows += len(payload[2])
 
     def load_index(self):
+        with self._write_lock:
+            self._load_index()
+
+    def _load_index(self):
         try:
-            self.index = faiss.read_index(self.index_path)
-            with open(self.metadata_path, "rb") as f:
-                self.metadata = pickle.load(f)
+            if self.mmap:
+                self.index = faiss.read_index(self.index_path, mmap_flag())
+                if not MappedTexts.is_current(self.metadata_path):
+                    with open(self.metadata_path, "rb") as f:
+                        MappedTexts.write(self.metadata_path, pickle.load(f))
+                self.metadata = MappedTexts(self.metadata_path)
+                self._mapped = True
+            else:
+                self.index = faiss.read_index(self.index_path)
+                with open(self.metadata_path, "rb") as f:
+                    self.metadata = pickle.load(f)
+                self._mapped = False
         except FileNotFoundError:
             print(f"Index files not found. Starting with empty index.")
             # Initialize empty index and metadata
-            self.index = faiss.IndexFlatL2(self.dim)
-            self.metadata = []
+            self._reset()
+            return
         except Exception as e:
             print("Failed to load FAISS index or metadata:", e)
-            self.index = faiss.IndexFlatL2(self.dim)
-            self.metadata = []
+            self._reset()
+            return
+        if self.index.d != self.index_dim:
+            # e.g. the projection was enabled, disabled or refitted to another dim
+            print(f"Index dimension {self.index.d} does not match expected {self.index_dim}. "
+                  f"Starting with empty index.")
+            self._reset()
+            return
+
+        built = IndexManifest.load(manifest_path(self.index_path))
+        if self.expected_manifest is None:
+            self.manifest = built
+        elif built is None:
+            # Built before manifests existed: assume current settings, hash the stored texts
+            self.manifest = self.expected_manifest.settings()
+            self.manifest.clause_hashes = [text_hash(text) for text in self.metadata]
+        else:
+            problems = self.expected_manifest.incompatibilities(built)
+            if problems:
+                print(f"Index at {self.index_path} was built differently ({'; '.join(problems)}). "
+                      f"Starting with empty index; re-embed to rebuild it.")
+                self._reset()
+                return
+            self.manifest = built
+        self.attributes = ClauseAttributes.load(self.metadata_path, len(self.metadata))
+        self._load_ids()
+        self._rows = {}
+        self._replay_log()
+        self._rows = {clause_id: row for row, clause_id in enumerate(self.ids) if not self.deleted[row]}
+        self._base_saved = True
+
+    def _reset(self):
+        self.index = self._new_index()
+        self.metadata = []
+        self.attributes = ClauseAttributes()
+        self.ids = []
+        self.deleted = np.zeros(0, dtype=bool)
+        self._rows = {}
+        self.generation = 0
+        self._base_saved = False
+        self._log_records = 0
+        self._logged_rows = 0
+        self._mapped = False
+        self.manifest = self.expected_manifest.settings() if self.expected_manifest is not None else None
@@ -28,12 +28,54 @@ DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NA
 # Use smaller model for memory-constrained environments like Render free tier
 # paraphrase-albert-small-v2 is much smaller (~43MB) vs all-MiniLM-L6-v2 (~90MB)
 EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "paraphrase-albert-small-v2")
+NORMALIZE_EMBEDDINGS = os.getenv("NORMALIZE_EMBEDDINGS", "false").lower() == "true"
 
 # Memory optimization settings
 LOW_MEMORY_MODE = os.getenv("LOW_MEMORY_MODE", "true").lower() == "true"
+TORCH_THREADS = int(os.getenv("TORCH_THREADS", "1" if LOW_MEMORY_MODE else "0"))  # 0 = torch default
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "8" if LOW_MEMORY_MODE else "32"))
+MMAP_INDEXES = os.getenv("MMAP_INDEXES", "true" if LOW_MEMORY_MODE else "false").lower() == "true"
+MAX_DOCUMENT_PAGES = int(os.getenv("MAX_DOCUMENT_PAGES", "300" if LOW_MEMORY_MODE else "0"))  # 0 = no limit
+EMBEDDER_IDLE_UNLOAD_SECONDS = int(os.getenv("EMBEDDER_IDLE_UNLOAD_SECONDS", "600" if LOW_MEMORY_MODE else "0"))
+# Shared embedding server (scripts/run_embedding_server.py): processes send texts to this Unix socket
+# instead of loading their own model, and load it only while the server is unreachable ("" = always
+# in-process). Results of EMBEDDING_SHM_MIN_BYTES or more come back through shared memory
+EMBEDDING_SERVER_SOCKET = os.getenv("EMBEDDING_SERVER_SOCKET", "")
+EMBEDDING_SERVER_TIMEOUT = float(os.getenv("EMBEDDING_SERVER_TIMEOUT", "120"))
+EMBEDDING_SHM_MIN_BYTES = int(os.getenv("EMBEDDING_SHM_MIN_BYTES", "65536"))
+# Soft RSS budget: above DEGRADE_RATIO of it requests get smaller page/batch limits,
+# above it new heavy requests are shed with 503 (0 disables)
+MEMORY_SOFT_LIMIT_MB = int(os.getenv("MEMORY_SOFT_LIMIT_MB", "400" if LOW_MEMORY_MODE else "0"))
+MEMORY_DEGRADE_RATIO = float(os.getenv("MEMORY_DEGRADE_RATIO", "0.85"))
+
+# Vector index compression: flat (exact float32), fp16, sq8, pq or opq
+# PQ/OPQ store PQ_M codes of PQ_BITS each per vector and need >= 2**PQ_BITS vectors to train
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "flat")
+DOCUMENT_INDEX_TYPE = os.getenv("DOCUMENT_INDEX_TYPE", "flat")
+PQ_M = int(os.getenv("PQ_M", "16"))
+PQ_BITS = int(os.getenv("PQ_BITS", "8"))
+# Removed/replaced clauses are tombstoned and the clause index is compacted in the background
+# once they exceed VECTOR_COMPACT_RATIO of its rows (0 = compact only on a full rebuild)
+VECTOR_COMPACT_RATIO = float(os.getenv("VECTOR_COMPACT_RATIO", "0.2"))
+
+# Optional PCA projection of clause-index embeddings (0 = full dimension), fitted with
+# scripts/fit_projection.py. Whitening changes the distance scale, recalibrate MATCH_THRESHOLD
+PROJECTION_DIM = int(os.getenv("PROJECTION_DIM", "0"))
+PROJECTION_PATH = os.getenv("PROJECTION_PATH", "models/faiss_index/projection.faiss")
+
+# Clause index sharding: VECTOR_SHARDS > 1 splits it into shards searched in parallel
+# (0/1 = single index). Partition by hash, policy_type or document; build with scripts/build_shards.py
+VECTOR_SHARDS = int(os.getenv("VECTOR_SHARDS", "0"))
+SHARD_PARTITION = os.getenv("SHARD_PARTITION", "hash")
+SHARD_DIR = os.getenv("SHARD_DIR", "models/faiss_shards")
+# Run each shard in its own worker process (false = threads in the API process)
+SHARD_PROCESSES = os.getenv("SHARD_PROCESSES", "false" if LOW_MEMORY_MODE else "true").lower() == "true"
 
 # Embedding similarity threshold for clause matching
 MATCH_THRESHOLD = float(os.getenv("MATCH_THRESHOLD", "0.75"))
+# Clause matching only considers active clauses, and only one policy type if set ("" = all)
+MATCH_ACTIVE_ONLY = os.getenv("MATCH_ACTIVE_ONLY", "true").lower() == "true"
+MATCH_POLICY_TYPE = os.getenv("MATCH_POLICY_TYPE", "")
 
 # File Upload Configuration
 MAX_FILE_SIZE_MB = int(os.getenv("MAX_FILE_SIZE_MB", "50"))  # 50MB max file size
@@ -41,6 +83,74 @@ ALLOWED_FILE_TYPES = ["application/pdf", "application/vnd.openxmlformats-officed
 
 # Rate Limiting
 RATE_LIMIT_PER_MINUTE = int(os.getenv("RATE_LIMIT_PER_MINUTE", "60"))
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "10"))
+
+# Admission control for document-processing requests (0 disables a limit). The rate limit and
+# MAX_CONCURRENT_PER_KEY apply per valid API key; requests without one (e.g. hackrx) only count
+# against MAX_IN_FLIGHT_REQUESTS and the memory budget unless RATE_LIMIT_BY_ADDRESS applies the
+# per-key limits to each client address
+MAX_CONCURRENT_PER_KEY = int(os.getenv("MAX_CONCURRENT_PER_KEY", "2"))
+MAX_IN_FLIGHT_REQUESTS = int(os.getenv("MAX_IN_FLIGHT_REQUESTS", "8"))
+RATE_LIMIT_BY_ADDRESS = os.getenv("RATE_LIMIT_BY_ADDRESS", "false").lower() == "true"
+
+# CPU offload: blocking stages run on bounded executors instead of the event loop
+CPU_THREAD_WORKERS = int(os.getenv("CPU_THREAD_WORKERS", str(os.cpu_count() or 2)))
+# Process pool for PDF parsing (0 = parse on the thread pool)
+EXTRACTION_PROCESSES = int(os.getenv("EXTRACTION_PROCESSES", "0" if LOW_MEMORY_MODE else "2"))
+# Max jobs running at once per stage, and max jobs allowed to wait for a slot
+STAGE_CONCURRENCY = {
+    "download": int(os.getenv("DOWNLOAD_CONCURRENCY", "8")),
+    "extraction": int(os.getenv("EXTRACTION_CONCURRENCY", "2")),
+    "chunking": int(os.getenv("CHUNKING_CONCURRENCY", "4")),
+    "embedding": int(os.getenv("EMBEDDING_CONCURRENCY", "2")),
+    "search": int(os.getenv("SEARCH_CONCURRENCY", "4")),
+    "decision": int(os.getenv("DECISION_CONCURRENCY", "2")),
+    "indexing": int(os.getenv("INDEXING_CONCURRENCY", "2")),
+}
+STAGE_QUEUE_LIMIT = int(os.getenv("STAGE_QUEUE_LIMIT", "32"))
+
+# hackrx request deadline in seconds (0 = none, the default). A request opts in with the
+# X-Request-Timeout header, capped at REQUEST_DEADLINE_MAX_SECONDS. Under a deadline, pages and
+# answer quality shrink as time runs out and questions not reached in time are returned as
+# partial results
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "0"))
+REQUEST_DEADLINE_MAX_SECONDS = float(os.getenv("REQUEST_DEADLINE_MAX_SECONDS", "120"))
+# Pages are capped to what fits DEADLINE_PREPARE_SHARE of the remaining time, starting from
+# DEADLINE_SECONDS_PER_PAGE (extraction + embedding) and refined from observed documents
+DEADLINE_SECONDS_PER_PAGE = float(os.getenv("DEADLINE_SECONDS_PER_PAGE", "0.2"))
+DEADLINE_PREPARE_SHARE = float(os.getenv("DEADLINE_PREPARE_SHARE", "0.7"))
+# With less time left answers come from the single top chunk without sentence spans, and
+# below DEADLINE_EMBED_MIN_SECONDS questions are matched lexically instead of embedded
+DEADLINE_SPAN_MIN_SECONDS = float(os.getenv("DEADLINE_SPAN_MIN_SECONDS", "2"))
+DEADLINE_EMBED_MIN_SECONDS = float(os.getenv("DEADLINE_EMBED_MIN_SECONDS", "0.5"))
+
+# hackrx answers: best-matching sentences within the top ANSWER_SPAN_CHUNKS chunks (false = chunk
+# prefix). Sentence embeddings of retrieved chunks are cached for SPAN_CACHE_CHUNKS chunks
+ANSWER_SPANS = os.getenv("ANSWER_SPANS", "true").lower() == "true"
+ANSWER_SPAN_CHUNKS = int(os.getenv("ANSWER_SPAN_CHUNKS", "3"))
+ANSWER_SPAN_SENTENCES = int(os.getenv("ANSWER_SPAN_SENTENCES", "2"))
+SPAN_CACHE_CHUNKS = int(os.getenv("SPAN_CACHE_CHUNKS", "500" if LOW_MEMORY_MODE else "5000"))
+
+# Persistent per-document vector indexes
+DOCUMENT_INDEX_DIR = os.getenv("DOCUMENT_INDEX_DIR", "models/documents")
+DOCUMENT_CACHE_SIZE = int(os.getenv("DOCUMENT_CACHE_SIZE", "8"))  # loaded indexes kept in memory
+PERSIST_DOCUMENT_INDEXES = os.getenv("PERSIST_DOCUMENT_INDEXES", "true").lower() == "true"
+# Disk budget of DOCUMENT_INDEX_DIR; least recently used documents are deleted beyond it (0 = unlimited)
+DOCUMENT_INDEX_MAX_MB = int(os.getenv("DOCUMENT_INDEX_MAX_MB", "1024"))
+# Also record indexed documents in policy_documents (in the background, off the request path)
+REGISTER_DOCUMENTS_IN_DB = os.getenv("REGISTER_DOCUMENTS_IN_DB", "false").lower() == "true"
+
+# Precomputed answers for frequent questions (built by scripts/build_answer_table.py)
+USE_ANSWER_TABLE = os.getenv("USE_ANSWER_TABLE", "true").lower() == "true"
+ANSWER_TABLE_PATH = os.getenv("ANSWER_TABLE_PATH", "models/answer_table.json")
+
+# Multi-document batch endpoint
+BATCH_MAX_DOCUMENTS = int(os.getenv("BATCH_MAX_DOCUMENTS", "10"))
+BATCH_MAX_QUERIES = int(os.getenv("BATCH_MAX_QUERIES", "100"))
+
+# Per-request profiling (opt-in with X-Debug-Profile header or ?profile=true, API key required)
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5"))
 
 # Other settings
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
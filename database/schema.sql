@@ -38,9 +38,13 @@ CREATE TABLE IF NOT EXISTS policy_documents (
     effective_date DATE,
     expiry_date DATE,
     is_active BOOLEAN DEFAULT TRUE,
+    content_hash VARCHAR(64) UNIQUE, -- sha256 of the source file, one persistent index per document
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Databases created before per-document indexes
+ALTER TABLE policy_documents ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64) UNIQUE;
+
 -- Junction table to link clauses to specific documents
 CREATE TABLE IF NOT EXISTS document_clauses (
     id SERIAL PRIMARY KEY,
@@ -0,0 +1,316 @@
+# evaluate_metrics.py
+
+"""
+Accuracy-versus-latency sweep over retrieval configurations.
+
+Every combination of embedding model, chunk size/overlap, index type, top_k
+and MATCH_THRESHOLD is scored on labeled question/clause pairs
+(data/test_queries.json by default: "query", "expected_match" and optionally
+"user_metadata"/"expected_decision"). For each configuration it reports:
+
+    recall@k          share of questions whose expected clause is in the top k
+    decision accuracy share of questions whose claim decision matches
+                      expected_decision (DecisionEngine on ClauseMatcher output)
+    p50/p95 latency   query embedding plus vector search, in ms
+    index memory      serialized index size
+
+The corpus is the clause files (--clauses) or, to sweep chunking, the chunks
+of policy documents (--documents). Embeddings are cached per model and text
+hash under --cache-dir, so re-running a sweep only embeds what is new.
+
+Configurations on the Pareto front (no other configuration is both at least
+as accurate and faster) are marked; --min-accuracy picks the fastest one that
+meets the bar.
+
+Usage:
+    python evaluate_metrics.py
+    python evaluate_metrics.py --index-types flat fp16 sq8 --top-k 1 3 5 --thresholds 0.3 0.5 0.75
+    python evaluate_metrics.py --documents policy.pdf --chunk-sizes 150 300 --overlaps 25 50 --min-accuracy 0.8
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+
+from app.clause_matcher import ClauseMatcher
+from app.decision_engine import DecisionEngine
+from app.document_processor import DocumentProcessor
+from app.embedder import Embedder
+from app.vector_store import FAISSVectorStore, INDEX_TYPES
+from config import EMBEDDING_MODEL_NAME, MATCH_THRESHOLD, NORMALIZE_EMBEDDINGS, PQ_M, PQ_BITS
+
+TEST_QUERIES_PATH = "data/test_queries.json"
+SAMPLE_CLAUSES_PATH = "data/sample_policy_clauses.json"
+
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+
+
+class EmbeddingCache:
+    """Embeddings of one model keyed by text hash, persisted as a single .npz"""
+
+    def __init__(self, cache_dir: str, model_name: str, normalize: bool):
+        slug = _NON_WORD.sub("-", model_name.lower()).strip("-")
+        self.path = os.path.join(cache_dir, f"{slug}{'-l2' if normalize else ''}.npz")
+        self.embedder = Embedder(model_name=model_name, normalize=normalize)
+        self.vectors = {}
+        self.misses = 0
+        if os.path.exists(self.path):
+            with np.load(self.path) as data:
+                self.vectors = dict(zip(data["keys"].tolist(), data["vectors"]))
+
+    @staticmethod
+    def key(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()[:24]
+
+    def get(self, texts: list) -> np.ndarray:
+        missing = list(dict.fromkeys(text for text in texts if self.key(text) not in self.vectors))
+        if missing:
+            self.misses += len(missing)
+            for text, vector in zip(missing, self.embedder.get_embeddings(missing)):
+                self.vectors[self.key(text)] = np.asarray(vector, dtype="float32")
+        return np.asarray([self.vectors[self.key(text)] for text in texts], dtype="float32")
+
+    def query_latencies(self, queries: list) -> list:
+        """Uncached per-query embedding time in ms, as the API pays it"""
+        self.embedder.get_embeddings(queries[:1])  # load the model outside the timings
+        timings = []
+        for query in queries:
+            start = time.perf_counter()
+            self.embedder.get_embeddings([query])
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
+
+    def save(self):
+        if not self.misses:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        keys = list(self.vectors)
+        with open(self.path + ".tmp", "wb") as f:
+            np.savez(f, keys=np.asarray(keys), vectors=np.asarray([self.vectors[key] for key in keys]))
+        os.replace(self.path + ".tmp", self.path)
+
+
+def _normalize(text: str) -> str:
+    return _NON_WORD.sub(" ", text.lower()).strip()
+
+
+def is_relevant(text: str, expected: str, min_overlap: float = 0.8) -> bool:
+    """
+    True if `text` contains the expected clause. Chunks may cut a clause at
+    their edges, so most of its words appearing in the text also counts.
+    """
+    text, expected = _normalize(text), _normalize(expected)
+    if expected in text:
+        return True
+    expected_words = expected.split()
+    text_words = set(text.split())
+    return bool(expected_words) and sum(word in text_words for word in expected_words) / len(expected_words) >= min_overlap
+
+
+def percentile(values: list, q: float) -> float:
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def load_labels(paths: list) -> list:
+    labels = []
+    for path in paths:
+        with open(path, "r") as f:
+            for item in json.load(f):
+                if item.get("query") and item.get("expected_match"):
+                    labels.append(item)
+    return labels
+
+
+def load_corpus(args, chunk_size: int, overlap: int) -> list:
+    """Clause texts, or chunks of the documents for this chunking"""
+    if not args.documents:
+        texts = []
+        for path in args.clauses:
+            with open(path, "r") as f:
+                texts.extend(clause["clause_text"] for clause in json.load(f))
+        return list(dict.fromkeys(texts))
+    processor = DocumentProcessor(chunk_size=chunk_size, overlap=overlap)
+    chunks = []
+    for path in args.documents:
+        chunks.extend(processor.chunk_text(processor.extract_text(path)))
+    return chunks
+
+
+def evaluate_index(store: FAISSVectorStore, embedder: Embedder, labels: list, query_vectors: np.ndarray,
+                   embed_ms: list, top_ks: list, thresholds: list) -> list:
+    """Recall, decision accuracy and latency for every top_k/threshold on one built index"""
+    # The matcher the API uses, so the decision path is exactly the production one
+    matcher = ClauseMatcher(embedder=embedder, store=store)
+    decided = [label for label in labels if "expected_decision" in label]
+    rows = []
+    for top_k in top_ks:
+        search_ms = []
+        hits = 0
+        for label, vector in zip(labels, query_vectors):
+            start = time.perf_counter()
+            results = store.search(vector, top_k=top_k)
+            search_ms.append((time.perf_counter() - start) * 1000)
+            hits += any(is_relevant(text, label["expected_match"]) for text, _ in results)
+        latency = [e + s for e, s in zip(embed_ms, search_ms)]
+
+        for threshold in thresholds:
+            matcher.threshold = threshold
+            correct = 0
+            for label, vector in zip(labels, query_vectors):
+                if "expected_decision" not in label:
+                    continue
+                decision = DecisionEngine.evaluate_match(matcher.match_embedding(vector),
+                                                         label.get("user_metadata") or {})
+                correct += decision["claim_allowed"] == label["expected_decision"]
+            rows.append({
+                "top_k": top_k,
+                "threshold": threshold,
+                "recall": round(hits / len(labels), 4),
+                "decision_accuracy": round(correct / len(decided), 4) if decided else None,
+                "latency_p50_ms": round(percentile(latency, 50), 3),
+                "latency_p95_ms": round(percentile(latency, 95), 3),
+                "search_p50_ms": round(percentile(search_ms, 50), 3),
+            })
+    return rows
+
+
+def run_sweep(args, labels: list) -> list:
+    results = []
+    queries = [label["query"] for label in labels]
+    chunkings = list(itertools.product(args.chunk_sizes, args.overlaps)) if args.documents else [(None, None)]
+
+    for model_name in args.models:
+        cache = EmbeddingCache(args.cache_dir, model_name, args.normalize)
+        query_vectors = cache.get(queries)
+        embed_ms = cache.query_latencies(queries)
+        print(f"\n🧠 {model_name}: query embedding p50 {percentile(embed_ms, 50):.2f} ms")
+
+        for chunk_size, overlap in chunkings:
+            if chunk_size is not None and overlap >= chunk_size:
+                continue
+            corpus = load_corpus(args, chunk_size, overlap)
+            start = time.time()
+            vectors = cache.get(corpus)
+            cache.save()
+            print(f"📚 {len(corpus)} texts (chunk_size={chunk_size}, overlap={overlap}) "
+                  f"embedded in {time.time() - start:.2f}s, {cache.misses} new so far")
+
+            for index_type in args.index_types:
+                with tempfile.TemporaryDirectory() as workdir:
+                    store = FAISSVectorStore(dim=vectors.shape[1], index_path=os.path.join(workdir, "index.faiss"),
+                                             metadata_path=os.path.join(workdir, "metadata.pkl"),
+                                             index_type=index_type, pq_m=args.pq_m, pq_bits=PQ_BITS)
+                    if len(corpus) < store.min_training_size:
+                        print(f"   ⚠️ {index_type}: needs {store.min_training_size} vectors to train, "
+                              f"corpus has {len(corpus)}; skipped")
+                        continue
+                    store.add_embeddings([{"text": text, "embedding": vector} for text, vector in zip(corpus, vectors)])
+                    memory_kb = round(store.memory_bytes() / 1024, 1)
+                    for row in evaluate_index(store, cache.embedder, labels, query_vectors, embed_ms,
+                                              args.top_k, args.thresholds):
+                        results.append({"model": model_name, "chunk_size": chunk_size, "overlap": overlap,
+                                        "index_type": index_type, "index_kb": memory_kb, **row})
+        cache.save()
+    return results
+
+
+def pareto_front(results: list, objective: str) -> list:
+    """Configurations no other configuration beats on both the objective and p95 latency"""
+    front = []
+    for row in results:
+        score = row[objective] or 0.0
+        dominated = any(
+            (other[objective] or 0.0) >= score and other["latency_p95_ms"] <= row["latency_p95_ms"]
+            and ((other[objective] or 0.0) > score or other["latency_p95_ms"] < row["latency_p95_ms"])
+            for other in results)
+        row["pareto"] = not dominated
+        if not dominated:
+            front.append(row)
+    return sorted(front, key=lambda row: row["latency_p95_ms"])
+
+
+def print_table(results: list, objective: str):
+    header = (f"{'':2}{'model':<28} {'chunk':>7} {'index':<5} {'k':>3} {'thr':>5} "
+              f"{'recall':>7} {'accuracy':>9} {'p50 ms':>8} {'p95 ms':>8} {'index KB':>9}")
+    print(header)
+    print("-" * len(header))
+    for row in sorted(results, key=lambda row: (-(row[objective] or 0.0), row["latency_p95_ms"])):
+        chunking = f"{row['chunk_size']}/{row['overlap']}" if row["chunk_size"] else "-"
+        accuracy = f"{row['decision_accuracy']:.1%}" if row["decision_accuracy"] is not None else "n/a"
+        print(f"{'★ ' if row['pareto'] else '  '}{row['model'][-28:]:<28} {chunking:>7} {row['index_type']:<5} "
+              f"{row['top_k']:>3} {row['threshold']:>5.2f} {row['recall']:>7.1%} {accuracy:>9} "
+              f"{row['latency_p50_ms']:>8.2f} {row['latency_p95_ms']:>8.2f} {row['index_kb']:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep retrieval settings for accuracy versus latency")
+    parser.add_argument("--labels", nargs="+", default=[TEST_QUERIES_PATH],
+                        help="Labeled question/clause JSON files")
+    parser.add_argument("--clauses", nargs="+", default=[SAMPLE_CLAUSES_PATH], help="Clause corpus files")
+    parser.add_argument("--documents", nargs="*", default=[], help="Policy documents to chunk instead")
+    parser.add_argument("--models", nargs="+", default=[EMBEDDING_MODEL_NAME], help="Embedding models")
+    parser.add_argument("--normalize", action="store_true", default=NORMALIZE_EMBEDDINGS,
+                        help="L2-normalize embeddings")
+    parser.add_argument("--chunk-sizes", nargs="+", type=int, default=[300], help="Words per chunk")
+    parser.add_argument("--overlaps", nargs="+", type=int, default=[50], help="Words shared by chunks")
+    parser.add_argument("--index-types", nargs="+", default=["flat", "fp16", "sq8"], choices=INDEX_TYPES)
+    parser.add_argument("--pq-m", type=int, default=PQ_M, help="PQ sub-vectors for pq/opq")
+    parser.add_argument("--top-k", nargs="+", type=int, default=[1, 3, 5], help="k for recall@k")
+    parser.add_argument("--thresholds", nargs="+", type=float,
+                        default=sorted({0.25, 0.35, 0.5, MATCH_THRESHOLD}), help="MATCH_THRESHOLD values")
+    parser.add_argument("--objective", default="decision_accuracy", choices=["decision_accuracy", "recall"],
+                        help="Accuracy measure for the Pareto front")
+    parser.add_argument("--min-accuracy", type=float, help="Pick the fastest configuration meeting this")
+    parser.add_argument("--cache-dir", default="models/eval_cache", help="Embedding cache directory")
+    parser.add_argument("--output", help="Write all results as JSON")
+    args = parser.parse_args()
+
+    labels = load_labels(args.labels)
+    if not labels:
+        print("❌ No labeled pairs: each item needs \"query\" and \"expected_match\"")
+        sys.exit(1)
+    if args.objective == "decision_accuracy" and not any("expected_decision" in label for label in labels):
+        args.objective = "recall"
+
+    print("🚀 Retrieval accuracy/latency sweep")
+    print("=" * 60)
+    print(f"📋 {len(labels)} labeled questions, objective: {args.objective}")
+
+    start = time.time()
+    results = run_sweep(args, labels)
+    if not results:
+        print("❌ No configuration could be evaluated")
+        sys.exit(1)
+    front = pareto_front(results, args.objective)
+
+    print(f"\n📊 {len(results)} configurations in {time.time() - start:.1f}s (★ = Pareto front)\n")
+    print_table(results, args.objective)
+
+    if args.min_accuracy is not None:
+        eligible = [row for row in front if (row[args.objective] or 0.0) >= args.min_accuracy]
+        if eligible:
+            best = eligible[0]
+            print(f"\n🏆 Fastest with {args.objective} >= {args.min_accuracy:.0%}: {best['model']}, "
+                  f"{best['index_type']}, top_k={best['top_k']}, MATCH_THRESHOLD={best['threshold']}"
+                  + (f", chunk_size={best['chunk_size']}, overlap={best['overlap']}" if best["chunk_size"] else "")
+                  + f" ({best['latency_p95_ms']:.2f} ms p95)")
+        else:
+            print(f"\n⚠️ No configuration reaches {args.objective} >= {args.min_accuracy:.0%}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"objective": args.objective, "results": results, "pareto": front}, f, indent=2)
+        print(f"\n💾 Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
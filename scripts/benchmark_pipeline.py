@@ -0,0 +1,242 @@
+# scripts/benchmark_pipeline.py
+
+"""
+Micro-benchmarks for every pipeline stage.
+
+Generates synthetic policy PDFs locally, times each stage across input sizes
+and writes wall time, throughput and peak memory as JSON. Pass --baseline to
+compare against a previously saved run; the script exits non-zero when a
+stage got slower than the allowed tolerance.
+
+Usage:
+    python scripts/benchmark_pipeline.py --pages 5 20 80 --output bench.json
+    python scripts/benchmark_pipeline.py --baseline bench.json --tolerance 0.25
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz  # PyMuPDF
+
+from app.document_processor import DocumentProcessor
+from app.embedder import Embedder
+from app.vector_store import FAISSVectorStore
+from app.clause_matcher import ClauseMatcher
+from app.decision_engine import DecisionEngine
+from config import EMBEDDING_MODEL_NAME, MATCH_THRESHOLD
+
+SAMPLE_CLAUSES_PATH = "data/sample_policy_clauses.json"
+TEST_QUERIES_PATH = "data/test_queries.json"
+
+FILLER_SENTENCES = [
+    "The insured person shall notify the company within seven days of hospitalization.",
+    "A grace period of thirty days is allowed for payment of renewal premium.",
+    "Pre-existing diseases are covered after a waiting period of thirty six months.",
+    "Room rent is limited to one percent of the sum insured per day.",
+    "Expenses for cataract surgery are payable up to the limits in the schedule.",
+    "AYUSH treatment is covered when taken in a government recognised hospital.",
+    "Maternity expenses are payable after twenty four months of continuous coverage.",
+    "Claims must be supported by original bills, discharge summary and investigation reports.",
+]
+
+
+def _load_clause_texts():
+    with open(SAMPLE_CLAUSES_PATH, "r") as f:
+        return [clause["clause_text"] for clause in json.load(f)]
+
+
+def _load_queries():
+    with open(TEST_QUERIES_PATH, "r") as f:
+        return [test["query"] for test in json.load(f)]
+
+
+def make_policy_pdf(path: str, pages: int, seed: int = 42, sentences_per_page: int = 30) -> str:
+    """Write a synthetic policy wording PDF with the given number of pages"""
+    rng = random.Random(seed)
+    corpus = _load_clause_texts() + FILLER_SENTENCES
+    doc = fitz.open()
+    for page_no in range(pages):
+        page = doc.new_page()
+        lines = [f"Section {page_no + 1}. Policy Wording"]
+        for clause_no in range(sentences_per_page):
+            lines.append(f"{page_no + 1}.{clause_no + 1} {rng.choice(corpus)}")
+        page.insert_textbox(page.rect + (36, 36, -36, -36), "\n".join(lines), fontsize=8)
+    doc.save(path)
+    doc.close()
+    return path
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        rss /= 1024
+    return round(rss / 1024, 2)
+
+
+def measure(stage: str, size: int, fn, items: int, unit: str, repeat: int) -> dict:
+    """Run fn `repeat` times and summarise wall time, throughput and peak memory"""
+    timings = []
+    peak_py = 0
+    for _ in range(repeat):
+        tracemalloc.start()
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+        peak_py = max(peak_py, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    median_ms = statistics.median(timings)
+    return {
+        "stage": stage,
+        "pages": size,
+        "items": items,
+        "unit": unit,
+        "wall_ms": {
+            "min": round(min(timings), 3),
+            "median": round(median_ms, 3),
+            "max": round(max(timings), 3),
+        },
+        "throughput_per_s": round(items / (median_ms / 1000), 2) if median_ms > 0 else None,
+        "peak_python_mb": round(peak_py / (1024 * 1024), 3),
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def run_benchmarks(page_sizes, repeat: int, workdir: str) -> list:
+    processor = DocumentProcessor()
+    embedder = Embedder(model_name=EMBEDDING_MODEL_NAME)
+    dim = embedder.dimension
+    queries = _load_queries()
+    results = []
+
+    for pages in page_sizes:
+        print(f"📄 Benchmarking {pages}-page document...")
+        pdf_path = make_policy_pdf(os.path.join(workdir, f"policy_{pages}p.pdf"), pages)
+
+        text = processor.extract_text(pdf_path)
+        results.append(measure("extract_text", pages, lambda: processor.extract_text(pdf_path),
+                               pages, "pages", repeat))
+
+        chunks = processor.chunk_text(text)
+        results.append(measure("chunk_text", pages, lambda: processor.chunk_text(text),
+                               len(text.split()), "words", repeat))
+
+        embeddings = embedder.get_embeddings(chunks)
+        results.append(measure("get_embeddings", pages, lambda: embedder.get_embeddings(chunks),
+                               len(chunks), "chunks", repeat))
+
+        packed = [{"text": c, "embedding": e} for c, e in zip(chunks, embeddings)]
+        index_path = os.path.join(workdir, f"index_{pages}p.faiss")
+        metadata_path = os.path.join(workdir, f"metadata_{pages}p.pkl")
+
+        def add():
+            store = FAISSVectorStore(dim=dim, index_path=index_path, metadata_path=metadata_path)
+            store.add_embeddings(packed)
+
+        results.append(measure("add_embeddings", pages, add, len(packed), "vectors", repeat))
+
+        store = FAISSVectorStore(dim=dim, index_path=index_path, metadata_path=metadata_path)
+        store.add_embeddings(packed)
+        query_embeddings = embedder.get_embeddings(queries)
+
+        def search():
+            for query_embedding in query_embeddings:
+                store.search(query_embedding, top_k=5)
+
+        results.append(measure("search", pages, search, len(queries), "queries", repeat))
+
+        matcher = ClauseMatcher(embedder=embedder, store=store, threshold=MATCH_THRESHOLD)
+        results.append(measure("match_query", pages,
+                               lambda: [matcher.match_query(q) for q in queries],
+                               len(queries), "queries", repeat))
+
+        engine = DecisionEngine(matcher)
+        metadata = {"age": 30, "policy_duration": 100, "existing_conditions": False}
+        results.append(measure("evaluate_claim", pages,
+                               lambda: [engine.evaluate_claim(q, metadata) for q in queries],
+                               len(queries), "queries", repeat))
+
+    return results
+
+
+def compare_with_baseline(results: list, baseline: dict, tolerance: float) -> list:
+    """Return the stages whose median wall time regressed beyond tolerance"""
+    previous = {(r["stage"], r["pages"]): r for r in baseline.get("results", [])}
+    regressions = []
+    for result in results:
+        old = previous.get((result["stage"], result["pages"]))
+        if not old:
+            continue
+        old_ms = old["wall_ms"]["median"]
+        new_ms = result["wall_ms"]["median"]
+        change = (new_ms - old_ms) / old_ms if old_ms > 0 else 0.0
+        result["baseline_median_ms"] = old_ms
+        result["change"] = round(change, 4)
+        if change > tolerance:
+            regressions.append(result)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark each pipeline stage")
+    parser.add_argument("--pages", type=int, nargs="+", default=[5, 20, 80],
+                        help="Synthetic document sizes in pages")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per stage")
+    parser.add_argument("--output", default="bench_output.json", help="Where to write results")
+    parser.add_argument("--baseline", help="Previous results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed slowdown vs baseline (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    print("🚀 Running pipeline micro-benchmarks")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        results = run_benchmarks(args.pages, args.repeat, workdir)
+
+    report = {
+        "meta": {
+            "model": EMBEDDING_MODEL_NAME,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "repeat": args.repeat,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            regressions = compare_with_baseline(results, json.load(f), args.tolerance)
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    for r in results:
+        change = f"  ({r['change']:+.1%} vs baseline)" if "change" in r else ""
+        print(f"{r['stage']:<16} {r['pages']:>4}p  {r['wall_ms']['median']:>10.2f}ms  "
+              f"{r['throughput_per_s'] or 0:>10.1f} {r['unit']}/s{change}")
+    print(f"💾 Saved results to {args.output}")
+
+    if regressions:
+        print(f"❌ {len(regressions)} stage(s) regressed more than {args.tolerance:.0%}:")
+        for r in regressions:
+            print(f"   - {r['stage']} @ {r['pages']} pages: {r['change']:+.1%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+# scripts/build_answer_table.py
+
+"""
+Precompute answers for the most frequent questions on each policy document.
+
+Questions come from query_logs (--from-db) and/or a JSON file (--questions:
+a list of strings or of {"query": ...} objects). Phrasings of the same
+question are clustered by embedding similarity; every phrasing in a cluster
+maps to the answer computed for its most frequent member.
+
+Documents are the --documents files or URLs (indexed if they are new) or, by
+default, every persisted document index. Each entry records the document's
+index version and the answer settings (ANSWER_SPANS, ANSWER_SPAN_CHUNKS,
+ANSWER_SPAN_SENTENCES), so the API ignores it once the document is
+re-indexed or answers are built differently; rebuild the table after
+changing them.
+
+Usage:
+    python scripts/build_answer_table.py --questions data/test_queries.json
+    python scripts/build_answer_table.py --from-db --clusters 50 --documents policy.pdf
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import Counter
+from typing import Tuple
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from api.pipeline import InferencePipeline
+from app.answer_table import AnswerTable, answer_version, normalize_question
+from app.response_builder import ResponseBuilder
+from app.span_index import top_chunks
+from config import ANSWER_TABLE_PATH, ANSWER_SPANS, ANSWER_SPAN_CHUNKS, DATABASE_URL
+
+
+def load_questions_file(path: str) -> Counter:
+    with open(path, "r") as f:
+        items = json.load(f)
+    return Counter(item["query"] if isinstance(item, dict) else item for item in items)
+
+
+def load_questions_db(limit: int) -> Counter:
+    import psycopg2
+    conn = psycopg2.connect(DATABASE_URL)
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT user_query, COUNT(*) FROM query_logs
+            GROUP BY user_query ORDER BY COUNT(*) DESC LIMIT %s
+        """, (limit,))
+        return Counter(dict(cursor.fetchall()))
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def cluster_questions(counts: Counter, embedder, threshold: float, max_clusters: int,
+                      min_count: int) -> Tuple[list, np.ndarray]:
+    """
+    Greedy clustering, most frequent first: a question joins the first cluster
+    whose leader is at least `threshold` cosine-similar, else starts its own.
+    Returns [(leader, [phrasings...], total count)] by descending count and
+    the leaders' embeddings as the embedder returned them (the API's question
+    embeddings), so they are not embedded twice.
+    """
+    phrasings = {}
+    for question, count in counts.most_common():
+        key = normalize_question(question)
+        if key:
+            entry = phrasings.setdefault(key, [question, [], 0])
+            entry[1].append(question)
+            entry[2] += count
+    ordered = sorted(phrasings.values(), key=lambda entry: -entry[2])
+    if not ordered:
+        return [], np.zeros((0, embedder.dimension), dtype="float32")
+
+    embeddings = np.asarray(embedder.get_embeddings([entry[0] for entry in ordered]), dtype="float32")
+    # Cosine similarity on unit vectors, whatever normalization the embedder applies
+    vectors = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+    clusters = []
+    leaders = []
+    leader_rows = []
+    for row, (vector, (question, variants, count)) in enumerate(zip(vectors, ordered)):
+        if leaders:
+            similarity = np.asarray(leaders) @ vector
+            best = int(np.argmax(similarity))
+            if similarity[best] >= threshold:
+                clusters[best][1].extend(variants)
+                clusters[best][2] += count
+                continue
+        leaders.append(vector)
+        leader_rows.append(row)
+        clusters.append([question, list(variants), count])
+
+    kept = sorted((i for i, cluster in enumerate(clusters) if cluster[2] >= min_count),
+                  key=lambda i: -clusters[i][2])[:max_clusters]
+    return [clusters[i] for i in kept], embeddings[[leader_rows[i] for i in kept]]
+
+
+def precompute_document(pipeline: InferencePipeline, doc, clusters: list, leader_embeddings: np.ndarray) -> list:
+    """Answer table entries for one document, computed exactly as the API would"""
+    candidates = top_chunks(doc.embeddings, leader_embeddings, ANSWER_SPAN_CHUNKS if ANSWER_SPANS else 1)
+    if ANSWER_SPANS:
+        answers = [ResponseBuilder.build_span_answer(span)
+                   for span in pipeline.document_answer_spans(doc.chunks, candidates, leader_embeddings)]
+    else:
+        answers = [ResponseBuilder.build_document_answer(doc.chunks[chunks[0]]) for chunks in candidates]
+    matcher = pipeline.document_decision_engine(doc).matcher
+    entries = []
+    for (leader, variants, count), chunks, answer, embedding in zip(clusters, candidates, answers, leader_embeddings):
+        chunk_index = chunks[0]
+        entries.append((variants, {
+            "question": leader,
+            "answer": answer,
+            "page": doc.pages[chunk_index] if chunk_index < len(doc.pages) else None,
+            "match": matcher.match_embedding(embedding),
+        }))
+    return entries
+
+
+def resolve_documents(pipeline: InferencePipeline, sources: list) -> list:
+    """IndexedDocuments for the given files/URLs, or every persisted document"""
+    if not sources:
+        store = pipeline.document_store
+        return [doc for doc in (store.get(document_id) for document_id in store.document_ids())
+                if doc is not None]
+
+    documents = []
+    for source in sources:
+        is_url = source.startswith(("http://", "https://"))
+        path = pipeline.download_document(source) if is_url else source
+        try:
+            doc = asyncio.run(pipeline.ingest_document(path, source, endpoint="answer_table"))
+        finally:
+            if is_url:
+                os.unlink(path)
+        if doc is None:
+            print(f"⚠️ No text in {source}, skipping")
+        else:
+            documents.append(doc)
+    return documents
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute answers for frequent questions per document")
+    parser.add_argument("--questions", help="JSON file of questions (strings or {\"query\": ...})")
+    parser.add_argument("--from-db", action="store_true", help="Mine questions from query_logs")
+    parser.add_argument("--db-limit", type=int, default=5000, help="Distinct logged questions to read")
+    parser.add_argument("--documents", nargs="*", default=[], help="Files or URLs (default: all indexed)")
+    parser.add_argument("--clusters", type=int, default=100, help="Question clusters to precompute")
+    parser.add_argument("--min-count", type=int, default=1, help="Minimum occurrences of a cluster")
+    parser.add_argument("--similarity", type=float, default=0.85, help="Cosine similarity to join a cluster")
+    parser.add_argument("--output", default=ANSWER_TABLE_PATH, help="Answer table path")
+    args = parser.parse_args()
+
+    print("🚀 Building precomputed answer table")
+    print("=" * 60)
+
+    counts = Counter()
+    if args.questions:
+        counts.update(load_questions_file(args.questions))
+    if args.from_db:
+        counts.update(load_questions_db(args.db_limit))
+    if not counts:
+        print("❌ No questions: pass --questions and/or --from-db")
+        sys.exit(1)
+
+    pipeline = InferencePipeline()
+    clusters, leader_embeddings = cluster_questions(counts, pipeline.embedder, args.similarity, args.clusters,
+                                                    args.min_count)
+    covered = sum(cluster[2] for cluster in clusters)
+    print(f"📊 {len(counts)} distinct questions -> {len(clusters)} clusters "
+          f"covering {covered}/{sum(counts.values())} occurrences")
+
+    documents = resolve_documents(pipeline, args.documents)
+    if not documents:
+        print("❌ No documents to precompute (index some with POST /documents/ or pass --documents)")
+        sys.exit(1)
+
+    table = AnswerTable(args.output)
+    store = pipeline.document_store
+    # Entries for documents re-indexed (or answer settings changed) since the last build can never hit again
+    dropped = table.drop_stale(lambda content_hash: answer_version(store.version(content_hash)))
+    if dropped:
+        print(f"🗑️ Dropped stale answers for {dropped} re-indexed or removed documents")
+
+    for doc in documents:
+        start = time.time()
+        table.invalidate(doc.content_hash)
+        for variants, entry in precompute_document(pipeline, doc, clusters, leader_embeddings):
+            table.put(doc.content_hash, answer_version(store.version(doc.content_hash)), variants, entry)
+        print(f"✅ Document {doc.document_id} ({doc.info.get('document_name')}): "
+              f"{len(clusters)} answers in {time.time() - start:.2f}s")
+
+    table.save()
+    print(f"💾 Saved {len(table)} question keys for {table.document_count()} documents to {args.output}")
+
+    print("\nTop clusters:")
+    for leader, variants, count in clusters[:5]:
+        print(f"   {count:>5}x {leader} ({len(variants)} phrasings)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+# scripts/build_shards.py
+
+"""
+Build the sharded clause index used when VECTOR_SHARDS > 1.
+
+Clauses come from JSON clause files (--clauses, same format as
+data/sample_policy_clauses.json) and/or the existing single clause index
+(--from-index). Vectors of an exact, unprojected single index are reused;
+everything else is embedded with the configured model. Partitioning by
+policy_type needs the clause files, which carry each clause's policy_type.
+
+After the rebuild the script prints shard sizes and compares latency and
+top-k agreement of the sharded index against one index over the same clauses.
+
+Usage:
+    python scripts/build_shards.py --clauses data/sample_policy_clauses.json --shards 4
+    python scripts/build_shards.py --from-index --shards 2 --partition policy_type --clauses data/sample_policy_clauses.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from app.embedder import Embedder
+from app.index_manifest import IndexManifest
+from app.sharded_store import PARTITIONS, ShardedVectorStore
+from app.vector_store import FILTER_FIELDS, FAISSVectorStore, EmbeddingProjection
+from config import (
+    EMBEDDING_MODEL_NAME, NORMALIZE_EMBEDDINGS, VECTOR_INDEX_TYPE, PQ_M, PQ_BITS, MMAP_INDEXES,
+    PROJECTION_DIM, PROJECTION_PATH, VECTOR_SHARDS, SHARD_PARTITION, SHARD_DIR, SHARD_PROCESSES,
+)
+
+
+def load_clause_files(paths: list) -> list:
+    clauses = []
+    for path in paths:
+        with open(path, "r") as f:
+            clauses.extend(json.load(f))
+    return clauses
+
+
+def collect_corpus(args, embedder: Embedder, manifest: IndexManifest) -> list:
+    """[{"text", "embedding", "document_id", filter fields...}] without duplicate texts"""
+    items = {}
+    for clause in load_clause_files(args.clauses):
+        items.setdefault(clause["clause_text"], {
+            "text": clause["clause_text"],
+            "id": clause.get("code"),
+            "document_id": clause.get("document_id") or clause.get("code"),
+            **{field: clause[field] for field in FILTER_FIELDS if field in clause},
+        })
+
+    if args.from_index:
+        store = FAISSVectorStore(dim=embedder.dimension, index_path="models/faiss_index/index.faiss",
+                                 metadata_path="models/faiss_index/metadata.pkl", manifest=manifest)
+        store.load_index()
+        # Only an exact index without projection holds the original embeddings
+        reusable = store.index_type == "flat" and store.projection is None and store.ntotal
+        vectors = store.index.reconstruct_n(0, store.index.ntotal) if reusable else None
+        for i, text in enumerate(store.metadata):
+            if store.deleted[i]:
+                continue
+            item = items.setdefault(text, {"text": text, "id": store.ids[i], "document_id": None,
+                                           **store.attributes.row(i)})
+            if vectors is not None:
+                item["embedding"] = vectors[i]
+        print(f"📥 Read {store.ntotal} clauses from the single index"
+              f"{'' if reusable else ' (re-embedding them)'}")
+
+    corpus = list(items.values())
+    missing = [item for item in corpus if "embedding" not in item]
+    if missing:
+        start = time.time()
+        embeddings = embedder.get_embeddings([item["text"] for item in missing])
+        for item, embedding in zip(missing, embeddings):
+            item["embedding"] = np.asarray(embedding, dtype="float32")
+        print(f"🔢 Embedded {len(missing)} clauses in {time.time() - start:.2f}s")
+    return corpus
+
+
+def compare_with_single(sharded: ShardedVectorStore, corpus: list, projection, manifest, k: int, queries: int):
+    """Latency and top-k agreement of the sharded index vs one index over the same clauses"""
+    vectors = np.asarray([item["embedding"] for item in corpus], dtype="float32")
+    rng = np.random.default_rng(0)
+    picks = vectors[rng.integers(0, len(vectors), queries)]
+    query_vectors = picks + rng.normal(0, picks.std() * 0.3, picks.shape).astype("float32")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        single = FAISSVectorStore(dim=sharded.dim, index_path=os.path.join(workdir, "index.faiss"),
+                                  metadata_path=os.path.join(workdir, "metadata.pkl"),
+                                  index_type=sharded.index_type if len(corpus) >= 256 else "flat",
+                                  pq_m=PQ_M, pq_bits=PQ_BITS, projection=projection, manifest=manifest)
+        single.add_embeddings([{"text": item["text"], "embedding": item["embedding"]} for item in corpus])
+
+        results = {}
+        for name, store in (("single", single), ("sharded", sharded)):
+            timings = []
+            hits = []
+            for query in query_vectors:
+                start = time.perf_counter()
+                hits.append(store.search(query, top_k=k))
+                timings.append((time.perf_counter() - start) * 1000)
+            start = time.perf_counter()
+            store.search_many(query_vectors, top_k=k)
+            batch_ms = (time.perf_counter() - start) * 1000
+            results[name] = (hits, statistics.median(timings), batch_ms)
+
+    single_hits = results["single"][0]
+    sharded_hits = results["sharded"][0]
+    agreement = statistics.mean(
+        len({text for text, _ in a} & {text for text, _ in b}) / max(1, len(a))
+        for a, b in zip(single_hits, sharded_hits))
+    print(f"\n⏱️ Search over {queries} queries, top-{k}:")
+    for name in ("single", "sharded"):
+        _, median_ms, batch_ms = results[name]
+        print(f"   {name:<8} median {median_ms:.2f} ms/query, batch {batch_ms:.1f} ms")
+    print(f"   Top-{k} agreement with the single index: {agreement:.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the sharded clause index")
+    parser.add_argument("--clauses", nargs="*", default=[], help="Clause JSON files")
+    parser.add_argument("--from-index", action="store_true", help="Include the existing single clause index")
+    parser.add_argument("--shards", type=int, default=max(2, VECTOR_SHARDS), help="Number of shards")
+    parser.add_argument("--partition", default=SHARD_PARTITION, choices=PARTITIONS, help="Partitioning")
+    parser.add_argument("--output", default=SHARD_DIR, help="Shard directory")
+    parser.add_argument("--k", type=int, default=5, help="top-k for the comparison")
+    parser.add_argument("--queries", type=int, default=50, help="Queries for the comparison (0 skips it)")
+    args = parser.parse_args()
+
+    if not args.clauses and not args.from_index:
+        print("❌ No clauses: pass --clauses and/or --from-index")
+        sys.exit(1)
+
+    print("🚀 Building sharded clause index")
+    print("=" * 60)
+
+    embedder = Embedder(model_name=EMBEDDING_MODEL_NAME, normalize=NORMALIZE_EMBEDDINGS)
+    projection = EmbeddingProjection.load(PROJECTION_PATH) if PROJECTION_DIM else None
+    manifest = IndexManifest(
+        model=EMBEDDING_MODEL_NAME,
+        dim=embedder.dimension,
+        normalization=embedder.normalization,
+        projection=projection.fingerprint if projection is not None else None
+    )
+    corpus = collect_corpus(args, embedder, manifest)
+    if not corpus:
+        print("❌ No clauses found")
+        sys.exit(1)
+
+    sharded = ShardedVectorStore(
+        dim=embedder.dimension,
+        root=args.output,
+        shards=args.shards,
+        partition=args.partition,
+        index_type=VECTOR_INDEX_TYPE,
+        pq_m=PQ_M,
+        pq_bits=PQ_BITS,
+        mmap=MMAP_INDEXES,
+        projection_path=PROJECTION_PATH if projection is not None else None,
+        manifest=manifest,
+        processes=SHARD_PROCESSES
+    )
+    try:
+        start = time.time()
+        built = sharded.rebuild(corpus)
+        print(f"✅ Built {len(built)} shards ({args.partition} partitioning) with {len(corpus)} clauses "
+              f"in {time.time() - start:.2f}s")
+        for i, (shard, stats) in enumerate(zip(built, sharded.stats())):
+            print(f"   shard-{i}: {shard['vectors']:>6} vectors, {shard['index_type']:<4} "
+                  f"{stats['bytes'] / 1024:.1f} KB")
+        if args.partition != "hash":
+            for key, shard in sorted(sharded.layout["assignment"].items()):
+                print(f"   {key} -> shard-{shard}")
+
+        if args.queries > 0:
+            compare_with_single(sharded, corpus, projection, manifest, args.k, args.queries)
+    finally:
+        sharded.close()
+
+    print(f"\n💾 Shards saved under {args.output}; set VECTOR_SHARDS={args.shards} "
+          f"SHARD_PARTITION={args.partition} to serve them")
+
+
+if __name__ == "__main__":
+    main()
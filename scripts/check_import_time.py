@@ -0,0 +1,117 @@
+# scripts/check_import_time.py
+
+"""
+Import-time budget for the API's cold start.
+
+Imports the API module (and any other --module) in fresh interpreters under
+`python -X importtime` and fails when:
+  - a heavy dependency (FAISS, torch, sentence-transformers, PyMuPDF,
+    docx2txt, BeautifulSoup, requests, psycopg2, ...) is imported eagerly;
+    these are imported where they are first used (see app/lazy_import.py)
+  - the module's cumulative import time, best of --runs, is over --budget-ms
+
+Prints the slowest imports and, for each offending heavy module, the chain
+of imports that pulled it in. Exit code 1 on failure, so it can gate a build.
+
+Usage:
+    python scripts/check_import_time.py
+    python scripts/check_import_time.py --module api.main app.executors --budget-ms 1500 --runs 5
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Top-level packages that must not be imported while the API module is imported
+HEAVY_MODULES = (
+    "faiss", "torch", "sentence_transformers", "transformers", "tokenizers", "huggingface_hub",
+    "fitz", "pymupdf", "docx2txt", "bs4", "requests", "psycopg2", "scipy", "sklearn", "pandas",
+)
+
+# (depth, module, self us, cumulative us) in the order -X importtime prints them
+ImportRecord = Tuple[int, str, int, int]
+
+
+def measure(module: str) -> List[ImportRecord]:
+    """Import `module` in a fresh interpreter and parse its -X importtime report"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=PROJECT_ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    records = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        records.append((depth, name.strip(), int(self_us), int(cumulative_us)))
+    return records
+
+
+def import_chain(records: List[ImportRecord], index: int) -> List[str]:
+    """Modules from records[index] up to the top-level import that pulled it in"""
+    # A module's report line follows those of the modules it imported
+    depth, name, _, _ = records[index]
+    chain = [name]
+    for parent_depth, parent, _, _ in records[index + 1:]:
+        if parent_depth < depth:
+            chain.append(parent)
+            depth = parent_depth
+            if depth == 0:
+                break
+    return chain
+
+
+def check(module: str, budget_ms: float, runs: int, top: int) -> bool:
+    print(f"\n📦 import {module}")
+    best, best_ms = None, None
+    for _ in range(max(1, runs)):
+        records = measure(module)
+        total_ms = next((cumulative for _, name, _, cumulative in records if name == module), 0) / 1000
+        if best_ms is None or total_ms < best_ms:
+            best, best_ms = records, total_ms
+
+    print("   Slowest imports (self time):")
+    for _, name, self_us, cumulative_us in sorted(best, key=lambda record: -record[2])[:top]:
+        print(f"   {self_us / 1000:>8.1f} ms self {cumulative_us / 1000:>8.1f} ms total  {name}")
+
+    ok = True
+    heavy: Dict[str, List[str]] = {}
+    for i, (_, name, _, _) in enumerate(best):
+        package = name.split(".")[0]
+        if package in HEAVY_MODULES and package not in heavy:
+            heavy[package] = import_chain(best, i)
+    for package, chain in heavy.items():
+        ok = False
+        print(f"   ❌ {package} is imported eagerly: {' <- '.join(chain)}")
+
+    if best_ms > budget_ms:
+        ok = False
+        print(f"   ❌ {best_ms:.0f} ms (best of {runs}) is over the {budget_ms:.0f} ms budget")
+    else:
+        print(f"   {'✅' if ok else '⚠️'} {best_ms:.0f} ms (best of {runs}), budget {budget_ms:.0f} ms")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the API's import time and eager heavy imports")
+    parser.add_argument("--module", nargs="+", default=["api.main"], help="Modules to import")
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("IMPORT_BUDGET_MS", "1500")),
+                        help="Max cumulative import time per module")
+    parser.add_argument("--runs", type=int, default=3, help="Imports per module; the fastest one counts")
+    parser.add_argument("--top", type=int, default=10, help="Slowest imports to list")
+    args = parser.parse_args()
+
+    results = [check(module, args.budget_ms, args.runs, args.top) for module in args.module]
+    if not all(results):
+        print("\n❌ Import-time check failed")
+        sys.exit(1)
+    print("\n✅ Import-time check passed")
+
+
+if __name__ == "__main__":
+    main()
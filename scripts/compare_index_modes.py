@@ -0,0 +1,160 @@
+# scripts/compare_index_modes.py
+
+"""
+Compare FAISSVectorStore index modes on the same vectors.
+
+Builds every compressed variant (fp16, sq8, pq, opq) from one set of
+embeddings and reports index size, build time, per-query search latency and
+recall@k against the exact flat index.
+
+Embeddings come from an existing index (--index) or from chunks of a
+synthetic policy PDF embedded with the configured model.
+
+Usage:
+    python scripts/compare_index_modes.py --pages 60 --k 5
+    python scripts/compare_index_modes.py --index models/faiss_index/index.faiss --output index_modes.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import faiss
+import numpy as np
+
+from app.vector_store import FAISSVectorStore, INDEX_TYPES
+from config import EMBEDDING_MODEL_NAME, PQ_M, PQ_BITS
+
+
+def load_index_vectors(index_path: str) -> np.ndarray:
+    index = faiss.read_index(index_path)
+    return index.reconstruct_n(0, index.ntotal).astype("float32")
+
+
+def embed_synthetic_corpus(pages: int, workdir: str):
+    """Embed chunks of a synthetic policy PDF plus the test queries"""
+    from app.document_processor import DocumentProcessor
+    from app.embedder import Embedder
+    from benchmark_pipeline import make_policy_pdf, _load_queries
+
+    processor = DocumentProcessor()
+    embedder = Embedder(model_name=EMBEDDING_MODEL_NAME)
+    pdf_path = make_policy_pdf(os.path.join(workdir, "policy.pdf"), pages)
+    chunks = processor.chunk_text(processor.extract_text(pdf_path))
+    vectors = np.asarray(embedder.get_embeddings(chunks), dtype="float32")
+    queries = np.asarray(embedder.get_embeddings(_load_queries()), dtype="float32")
+    return vectors, queries
+
+
+def sample_queries(vectors: np.ndarray, count: int, seed: int = 0) -> np.ndarray:
+    """Perturbed corpus vectors, so queries land near real neighbourhoods"""
+    rng = np.random.default_rng(seed)
+    picks = vectors[rng.integers(0, len(vectors), count)]
+    noise = rng.normal(0, picks.std() * 0.3, picks.shape).astype("float32")
+    return picks + noise
+
+
+def recall_at_k(exact: np.ndarray, approx: np.ndarray, k: int) -> float:
+    hits = [len(set(e[:k]) & set(a[:k])) / k for e, a in zip(exact, approx)]
+    return float(np.mean(hits))
+
+
+def evaluate_mode(index_type: str, vectors: np.ndarray, queries: np.ndarray, k: int,
+                  workdir: str, pq_m: int, pq_bits: int) -> dict:
+    store = FAISSVectorStore(
+        dim=vectors.shape[1],
+        index_path=os.path.join(workdir, f"{index_type}.faiss"),
+        metadata_path=os.path.join(workdir, f"{index_type}.pkl"),
+        index_type=index_type,
+        pq_m=pq_m,
+        pq_bits=pq_bits,
+    )
+    start = time.perf_counter()
+    store.train(vectors)
+    store.index.add(vectors)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    # One query at a time, as the API searches
+    latencies = []
+    neighbours = []
+    for query in queries:
+        start = time.perf_counter()
+        _, indices = store.index.search(query.reshape(1, -1), k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        neighbours.append(indices[0])
+
+    size = store.memory_bytes()
+    return {
+        "index_type": index_type,
+        "bytes": size,
+        "bytes_per_vector": round(size / len(vectors), 1),
+        "build_ms": round(build_ms, 2),
+        "search_ms": {
+            "p50": round(statistics.median(latencies), 4),
+            "p95": round(float(np.percentile(latencies, 95)), 4),
+        },
+        "neighbours": np.array(neighbours),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare compressed FAISS index modes against the exact index")
+    parser.add_argument("--index", help="Existing FAISS index to take vectors from")
+    parser.add_argument("--pages", type=int, default=60, help="Synthetic PDF size when --index is not given")
+    parser.add_argument("--modes", nargs="+", default=list(INDEX_TYPES), choices=INDEX_TYPES)
+    parser.add_argument("--k", type=int, default=5, help="Neighbours for recall@k")
+    parser.add_argument("--queries", type=int, default=200, help="Extra perturbed-corpus queries")
+    parser.add_argument("--pq-m", type=int, default=PQ_M, help="PQ sub-vectors per embedding")
+    parser.add_argument("--pq-bits", type=int, default=PQ_BITS, help="Bits per PQ code")
+    parser.add_argument("--output", help="Write the report as JSON")
+    args = parser.parse_args()
+
+    print("🚀 Comparing vector index modes")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        if args.index:
+            vectors = load_index_vectors(args.index)
+            queries = np.empty((0, vectors.shape[1]), dtype="float32")
+        else:
+            vectors, queries = embed_synthetic_corpus(args.pages, workdir)
+        queries = np.vstack([queries, sample_queries(vectors, args.queries)])
+        print(f"📊 {len(vectors)} vectors of dim {vectors.shape[1]}, {len(queries)} queries")
+
+        modes = ["flat"] + [m for m in args.modes if m != "flat"]
+        results = []
+        for mode in modes:
+            try:
+                results.append(evaluate_mode(mode, vectors, queries, args.k, workdir,
+                                             args.pq_m, args.pq_bits))
+            except ValueError as e:
+                print(f"⚠️ Skipping {mode}: {e}")
+
+    exact = results[0]
+    exact_neighbours = exact["neighbours"]
+    for r in results:
+        r["recall_at_k"] = round(recall_at_k(exact_neighbours, r.pop("neighbours"), args.k), 4)
+        r["compression"] = round(exact["bytes"] / r["bytes"], 2)
+
+    print(f"\n{'mode':<6} {'bytes/vec':>10} {'ratio':>7} {'build ms':>10} {'p50 ms':>9} "
+          f"{'p95 ms':>9} {'recall@' + str(args.k):>10}")
+    for r in results:
+        print(f"{r['index_type']:<6} {r['bytes_per_vector']:>10.1f} {r['compression']:>6.1f}x "
+              f"{r['build_ms']:>10.1f} {r['search_ms']['p50']:>9.4f} {r['search_ms']['p95']:>9.4f} "
+              f"{r['recall_at_k']:>10.3f}")
+
+    if args.output:
+        report = {"vectors": len(vectors), "dim": int(vectors.shape[1]), "k": args.k,
+                  "pq_m": args.pq_m, "pq_bits": args.pq_bits, "results": results}
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Saved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
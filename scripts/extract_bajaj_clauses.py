@@ -3,78 +3,28 @@
 import sys
 import os
 import json
-import re
+import argparse
+import time
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from app.document_processor import DocumentProcessor
+import numpy as np
+from app.clause_extractor import ClauseExtractor
+from app.document_store import file_sha256
 from app.embedder import Embedder
-from app.vector_store import FAISSVectorStore
+from app.index_manifest import text_hash
+from populate_database import clause_embeddings, open_clause_index
 import psycopg2
-from config import DATABASE_URL, EMBEDDING_MODEL_NAME
+from config import DATABASE_URL, EMBEDDING_MODEL_NAME, NORMALIZE_EMBEDDINGS
 
-def extract_clauses_from_bajaj_pdf(pdf_path):
+def extract_clauses_from_bajaj_pdf(pdf_path, processes=None):
     """Extract policy clauses from Bajaj PDF document"""
     
-    # Initialize document processor
-    doc_processor = DocumentProcessor()
-    
-    # Extract text from PDF
-    print(f"📄 Extracting text from: {pdf_path}")
-    text = doc_processor.extract_text(pdf_path)
-    
-    # Split into sentences and filter for policy clauses
-    sentences = text.split('.')
-    clauses = []
-    
-    # Keywords that indicate policy clauses
-    clause_keywords = [
-        'exclusion', 'excluded', 'not covered', 'waiting period', 'coverage', 'covered',
-        'benefit', 'claim', 'premium', 'policy', 'insured', 'treatment', 'medical',
-        'hospitalization', 'condition', 'illness', 'accident', 'death', 'maternity',
-        'dental', 'pre-existing', 'deductible', 'copay', 'sum insured'
-    ]
-    
-    clause_counter = 1
-    
-    for sentence in sentences:
-        sentence = sentence.strip()
-        
-        # Skip very short sentences
-        if len(sentence) < 50:
-            continue
-            
-        # Check if sentence contains policy-related keywords
-        sentence_lower = sentence.lower()
-        if any(keyword in sentence_lower for keyword in clause_keywords):
-            
-            # Determine clause type based on content
-            clause_type = 'condition'  # default
-            if any(word in sentence_lower for word in ['exclusion', 'excluded', 'not covered']):
-                clause_type = 'exclusion'
-            elif any(word in sentence_lower for word in ['coverage', 'covered', 'benefit']):
-                clause_type = 'coverage'
-            elif any(word in sentence_lower for word in ['waiting period', 'condition', 'require']):
-                clause_type = 'condition'
-                
-            # Determine section
-            section = 'General'
-            if 'exclusion' in sentence_lower:
-                section = 'Exclusions'
-            elif any(word in sentence_lower for word in ['benefit', 'coverage']):
-                section = 'Benefits'
-            elif 'condition' in sentence_lower:
-                section = 'Conditions'
-                
-            clause = {
-                'clause_text': sentence,
-                'section': section,
-                'code': f'Bajaj-{clause_type.title()}-{clause_counter:02d}',
-                'clause_type': clause_type,
-                'policy_type': 'health'
-            }
-            
-            clauses.append(clause)
-            clause_counter += 1
+    # Pages are parsed and segmented in parallel; clauses keep their page and line
+    print(f"📄 Extracting clauses from: {pdf_path}")
+    start = time.time()
+    clauses = ClauseExtractor(policy_type='health', code_prefix='Bajaj', processes=processes).extract(pdf_path)
+    print(f"⏱️ Extraction took {time.time() - start:.2f}s")
     
     return clauses
 
@@ -84,16 +34,8 @@ def save_bajaj_clauses_to_json(clauses, output_file):
         json.dump(clauses, f, indent=2, ensure_ascii=False)
     print(f"💾 Saved {len(clauses)} clauses to {output_file}")
 
-def populate_database_with_bajaj_clauses(clauses):
-    """Populate database with Bajaj clauses and embeddings"""
-    
-    # Initialize embedder
-    embedder = Embedder(model_name=EMBEDDING_MODEL_NAME)
-    
-    # Generate embeddings
-    clause_texts = [clause["clause_text"] for clause in clauses]
-    print(f"🧠 Generating embeddings for {len(clause_texts)} clauses...")
-    embeddings = embedder.get_embeddings(clause_texts)
+def populate_database_with_bajaj_clauses(clauses, pdf_path, embeddings):
+    """Populate database with Bajaj clauses and embeddings, linked to the source document by page and line"""
     
     # Connect to database
     conn = psycopg2.connect(DATABASE_URL)
@@ -101,16 +43,31 @@ def populate_database_with_bajaj_clauses(clauses):
     
     try:
         # Clear existing data
+        cursor.execute("""
+            DELETE FROM document_clauses WHERE clause_id IN
+                (SELECT id FROM policy_clauses WHERE code LIKE 'Bajaj-%')
+        """)
         cursor.execute("DELETE FROM policy_clauses WHERE code LIKE 'Bajaj-%'")
         
+        # Source document the clauses were extracted from
+        content_hash = file_sha256(pdf_path)
+        cursor.execute("""
+            INSERT INTO policy_documents (document_name, document_type, file_path, version, content_hash)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (content_hash) DO UPDATE SET file_path = EXCLUDED.file_path
+            RETURNING id
+        """, (os.path.basename(pdf_path), "health_policy", pdf_path, content_hash[:20], content_hash))
+        document_id = cursor.fetchone()[0]
+        
         # Insert new clauses
-        for i, clause in enumerate(clauses):
-            embedding_json = json.dumps(embeddings[i].tolist())
+        for clause in clauses:
+            embedding_json = json.dumps(embeddings[text_hash(clause["clause_text"])].tolist())
             
             cursor.execute("""
                 INSERT INTO policy_clauses 
                 (clause_text, section, code, clause_type, policy_type, embedding)
                 VALUES (%s, %s, %s, %s, %s, %s)
+                RETURNING id
             """, (
                 clause["clause_text"],
                 clause["section"],
@@ -119,6 +76,12 @@ def populate_database_with_bajaj_clauses(clauses):
                 clause["policy_type"],
                 embedding_json
             ))
+            clause_id = cursor.fetchone()[0]
+            cursor.execute("""
+                INSERT INTO document_clauses (document_id, clause_id, page_number, line_number)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (document_id, clause_id) DO NOTHING
+            """, (document_id, clause_id, clause["page_number"], clause["line_number"]))
         
         conn.commit()
         print(f"✅ Successfully inserted {len(clauses)} Bajaj clauses with embeddings")
@@ -131,28 +94,32 @@ def populate_database_with_bajaj_clauses(clauses):
         cursor.close()
         conn.close()
 
-def update_faiss_index_with_bajaj_clauses(clauses):
-    """Update FAISS index with Bajaj clauses"""
-    
-    # Initialize components
-    embedder = Embedder(model_name=EMBEDDING_MODEL_NAME)
-    vector_store = FAISSVectorStore(
-        dim=384,
-        index_path="models/faiss_index/index.faiss",
-        metadata_path="models/faiss_index/metadata.pkl"
-    )
-    
-    # Generate embeddings
-    embedding_data = embedder.embed_and_pack([clause["clause_text"] for clause in clauses])
-    
-    # Add to vector store
-    vector_store.add_embeddings(embedding_data)
+def update_faiss_index_with_bajaj_clauses(clauses, embedder, embeddings):
+    """Update FAISS index with Bajaj clauses, using the vectors written to the database"""
+    
+    # Upsert by clause code next to the other clauses; only rows of new or edited clauses are written
+    vector_store = open_clause_index(embedder)
+    codes = [clause["code"] for clause in clauses]
+    stats = vector_store.sync_ids(codes, [clause["clause_text"] for clause in clauses],
+                                  lambda texts: np.array([embeddings[text_hash(text)] for text in texts]),
+                                  attributes=clauses, keep_existing=True)
+    # Bajaj clauses that are no longer extracted (their rows were deleted from policy_clauses too)
+    wanted = set(codes)
+    removed = vector_store.remove([clause_id for clause_id in vector_store.live_ids()
+                                   if clause_id.startswith("Bajaj-") and clause_id not in wanted])
+    vector_store.wait_for_compaction()
+    print(f"♻️ {stats['unchanged']} unchanged, {stats['inserted']} inserted, {stats['replaced']} replaced, "
+          f"{removed} removed")
     
     print(f"✅ Successfully updated FAISS index with {len(clauses)} Bajaj clauses")
 
 def main():
+    parser = argparse.ArgumentParser(description="Extract policy clauses from a Bajaj policy wording")
     # Path to your Bajaj PDF
-    bajaj_pdf_path = r"c:\Users\saini\Downloads\BAJHLIP23020V012223.pdf"
+    parser.add_argument("pdf", nargs="?", default=r"c:\Users\saini\Downloads\BAJHLIP23020V012223.pdf")
+    parser.add_argument("--processes", type=int, help="Extraction worker processes (default: one per core)")
+    args = parser.parse_args()
+    bajaj_pdf_path = args.pdf
     
     if not os.path.exists(bajaj_pdf_path):
         print(f"❌ PDF file not found: {bajaj_pdf_path}")
@@ -161,7 +128,7 @@ def main():
     print("🚀 Processing Bajaj Insurance Policy Document...")
     
     # Extract clauses from PDF
-    clauses = extract_clauses_from_bajaj_pdf(bajaj_pdf_path)
+    clauses = extract_clauses_from_bajaj_pdf(bajaj_pdf_path, args.processes)
     
     if not clauses:
         print("❌ No clauses extracted from PDF")
@@ -172,20 +139,24 @@ def main():
     # Save to JSON for review
     save_bajaj_clauses_to_json(clauses, "data/bajaj_extracted_clauses.json")
     
+    # Embed once, before the old rows are deleted, with the normalization the FAISS index uses
+    embedder = Embedder(model_name=EMBEDDING_MODEL_NAME, normalize=NORMALIZE_EMBEDDINGS)
+    embeddings = clause_embeddings(embedder, clauses)
+    
     # Populate database
     print("💾 Populating database with Bajaj clauses...")
-    populate_database_with_bajaj_clauses(clauses)
+    populate_database_with_bajaj_clauses(clauses, bajaj_pdf_path, embeddings)
     
     # Update FAISS index
     print("🔍 Updating FAISS vector index...")
-    update_faiss_index_with_bajaj_clauses(clauses)
+    update_faiss_index_with_bajaj_clauses(clauses, embedder, embeddings)
     
     print("✅ Bajaj policy processing complete!")
     print("\nSample extracted clauses:")
     for i, clause in enumerate(clauses[:3]):
         print(f"\n{i+1}. Type: {clause['clause_type']}")
         print(f"   Section: {clause['section']}")
-        print(f"   Code: {clause['code']}")
+        print(f"   Code: {clause['code']} (page {clause['page_number']}, line {clause['line_number']})")
         print(f"   Text: {clause['clause_text'][:100]}...")
 
 if __name__ == "__main__":
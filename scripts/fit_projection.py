@@ -0,0 +1,184 @@
+# scripts/fit_projection.py
+
+"""
+Fit a PCA (optionally whitened) projection on the clause corpus and report how
+well retrieval in the reduced dimension agrees with full-dimension search.
+
+The corpus is the text of the existing clause index (metadata.pkl), plus
+chunks of any --pdf files. Every candidate dimension is evaluated with the
+same queries: top-1 agreement and recall@k against exact full-dimension
+search, per-query latency and index size. The projection for --dim is saved
+to PROJECTION_PATH; --rebuild re-indexes the corpus with it.
+
+Usage:
+    python scripts/fit_projection.py --dims 64 128 256 --dim 128
+    python scripts/fit_projection.py --dim 128 --whiten --rebuild
+"""
+
+import argparse
+import json
+import os
+import pickle
+import statistics
+import sys
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from app.document_processor import DocumentProcessor
+from app.embedder import Embedder
+from app.index_manifest import IndexManifest
+from app.vector_store import FAISSVectorStore, EmbeddingProjection
+from config import EMBEDDING_MODEL_NAME, PROJECTION_PATH, VECTOR_INDEX_TYPE, PQ_M, PQ_BITS, NORMALIZE_EMBEDDINGS
+
+INDEX_PATH = "models/faiss_index/index.faiss"
+METADATA_PATH = "models/faiss_index/metadata.pkl"
+TEST_QUERIES_PATH = "data/test_queries.json"
+
+
+def load_corpus(metadata_path: str, pdf_paths: list) -> list:
+    texts = []
+    if os.path.exists(metadata_path):
+        with open(metadata_path, "rb") as f:
+            texts.extend(pickle.load(f))
+    processor = DocumentProcessor()
+    for path in pdf_paths:
+        texts.extend(processor.chunk_text(processor.extract_text(path)))
+    return texts
+
+
+def load_queries(embedder: Embedder, corpus: np.ndarray, extra: int, seed: int = 0) -> np.ndarray:
+    """Test queries plus perturbed corpus vectors, so queries land near real neighbourhoods"""
+    with open(TEST_QUERIES_PATH, "r") as f:
+        queries = [np.asarray(embedder.get_embeddings([test["query"] for test in json.load(f)]), dtype="float32")]
+    if extra:
+        rng = np.random.default_rng(seed)
+        picks = corpus[rng.integers(0, len(corpus), extra)]
+        queries.append(picks + rng.normal(0, picks.std() * 0.3, picks.shape).astype("float32"))
+    return np.vstack(queries)
+
+
+def search_all(store: FAISSVectorStore, queries: np.ndarray, k: int):
+    latencies = []
+    neighbours = []
+    projected = store.project(queries)
+    for query in projected:
+        start = time.perf_counter()
+        _, indices = store.index.search(query.reshape(1, -1), k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        neighbours.append(indices[0])
+    return np.array(neighbours), latencies
+
+
+def evaluate(embeddings: np.ndarray, queries: np.ndarray, dims: list, k: int, whiten: bool,
+             workdir: str) -> tuple:
+    def build(projection, name):
+        store = FAISSVectorStore(dim=embeddings.shape[1], index_path=os.path.join(workdir, f"{name}.faiss"),
+                                 metadata_path=os.path.join(workdir, f"{name}.pkl"), projection=projection)
+        store.index.add(store.project(embeddings))
+        return store
+
+    full = build(None, "full")
+    exact, full_latencies = search_all(full, queries, k)
+    results = [{
+        "dim": embeddings.shape[1],
+        "bytes": full.memory_bytes(),
+        "search_p50_ms": round(statistics.median(full_latencies), 4),
+        "top1_agreement": 1.0,
+        "recall_at_k": 1.0,
+    }]
+
+    projections = {}
+    for dim in dims:
+        try:
+            projection = EmbeddingProjection.fit(embeddings, dim, whiten=whiten)
+        except ValueError as e:
+            print(f"⚠️ Skipping dim {dim}: {e}")
+            continue
+        projections[dim] = projection
+        store = build(projection, f"pca{dim}")
+        approx, latencies = search_all(store, queries, k)
+        results.append({
+            "dim": dim,
+            "bytes": store.memory_bytes(),
+            "search_p50_ms": round(statistics.median(latencies), 4),
+            "top1_agreement": round(float(np.mean(exact[:, 0] == approx[:, 0])), 4),
+            "recall_at_k": round(float(np.mean([len(set(e) & set(a)) / k for e, a in zip(exact, approx)])), 4),
+        })
+    return results, projections
+
+
+def rebuild_index(texts: list, embeddings: np.ndarray, projection: EmbeddingProjection, embedder: Embedder):
+    """Re-index the clause corpus with the projection (replaces the existing index)"""
+    store = FAISSVectorStore(
+        dim=embeddings.shape[1],
+        index_path=INDEX_PATH,
+        metadata_path=METADATA_PATH,
+        index_type=VECTOR_INDEX_TYPE,
+        pq_m=PQ_M,
+        pq_bits=PQ_BITS,
+        projection=projection,
+        manifest=IndexManifest(EMBEDDING_MODEL_NAME, embeddings.shape[1], embedder.normalization,
+                               projection=projection.fingerprint)
+    )
+    store.add_embeddings([{"text": text, "embedding": embedding} for text, embedding in zip(texts, embeddings)])
+    print(f"✅ Rebuilt {INDEX_PATH} with {len(texts)} clauses at {projection.dim_out} dimensions")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit a PCA projection for the clause index")
+    parser.add_argument("--dim", type=int, default=128, help="Dimension of the projection to save")
+    parser.add_argument("--dims", type=int, nargs="+", help="Dimensions to evaluate (default: --dim)")
+    parser.add_argument("--whiten", action="store_true", help="Scale components to unit variance")
+    parser.add_argument("--pdf", nargs="*", default=[], help="Extra PDFs whose chunks join the corpus")
+    parser.add_argument("--k", type=int, default=5, help="Neighbours for recall@k")
+    parser.add_argument("--queries", type=int, default=200, help="Extra perturbed-corpus queries")
+    parser.add_argument("--output", default=PROJECTION_PATH, help="Where to save the projection")
+    parser.add_argument("--report", help="Write the agreement report as JSON")
+    parser.add_argument("--rebuild", action="store_true", help="Re-index the clause corpus with the projection")
+    args = parser.parse_args()
+    dims = sorted(set((args.dims or []) + [args.dim]))
+
+    print("🚀 Fitting embedding projection")
+    print("=" * 60)
+
+    texts = load_corpus(METADATA_PATH, args.pdf)
+    if not texts:
+        print(f"❌ No corpus: {METADATA_PATH} is missing and no --pdf was given")
+        sys.exit(1)
+    embedder = Embedder(model_name=EMBEDDING_MODEL_NAME, normalize=NORMALIZE_EMBEDDINGS)
+    embeddings = np.asarray(embedder.get_embeddings(texts), dtype="float32")
+    queries = load_queries(embedder, embeddings, args.queries)
+    print(f"📊 {len(texts)} clauses of dim {embeddings.shape[1]}, {len(queries)} queries")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        results, projections = evaluate(embeddings, queries, dims, args.k, args.whiten, workdir)
+
+    print(f"\n{'dim':>5} {'KB':>9} {'p50 ms':>9} {'top-1':>7} {'recall@' + str(args.k):>10}")
+    for r in results:
+        print(f"{r['dim']:>5} {r['bytes'] / 1024:>9.1f} {r['search_p50_ms']:>9.4f} "
+              f"{r['top1_agreement']:>7.3f} {r['recall_at_k']:>10.3f}")
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump({"model": EMBEDDING_MODEL_NAME, "clauses": len(texts), "whiten": args.whiten,
+                       "k": args.k, "results": results}, f, indent=2)
+        print(f"💾 Saved report to {args.report}")
+
+    projection = projections.get(args.dim)
+    if projection is None:
+        print(f"❌ Could not fit a {args.dim}-d projection")
+        sys.exit(1)
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    projection.save(args.output)
+    print(f"💾 Saved {embeddings.shape[1]}->{args.dim} projection to {args.output}")
+    print(f"   Set PROJECTION_DIM={args.dim} to use it")
+
+    if args.rebuild:
+        rebuild_index(texts, embeddings, projection, embedder)
+
+
+if __name__ == "__main__":
+    main()
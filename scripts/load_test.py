@@ -0,0 +1,326 @@
+# scripts/load_test.py
+
+"""
+End-to-end load test for the FastAPI app.
+
+Starts a local static file server hosting synthetic policy PDFs, launches the
+API under uvicorn (or targets an already running instance) and drives
+/api/v1/hackrx/run or /query/ at increasing load levels. For every level it
+records p50/p95/p99 latency, throughput, error rate and server RSS over time,
+then prints a saturation curve.
+
+Usage:
+    python scripts/load_test.py --endpoint hackrx --concurrency 1 2 4 8 --duration 30
+    python scripts/load_test.py --endpoint query --rate 0.5 1 2 4 --duration 60
+    python scripts/load_test.py --base-url http://localhost:8000 --server-pid 1234
+"""
+
+import argparse
+import functools
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import requests
+
+from benchmark_pipeline import make_policy_pdf, _load_queries
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_document_server(directory: str):
+    """Serve `directory` over HTTP on a free local port, returns (server, base_url)"""
+    handler = functools.partial(_QuietHandler, directory=directory)
+    server = ThreadingHTTPServer(("127.0.0.1", _free_port()), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def start_api_server(port: int, api_key: str, workers: int):
+    """Launch the API under uvicorn and wait until the health check answers"""
+    env = dict(os.environ, BAJAJ_API_KEY=api_key)
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api.main:app",
+         "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers),
+         "--log-level", "warning"],
+        cwd=PROJECT_ROOT, env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("API server exited during startup")
+        try:
+            if requests.get(f"{base_url}/", timeout=2).ok:
+                return process, base_url
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError("API server did not become healthy within 120s")
+
+
+def _child_pids(pid: int) -> list:
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "r") as f:
+                # Field 4 is the parent pid; comm (field 2) may contain spaces
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == pid:
+            children.append(int(entry))
+    return children
+
+
+def read_rss_mb(pid: int) -> float:
+    """Resident set size of pid plus its direct children (uvicorn workers)"""
+    total_kb = 0
+    for p in [pid] + _child_pids(pid):
+        try:
+            with open(f"/proc/{p}/status", "r") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total_kb += int(line.split()[1])
+                        break
+        except OSError:
+            continue
+    return round(total_kb / 1024, 2)
+
+
+class RSSSampler(threading.Thread):
+    """Background thread that samples server RSS at a fixed interval"""
+
+    def __init__(self, pid: int, interval: float = 0.5):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self._stop_event = threading.Event()
+        self._start = time.time()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.samples.append((round(time.time() - self._start, 2), read_rss_mb(self.pid)))
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    lower = int(k)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (k - lower)
+
+
+def make_request_fn(endpoint: str, base_url: str, doc_urls: list, pdf_paths: list,
+                    queries: list, questions_per_request: int, api_key: str, timeout: float):
+    """Build a zero-argument callable that fires one request and returns the status code"""
+    headers = {"Authorization": f"Bearer {api_key}"}
+
+    if endpoint == "hackrx":
+        def fire():
+            data = {
+                "documents": random.choice(doc_urls),
+                "questions": json.dumps(random.sample(queries, min(questions_per_request, len(queries)))),
+            }
+            return requests.post(f"{base_url}/api/v1/hackrx/run", data=data,
+                                 headers=headers, timeout=timeout).status_code
+        return fire
+
+    def fire():
+        pdf_path = random.choice(pdf_paths)
+        params = {"query": random.choice(queries), "age": 30, "policy_duration": 100}
+        with open(pdf_path, "rb") as f:
+            files = {"file": (os.path.basename(pdf_path), f, "application/pdf")}
+            return requests.post(f"{base_url}/query/", params=params, files=files,
+                                 headers=headers, timeout=timeout).status_code
+    return fire
+
+
+def run_level(fire, duration: float, concurrency: int = None, rate: float = None,
+              max_in_flight: int = 64) -> dict:
+    """
+    Run one load level.
+    Closed loop: `concurrency` workers each send requests back-to-back.
+    Open loop: Poisson arrivals at `rate` requests/second, capped at max_in_flight.
+    """
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one():
+        nonlocal errors
+        start = time.perf_counter()
+        try:
+            ok = 200 <= fire() < 300
+        except requests.RequestException:
+            ok = False
+        elapsed = (time.perf_counter() - start) * 1000
+        with lock:
+            if ok:
+                latencies.append(elapsed)
+            else:
+                errors += 1
+
+    started = time.time()
+    end = started + duration
+    if concurrency:
+        def worker():
+            while time.time() < end:
+                one()
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    else:
+        with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+            next_arrival = started
+            while next_arrival < end:
+                time.sleep(max(0.0, next_arrival - time.time()))
+                pool.submit(one)
+                next_arrival += random.expovariate(rate)
+    wall = time.time() - started
+
+    total = len(latencies) + errors
+    return {
+        "concurrency": concurrency,
+        "rate": rate,
+        "requests": total,
+        "errors": errors,
+        "error_rate": round(errors / total, 4) if total else 0.0,
+        "throughput_rps": round(len(latencies) / wall, 3) if wall else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+    }
+
+
+def print_saturation_curve(levels: list):
+    print("\n📈 Saturation curve")
+    print("-" * 96)
+    print(f"{'load':>10} {'req':>6} {'err%':>6} {'rps':>8} {'p50':>9} {'p95':>9} {'p99':>9} "
+          f"{'rss':>8}  throughput")
+    max_rps = max((lvl["throughput_rps"] for lvl in levels), default=0) or 1
+    for lvl in levels:
+        load = f"c={lvl['concurrency']}" if lvl["concurrency"] else f"λ={lvl['rate']}/s"
+        bar = "█" * int(30 * lvl["throughput_rps"] / max_rps)
+        print(f"{load:>10} {lvl['requests']:>6} {lvl['error_rate'] * 100:>5.1f}% "
+              f"{lvl['throughput_rps']:>8.2f} {lvl['p50_ms']:>8.0f}ms {lvl['p95_ms']:>8.0f}ms "
+              f"{lvl['p99_ms']:>8.0f}ms {lvl.get('max_rss_mb', 0):>6.0f}MB  {bar}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the policy query API")
+    parser.add_argument("--endpoint", choices=["hackrx", "query"], default="hackrx")
+    parser.add_argument("--concurrency", type=int, nargs="+",
+                        help="Closed-loop concurrency levels (default: 1 2 4 8)")
+    parser.add_argument("--rate", type=float, nargs="+",
+                        help="Open-loop arrival rates in requests/second instead of concurrency")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds per load level")
+    parser.add_argument("--questions", type=int, default=5, help="Questions per hackrx request")
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 40],
+                        help="Page counts of the hosted sample PDFs")
+    parser.add_argument("--base-url", help="Target an already running API instead of launching one")
+    parser.add_argument("--server-pid", type=int, help="PID to sample RSS from when using --base-url")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers when launching the API")
+    parser.add_argument("--api-key", default=os.getenv("BAJAJ_API_KEY", "load-test-key"))
+    parser.add_argument("--timeout", type=float, default=120, help="Per-request timeout in seconds")
+    parser.add_argument("--output", help="Write the full report as JSON")
+    args = parser.parse_args()
+
+    if not args.concurrency and not args.rate:
+        args.concurrency = [1, 2, 4, 8]
+
+    print("🚀 Load testing the policy query API")
+    print("=" * 60)
+
+    with tempfile.TemporaryDirectory() as docs_dir:
+        pdf_paths = [make_policy_pdf(os.path.join(docs_dir, f"policy_{p}p.pdf"), p, seed=p)
+                     for p in args.pages]
+        doc_server, doc_base = start_document_server(docs_dir)
+        doc_urls = [f"{doc_base}/{os.path.basename(p)}" for p in pdf_paths]
+        print(f"📄 Serving {len(doc_urls)} sample PDFs from {doc_base}")
+
+        api_process = None
+        if args.base_url:
+            base_url, server_pid = args.base_url.rstrip("/"), args.server_pid
+        else:
+            api_process, base_url = start_api_server(_free_port(), args.api_key, args.workers)
+            server_pid = api_process.pid
+            print(f"🌐 API running at {base_url} (pid {server_pid})")
+
+        fire = make_request_fn(args.endpoint, base_url, doc_urls, pdf_paths, _load_queries(),
+                               args.questions, args.api_key, args.timeout)
+        sampler = RSSSampler(server_pid) if server_pid else None
+        if sampler:
+            sampler.start()
+
+        levels = []
+        try:
+            for level in (args.concurrency or args.rate):
+                label = f"concurrency={level}" if args.concurrency else f"rate={level}/s"
+                print(f"⏱️  Running {label} for {args.duration:.0f}s...")
+                mark = len(sampler.samples) if sampler else 0
+                if args.concurrency:
+                    result = run_level(fire, args.duration, concurrency=level)
+                else:
+                    result = run_level(fire, args.duration, rate=level)
+                if sampler:
+                    window = [rss for _, rss in sampler.samples[mark:]]
+                    result["max_rss_mb"] = max(window, default=0.0)
+                levels.append(result)
+        finally:
+            if sampler:
+                sampler.stop()
+            doc_server.shutdown()
+            if api_process:
+                api_process.terminate()
+                api_process.wait(timeout=30)
+
+    print_saturation_curve(levels)
+
+    if args.output:
+        report = {
+            "endpoint": args.endpoint,
+            "duration_s": args.duration,
+            "levels": levels,
+            "rss_timeline": sampler.samples if sampler else [],
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Saved report to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
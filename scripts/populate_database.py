@@ -5,24 +5,60 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+import numpy as np
 from app.embedder import Embedder
-from app.vector_store import FAISSVectorStore
+from app.vector_store import FAISSVectorStore, EmbeddingProjection
+from app.index_manifest import IndexManifest, text_hash
 import psycopg2
-from config import DATABASE_URL, EMBEDDING_MODEL_NAME
+from config import (
+    DATABASE_URL, EMBEDDING_MODEL_NAME, VECTOR_INDEX_TYPE, PQ_M, PQ_BITS, PROJECTION_DIM, PROJECTION_PATH,
+    NORMALIZE_EMBEDDINGS,
+)
 
-def populate_policy_clauses():
-    """Load sample policy clauses and generate embeddings"""
-    
-    # Load sample data
+def load_sample_clauses():
     with open("data/sample_policy_clauses.json", "r") as f:
-        clauses = json.load(f)
+        return json.load(f)
+
+def clause_embeddings(embedder, clauses):
+    """
+    Embedding of each clause text, keyed by text hash. Texts already in
+    policy_clauses reuse the stored vector; only new or edited texts (and
+    vectors stored with another dimension or normalization) are embedded.
+    The same vectors then go to both the database and the FAISS index.
+    """
+    texts = list({clause["clause_text"]: None for clause in clauses})
+    embeddings = {}
+    try:
+        conn = psycopg2.connect(DATABASE_URL)
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT clause_text, embedding FROM policy_clauses WHERE clause_text = ANY(%s)",
+                               (texts,))
+                rows = cursor.fetchall()
+        finally:
+            conn.close()
+    except psycopg2.Error as e:
+        print(f"⚠️ Could not read stored embeddings ({e}); embedding every clause")
+        rows = []
     
-    # Initialize embedder
-    embedder = Embedder(model_name=EMBEDDING_MODEL_NAME)
+    for clause_text, embedding_json in rows:
+        vector = np.asarray(json.loads(embedding_json), dtype="float32")
+        if vector.shape != (embedder.dimension,):
+            continue
+        # Rows written before the database used the configured normalization are re-embedded
+        if (abs(float(np.linalg.norm(vector)) - 1.0) < 1e-3) != embedder.normalize:
+            continue
+        embeddings[text_hash(clause_text)] = vector
     
-    # Generate embeddings for all clauses
-    clause_texts = [clause["clause_text"] for clause in clauses]
-    embeddings = embedder.get_embeddings(clause_texts)
+    missing = [text for text in texts if text_hash(text) not in embeddings]
+    if missing:
+        for text, vector in zip(missing, embedder.get_embeddings(missing)):
+            embeddings[text_hash(text)] = np.asarray(vector, dtype="float32")
+    print(f"🧠 Embedded {len(missing)} new or changed clauses, reused {len(texts) - len(missing)}")
+    return embeddings
+
+def populate_policy_clauses(clauses, embeddings):
+    """Upsert policy clauses with their embeddings (see clause_embeddings)"""
     
     # Connect to database
     conn = psycopg2.connect(DATABASE_URL)
@@ -30,8 +66,8 @@ def populate_policy_clauses():
     
     try:
         # Insert clauses with embeddings
-        for i, clause in enumerate(clauses):
-            embedding_json = json.dumps(embeddings[i].tolist())
+        for clause in clauses:
+            embedding_json = json.dumps(embeddings[text_hash(clause["clause_text"])].tolist())
             
             cursor.execute("""
                 INSERT INTO policy_clauses 
@@ -60,36 +96,82 @@ def populate_policy_clauses():
         cursor.close()
         conn.close()
 
-def populate_faiss_index():
-    """Populate FAISS vector store with embeddings"""
-    
-    # Load sample data
-    with open("data/sample_policy_clauses.json", "r") as f:
-        clauses = json.load(f)
-    
-    # Initialize components
-    embedder = Embedder(model_name=EMBEDDING_MODEL_NAME)
+def open_clause_index(embedder):
+    """The clause FAISS index, loaded, with the manifest of this embedder"""
+    projection = EmbeddingProjection.load(PROJECTION_PATH) if PROJECTION_DIM else None
     vector_store = FAISSVectorStore(
-        dim=384,  # all-MiniLM-L6-v2 dimension
+        dim=embedder.dimension,
         index_path="models/faiss_index/index.faiss",
-        metadata_path="models/faiss_index/metadata.pkl"
+        metadata_path="models/faiss_index/metadata.pkl",
+        index_type=VECTOR_INDEX_TYPE,
+        pq_m=PQ_M,
+        pq_bits=PQ_BITS,
+        projection=projection,
+        manifest=IndexManifest(
+            model=EMBEDDING_MODEL_NAME,
+            dim=embedder.dimension,
+            normalization=embedder.normalization,
+            projection=projection.fingerprint if projection is not None else None
+        )
     )
+    vector_store.load_index()
+    return vector_store
+
+def populate_faiss_index(embedder, clauses, embeddings):
+    """Populate FAISS vector store with the clause embeddings (see clause_embeddings)"""
     
-    # Generate embeddings
-    embedding_data = embedder.embed_and_pack([clause["clause_text"] for clause in clauses])
+    vector_store = open_clause_index(embedder)
     
-    # Add to vector store
-    vector_store.add_embeddings(embedding_data)
+    # Clauses are keyed by code: only rows of new or edited clauses are written
+    stats = vector_store.sync_ids([clause["code"] for clause in clauses], [clause["clause_text"] for clause in clauses],
+                                  lambda texts: np.array([embeddings[text_hash(text)] for text in texts]),
+                                  attributes=clauses)
+    vector_store.wait_for_compaction()
+    print(f"♻️ {stats['unchanged']} unchanged, {stats['inserted']} inserted, {stats['replaced']} replaced, "
+          f"{stats['removed']} removed")
     
     print(f"✅ Successfully populated FAISS index with {len(clauses)} clauses")
+    return vector_store
+
+def sync_clause_attributes(vector_store):
+    """Copy clause_type, policy_type, section and is_active from policy_clauses to the FAISS filters"""
+    
+    conn = psycopg2.connect(DATABASE_URL)
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute("SELECT clause_text, clause_type, policy_type, section, is_active FROM policy_clauses")
+        updates = {
+            text_hash(clause_text): {
+                "clause_type": clause_type,
+                "policy_type": policy_type,
+                "section": section,
+                "is_active": bool(is_active)
+            }
+            for clause_text, clause_type, policy_type, section, is_active in cursor.fetchall()
+        }
+    finally:
+        cursor.close()
+        conn.close()
+    
+    changed = vector_store.update_attributes(updates)
+    print(f"✅ Synced clause filters from the database ({changed} clauses changed)")
 
 if __name__ == "__main__":
     print("🚀 Populating database with sample data...")
     
+    clauses = load_sample_clauses()
+    # Same model and normalization for the database and the FAISS index
+    embedder = Embedder(model_name=EMBEDDING_MODEL_NAME, normalize=NORMALIZE_EMBEDDINGS)
+    embeddings = clause_embeddings(embedder, clauses)
+    
     # First populate PostgreSQL
-    populate_policy_clauses()
+    populate_policy_clauses(clauses, embeddings)
     
     # Then populate FAISS index
-    populate_faiss_index()
+    vector_store = populate_faiss_index(embedder, clauses, embeddings)
+    
+    # Deactivated or re-classified clauses stop matching without re-embedding
+    sync_clause_attributes(vector_store)
     
     print("✅ Database population complete!")
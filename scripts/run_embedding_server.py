@@ -0,0 +1,67 @@
+# scripts/run_embedding_server.py
+
+"""
+Serve one embedding model to every API worker and script on this machine.
+
+With EMBEDDING_SERVER_SOCKET set, each Embedder sends its texts to this
+server over the Unix socket instead of loading its own SentenceTransformer,
+so the model's memory and load time are paid once. Large result matrices
+come back through shared memory. Processes fall back to a local model
+while the server is down.
+
+Usage:
+    EMBEDDING_SERVER_SOCKET=/tmp/bajaj-embeddings.sock python scripts/run_embedding_server.py
+    python scripts/run_embedding_server.py --socket /run/bajaj/embeddings.sock --concurrency 2
+"""
+
+import argparse
+import os
+import signal
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.embedder import Embedder
+from app.embedding_server import EmbeddingServer
+from config import (
+    EMBEDDING_MODEL_NAME, EMBED_BATCH_SIZE, TORCH_THREADS, EMBEDDER_IDLE_UNLOAD_SECONDS,
+    EMBEDDING_SERVER_SOCKET, EMBEDDING_SHM_MIN_BYTES,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared embedding server")
+    parser.add_argument("--socket", default=EMBEDDING_SERVER_SOCKET, help="Unix socket path")
+    parser.add_argument("--model", default=EMBEDDING_MODEL_NAME, help="SentenceTransformer model")
+    parser.add_argument("--concurrency", type=int, default=1, help="Encodes running at once")
+    parser.add_argument("--shm-min-bytes", type=int, default=EMBEDDING_SHM_MIN_BYTES,
+                        help="Results at least this large are returned through shared memory")
+    parser.add_argument("--lazy", action="store_true", help="Load the model on the first request")
+    args = parser.parse_args()
+
+    if not args.socket:
+        print("❌ No socket: pass --socket or set EMBEDDING_SERVER_SOCKET")
+        sys.exit(1)
+
+    # The server's own model always runs in this process; clients normalize per request
+    embedder = Embedder(model_name=args.model, batch_size=EMBED_BATCH_SIZE, torch_threads=TORCH_THREADS,
+                        idle_unload_seconds=EMBEDDER_IDLE_UNLOAD_SECONDS, server="")
+    if not args.lazy:
+        start = time.time()
+        print(f"🤖 Loading {args.model}...")
+        print(f"✅ Loaded ({embedder.dimension} dimensions) in {time.time() - start:.2f}s")
+
+    server = EmbeddingServer(embedder, args.socket, shm_min_bytes=args.shm_min_bytes,
+                             concurrency=args.concurrency)
+    # SIGTERM shuts down like Ctrl-C, so the socket file is removed
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    print(f"🚀 Serving embeddings on {args.socket}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print("👋 Embedding server stopped")
+
+
+if __name__ == "__main__":
+    main()
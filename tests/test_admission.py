@@ -0,0 +1,79 @@
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from api import admission, auth
+from api.admission import AdmissionController, client_identity
+
+API_KEY = "test-key"
+
+
+@pytest.fixture(autouse=True)
+def api_key(monkeypatch):
+    monkeypatch.setattr(auth, "API_KEY", API_KEY)
+    monkeypatch.setattr(admission.memory.guard, "check", lambda: None)
+
+
+def _request(authorization=None, host="10.0.0.1") -> Request:
+    headers = [(b"authorization", authorization.encode())] if authorization else []
+    return Request({"type": "http", "method": "POST", "path": "/", "headers": headers, "client": (host, 1234)})
+
+
+def test_valid_key_is_its_own_client():
+    identity = client_identity(_request(f"Bearer {API_KEY}"))
+    assert identity.startswith("key:") and API_KEY not in identity
+    assert client_identity(_request(), form_authorization=API_KEY) == identity
+    assert client_identity(_request(f"Bearer {API_KEY}", host="10.0.0.2")) == identity
+
+
+def test_invalid_or_missing_keys_have_no_client_identity():
+    assert client_identity(_request()) is None
+    assert client_identity(_request("Bearer junk-1")) is None
+    assert client_identity(_request(), form_authorization="junk-2") is None
+
+
+def test_invalid_or_missing_keys_fall_back_to_the_address_when_limiting_by_address():
+    assert client_identity(_request(), by_address=True) == "ip:10.0.0.1"
+    assert client_identity(_request("Bearer junk-1"), by_address=True) == "ip:10.0.0.1"
+    assert client_identity(_request(), form_authorization="junk-2", by_address=True) == "ip:10.0.0.1"
+
+
+def test_keyless_requests_only_count_against_the_global_cap():
+    controller = AdmissionController(rate_per_minute=1, burst=1, max_per_key=1, max_in_flight=3)
+    for i in range(3):
+        controller.acquire(client_identity(_request(f"Bearer junk-{i}")))
+    with pytest.raises(HTTPException) as rejected:
+        controller.acquire(client_identity(_request()))
+    assert rejected.value.status_code == 503
+    for _ in range(3):
+        controller.release(None)
+    assert controller.in_flight == 0 and not controller.active and not controller.buckets
+
+
+def test_rotating_junk_keys_share_one_address_bucket():
+    controller = AdmissionController(rate_per_minute=1, burst=2, max_per_key=0, max_in_flight=0)
+    for i in range(2):
+        client = client_identity(_request(f"Bearer junk-{i}"), by_address=True)
+        controller.acquire(client)
+        controller.release(client)
+    with pytest.raises(HTTPException) as rejected:
+        controller.acquire(client_identity(_request("Bearer junk-2"), by_address=True))
+    assert rejected.value.status_code == 429 and "Retry-After" in rejected.value.headers
+    # Another address has its own bucket
+    controller.acquire(client_identity(_request("Bearer junk-3", host="10.0.0.2"), by_address=True))
+
+
+def test_concurrency_cap_per_client():
+    controller = AdmissionController(rate_per_minute=0, burst=1, max_per_key=1, max_in_flight=2)
+    client = client_identity(_request(API_KEY))
+    controller.acquire(client)
+    with pytest.raises(HTTPException) as rejected:
+        controller.acquire(client)
+    assert rejected.value.status_code == 429
+    controller.acquire("ip:10.0.0.9")
+    with pytest.raises(HTTPException) as rejected:
+        controller.acquire("ip:10.0.0.10")
+    assert rejected.value.status_code == 503
+    controller.release(client)
+    controller.release("ip:10.0.0.9")
+    assert controller.in_flight == 0 and not controller.active
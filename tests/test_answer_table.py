@@ -0,0 +1,17 @@
+from app import answer_table
+from app.answer_table import AnswerTable, answer_version
+
+ANSWER = {"question": "What is the grace period?", "answer": "30 days", "page": 2, "match": None}
+
+
+def test_answers_miss_after_the_answer_settings_change(tmp_path, monkeypatch):
+    table = AnswerTable(str(tmp_path / "answers.json"))
+    table.put("hash", answer_version("v1"), ["What is the grace period?", "grace period?"], ANSWER)
+    assert table.lookup("hash", answer_version("v1"), "what is the GRACE period") == ANSWER
+    assert table.lookup("hash", answer_version("v2"), "grace period?") is None
+
+    monkeypatch.setattr(answer_table, "ANSWER_SPAN_CHUNKS", answer_table.ANSWER_SPAN_CHUNKS + 1)
+    assert table.lookup("hash", answer_version("v1"), "grace period?") is None
+    monkeypatch.setattr(answer_table, "ANSWER_SPANS", False)
+    assert answer_version("v1") != answer_version("v2") and answer_version(None) is None
+    assert table.drop_stale(lambda content_hash: answer_version("v1")) == 1 and not table.has_document("hash")
@@ -0,0 +1,146 @@
+import asyncio
+import os
+import time
+import zlib
+
+import fitz
+import numpy as np
+import pytest
+
+from api import pipeline as pipeline_module
+from api.pipeline import InferencePipeline
+from app import deadline
+from app.document_processor import DocumentProcessor, DocumentTooLarge
+
+PAGES = 12
+
+
+class HashEmbedder:
+    dimension = 16
+    normalize = False
+
+    def get_embeddings(self, texts):
+        return np.array([np.random.default_rng(zlib.crc32(text.encode())).random(self.dimension)
+                         for text in texts], dtype="float32")
+
+
+@pytest.fixture
+def pdf(tmp_path):
+    path = str(tmp_path / "policy.pdf")
+    doc = fitz.open()
+    for i in range(PAGES):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Section {i}. The grace period for renewal premium is {i + 15} days.")
+        page.insert_text((72, 100), f"Maternity expenses are covered after {i + 24} months of coverage.")
+    doc.save(path)
+    doc.close()
+    return path
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    monkeypatch.setattr(pipeline_module, "USE_ANSWER_TABLE", False)
+    monkeypatch.setattr(pipeline_module, "PERSIST_DOCUMENT_INDEXES", False)
+    pipeline = InferencePipeline()
+    pipeline._embedder = HashEmbedder()
+    pipeline.document_processor = DocumentProcessor(max_pages=5)
+    return pipeline
+
+
+def test_page_ceiling_applies_to_the_pages_read(pdf):
+    processor = DocumentProcessor(max_pages=5)
+    assert len(processor.extract_pages(pdf, stop=3)) == 3
+    with pytest.raises(DocumentTooLarge):
+        processor.extract_pages(pdf)
+    with pytest.raises(DocumentTooLarge):
+        processor.extract_pages(pdf, stop=6)
+
+
+def test_short_of_records_each_step_once():
+    with deadline.scope(deadline.Deadline(0.1)) as active:
+        assert deadline.short_of(5, "spans") and deadline.short_of(5, "spans")
+        assert not deadline.short_of(0, "lexical")
+        assert active.degraded == ["spans"]
+    assert deadline.remaining() is None and not deadline.short_of(5, "spans")
+
+
+def test_from_header_caps_and_falls_back_to_the_default():
+    assert deadline.from_header("3", default=25, maximum=10).seconds == 3
+    assert deadline.from_header("300", default=25, maximum=10).seconds == 10
+    assert deadline.from_header("junk", default=25, maximum=0).seconds == 25
+    assert deadline.from_header(None, default=0, maximum=10) is None
+
+
+def test_tight_deadline_reads_fewer_pages_and_answers_lexically(pipeline, pdf, monkeypatch):
+    # A page costs 1s and lexical matching starts below 100s left: 5s allows 3 pages
+    monkeypatch.setattr(pipeline_module, "DEADLINE_EMBED_MIN_SECONDS", 100)
+    pipeline._seconds_per_page = 1.0
+
+    async def main():
+        with deadline.scope(deadline.Deadline(5)) as active:
+            answers = await pipeline.answer_questions(pdf, ["What is the grace period for renewal premium?"])
+            return answers, active.degraded
+
+    answers, degraded = asyncio.run(main())
+    assert degraded == ["pages", "lexical"]
+    assert "grace period" in answers[0]
+
+
+def test_expired_deadline_leaves_questions_unanswered(pipeline, pdf):
+    async def main():
+        with deadline.scope(deadline.Deadline(0)):
+            return await pipeline.answer_questions(pdf, ["grace period?", "maternity?"])
+
+    assert asyncio.run(main()) == [None, None]
+
+
+def test_shared_download_is_not_bound_by_the_leaders_deadline(pipeline, monkeypatch):
+    def fetch(url, timeout=30):
+        for _ in range(5):
+            time.sleep(0.05)
+            deadline.check("download")
+        return b"%PDF-"
+
+    monkeypatch.setattr(pipeline, "fetch_document", fetch)
+
+    async def request(seconds, delay=0.0):
+        await asyncio.sleep(delay)
+        with deadline.scope(deadline.Deadline(seconds)):
+            path = await pipeline.adownload_document("http://example.test/policy.pdf")
+        with open(path, "rb") as f:
+            content = f.read()
+        os.unlink(path)
+        return content
+
+    async def main():
+        return await asyncio.gather(request(0.1), request(60, delay=0.01), return_exceptions=True)
+
+    leader, follower = asyncio.run(main())
+    assert isinstance(leader, deadline.DeadlineExceeded) and leader.stage == "download"
+    assert follower == b"%PDF-"
+
+
+def test_shared_preparation_is_not_bound_by_the_leaders_deadline(pipeline, pdf, monkeypatch):
+    # The leader's budget is too short for its page cap to kick in but runs out while embedding
+    monkeypatch.setattr(pipeline_module, "DEADLINE_EMBED_MIN_SECONDS", 0)
+    pipeline._seconds_per_page = 0.001
+    pipeline.document_processor = DocumentProcessor(max_pages=0)
+    embed = pipeline._embedder.get_embeddings
+
+    def slow_embed(texts):
+        time.sleep(0.3)
+        return embed(texts)
+
+    monkeypatch.setattr(pipeline._embedder, "get_embeddings", slow_embed)
+
+    async def request(seconds, delay=0.0):
+        await asyncio.sleep(delay)
+        with deadline.scope(deadline.Deadline(seconds)):
+            return await pipeline.answer_questions(pdf, ["What is the grace period for renewal premium?"])
+
+    async def main():
+        return await asyncio.gather(request(0.15), request(60, delay=0.01))
+
+    leader, follower = asyncio.run(main())
+    assert leader == [None]
+    assert "grace period" in follower[0]
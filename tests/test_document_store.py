@@ -0,0 +1,100 @@
+import threading
+import zlib
+
+import numpy as np
+
+from app import document_store
+from app.document_store import DocumentIndexStore
+from app.index_manifest import IndexManifest
+
+DIM = 16
+
+
+def _embeddings(chunks):
+    return np.array([np.random.default_rng(zlib.crc32(chunk.encode())).random(DIM) for chunk in chunks],
+                    dtype="float32")
+
+
+def _save(store, name, chunks):
+    return store.save(f"hash-{name}", chunks, list(range(1, len(chunks) + 1)), _embeddings(chunks), name)
+
+
+def test_local_ids_are_negative_and_survive_a_rescan(tmp_path):
+    store = DocumentIndexStore(str(tmp_path), DIM, register_in_db=False)
+    first = _save(store, "a", ["grace period is 30 days", "maternity after 24 months"])
+    second = _save(store, "b", ["dental is covered"])
+    assert (first.document_id, second.document_id) == (-1, -2)
+    assert _save(store, "a", ["grace period is 30 days"]).document_id == -1
+
+    reopened = DocumentIndexStore(str(tmp_path), DIM, register_in_db=False)
+    assert reopened.document_ids() == [-2, -1]
+    assert _save(reopened, "c", ["ayush is covered"]).document_id == -3
+    doc = reopened.get(-1)
+    assert doc.chunks == ["grace period is 30 days", "maternity after 24 months"] and doc.pages == [1, 2]
+
+
+def test_database_registration_runs_in_the_background(tmp_path, monkeypatch):
+    registered = []
+
+    def register(document_name, document_type, index_dir, content_hash):
+        registered.append(content_hash)
+        return 7
+
+    monkeypatch.setattr(document_store, "register_document", register)
+    store = DocumentIndexStore(str(tmp_path), DIM, register_in_db=True)
+    doc = _save(store, "a", ["grace period is 30 days"])
+    assert doc.document_id == -1
+    assert store.wait_for_registrations(timeout=10)
+    assert registered == ["hash-a"]
+    # The database id resolves to the same document, also after a restart
+    assert store.get(7) is store.get(-1) and store.info(7)["db_document_id"] == 7
+    reopened = DocumentIndexStore(str(tmp_path), DIM, register_in_db=True)
+    assert reopened.content_hash_for_id(7) == "hash-a"
+    _save(reopened, "a", ["grace period is 30 days"])
+    assert reopened.wait_for_registrations(timeout=10) and registered == ["hash-a"]
+
+
+def test_least_recently_used_documents_are_evicted_beyond_max_bytes(tmp_path):
+    store = DocumentIndexStore(str(tmp_path), DIM, register_in_db=False)
+    first = _save(store, "a", ["grace period is 30 days"])
+    size = sum(entry.stat().st_size for entry in (tmp_path / "hash-a").iterdir())
+    store.max_bytes = int(size * 2.5)
+    _save(store, "b", ["dental is covered"])
+    store.get(first.document_id)
+    _save(store, "c", ["ayush is covered"])
+
+    assert store.content_hash_for_id(-2) is None and not (tmp_path / "hash-b").exists()
+    assert store.get(-1) is not None and store.get(-3) is not None
+    # Evicted ids are never handed out again, even after a restart
+    reopened = DocumentIndexStore(str(tmp_path), DIM, register_in_db=False, max_bytes=store.max_bytes)
+    assert _save(reopened, "b", ["dental is covered"]).document_id == -4
+    # document.json mtimes keep the use order: "a" was used before "c" was saved
+    assert reopened.document_ids() == [-4, -3]
+
+
+def test_re_embedding_a_stale_index_does_not_block_other_documents(tmp_path):
+    old, new = IndexManifest("old-model", DIM), IndexManifest("new-model", DIM)
+    store = DocumentIndexStore(str(tmp_path), DIM, register_in_db=False, manifest=old)
+    _save(store, "a", ["grace period is 30 days"])
+    _save(store, "b", ["dental is covered"])
+
+    started, release = threading.Event(), threading.Event()
+
+    def embed(chunks):
+        if chunks == ["grace period is 30 days"]:
+            started.set()
+            release.wait(10)
+        return _embeddings(chunks)
+
+    reopened = DocumentIndexStore(str(tmp_path), DIM, register_in_db=False, manifest=new, embed=embed)
+    loaded = []
+    worker = threading.Thread(target=lambda: loaded.append(reopened.get(-1)))
+    worker.start()
+    try:
+        assert started.wait(10)
+        # "b" is re-embedded and served while "a" is still embedding
+        assert reopened.get(-2).chunks == ["dental is covered"] and worker.is_alive()
+    finally:
+        release.set()
+        worker.join(10)
+    assert loaded[0].store.manifest.model == "new-model" and reopened.get(-1) is loaded[0]
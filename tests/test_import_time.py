@@ -0,0 +1,9 @@
+import os
+
+from scripts.check_import_time import check
+
+
+def test_api_import_stays_lazy_and_within_budget():
+    # Output (slowest imports, chains that pulled in heavy modules) is shown when this fails
+    budget_ms = float(os.getenv("IMPORT_BUDGET_MS", "1500"))
+    assert check("api.main", budget_ms, runs=3, top=10)
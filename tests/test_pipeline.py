@@ -0,0 +1,28 @@
+import fitz
+import pytest
+
+from api.pipeline import InferencePipeline
+from app.document_processor import DocumentProcessor, DocumentTooLarge
+
+
+def _pdf(path, pages: int) -> str:
+    doc = fitz.open()
+    for i in range(pages):
+        doc.new_page().insert_text((72, 72), f"Section {i}. Dental treatment is covered.")
+    doc.save(str(path))
+    doc.close()
+    return str(path)
+
+
+def test_batch_upload_check_counts_pages_without_extracting_text(tmp_path, monkeypatch):
+    pipeline = InferencePipeline()
+    pipeline.document_processor = DocumentProcessor(max_pages=3)
+
+    def extract(*args, **kwargs):
+        raise AssertionError("batch uploads are not parsed")
+
+    monkeypatch.setattr(pipeline.document_processor, "extract_text", extract)
+    monkeypatch.setattr(pipeline.document_processor, "extract_pages", extract)
+    pipeline._check_upload(_pdf(tmp_path / "short.pdf", 3))
+    with pytest.raises(DocumentTooLarge):
+        pipeline._check_upload(_pdf(tmp_path / "long.pdf", 4))
@@ -0,0 +1,95 @@
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from app.sharded_store import ShardedVectorStore
+from app.vector_store import FAISSVectorStore
+
+DIM = 16
+
+
+def _vector(text: str) -> np.ndarray:
+    return np.random.default_rng(zlib.crc32(text.encode())).random(DIM).astype("float32")
+
+
+def _items(count: int):
+    return [{"text": f"clause {i}", "embedding": _vector(f"clause {i}"), "id": f"C{i}",
+             "policy_type": "health" if i % 2 else "motor"} for i in range(count)]
+
+
+def test_search_without_shards_returns_no_hits(tmp_path):
+    store = ShardedVectorStore(DIM, str(tmp_path), processes=False)
+    assert store.search(_vector("clause 1"), 3) == []
+    assert store.search_many(np.array([_vector("a"), _vector("b")]), 3) == [[], []]
+
+
+def test_search_after_close_returns_no_hits(tmp_path):
+    store = ShardedVectorStore(DIM, str(tmp_path), processes=False)
+    store.rebuild(_items(10))
+    store.close()
+    assert store.search(_vector("clause 1"), 3) == []
+
+
+def test_sharded_search_matches_a_single_index(tmp_path):
+    items = _items(40)
+    single = FAISSVectorStore(DIM, index_path=str(tmp_path / "index.faiss"),
+                              metadata_path=str(tmp_path / "metadata.pkl"))
+    single.add_embeddings(items)
+    sharded = ShardedVectorStore(DIM, str(tmp_path / "shards"), shards=3, processes=False)
+    sharded.rebuild(items)
+    try:
+        queries = np.array([_vector(f"clause {i}") for i in (0, 7, 33)])
+        expected = [[text for text, _ in hits] for hits in single.search_many(queries, 5)]
+        assert [[text for text, _ in hits] for hits in sharded.search_many(queries, 5)] == expected
+    finally:
+        sharded.close()
+
+
+def test_policy_type_shards_skip_unmatched_filters(tmp_path):
+    sharded = ShardedVectorStore(DIM, str(tmp_path), shards=2, partition="policy_type", processes=False)
+    sharded.rebuild(_items(10))
+    try:
+        assert sharded.search(_vector("clause 1"), 3, {"policy_type": "travel"}) == []
+        hits = sharded.search(_vector("clause 1"), 3, {"policy_type": "health"})
+        assert hits[0][0] == "clause 1"
+    finally:
+        sharded.close()
+
+
+def test_search_overlapping_a_rebuild_finishes_on_the_old_shards(tmp_path, monkeypatch):
+    store = ShardedVectorStore(DIM, str(tmp_path), shards=2, processes=False)
+    store.rebuild(_items(10))
+    entered, release = threading.Event(), threading.Event()
+
+    class GatedPool(ThreadPoolExecutor):
+        def map(self, fn, *iterables):
+            # Hold the search between picking this pool and scattering to it
+            if threading.current_thread().name == "searcher":
+                entered.set()
+                release.wait(10)
+            return super().map(fn, *iterables)
+
+    shards, pool = store._shards, store._pool
+    pool.__class__ = GatedPool
+    results = []
+    searcher = threading.Thread(target=lambda: results.append(store.search(_vector("clause 3"), 1)),
+                                name="searcher")
+    searcher.start()
+    try:
+        assert entered.wait(10)
+        rebuild = threading.Thread(target=store.rebuild, args=(_items(20),))
+        rebuild.start()
+        # The swap waits for the search rather than shutting its pool down underneath it
+        rebuild.join(0.2)
+        assert rebuild.is_alive()
+    finally:
+        release.set()
+        searcher.join(10)
+    rebuild.join(10)
+    try:
+        assert results[0][0][0] == "clause 3"
+        assert store._shards is not shards and store.search(_vector("clause 13"), 1)[0][0] == "clause 13"
+    finally:
+        store.close()
@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+
+from api.pipeline import InferencePipeline
+from app import deadline
+from app.singleflight import SingleFlight
+
+
+def test_run_coalesces_concurrent_calls():
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "answer"
+
+    async def main():
+        flights = SingleFlight("test")
+        return await asyncio.gather(flights.run("k", work), flights.run("k", work))
+
+    assert asyncio.run(main()) == ["answer", "answer"]
+    assert len(calls) == 1
+
+
+def test_run_many_shares_keys_in_flight():
+    batches = []
+
+    async def compute(keys):
+        batches.append(list(keys))
+        await asyncio.sleep(0.01)
+        return [key.upper() for key in keys]
+
+    async def main():
+        flights = SingleFlight("test")
+        first = asyncio.ensure_future(flights.run_many(["a", "b"], compute))
+        await asyncio.sleep(0)
+        return await asyncio.gather(first, flights.run_many(["b", "c", "c"], compute))
+
+    assert asyncio.run(main()) == [["A", "B"], ["B", "C", "C"]]
+    assert batches == [["a", "b"], ["c"]]
+
+
+def test_run_many_cancels_the_batch_when_every_waiter_leaves():
+    state = {}
+
+    async def compute(keys):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            state["cancelled"] = True
+            raise
+        return keys
+
+    async def main():
+        flights = SingleFlight("test")
+        caller = asyncio.ensure_future(flights.run_many(["a", "b"], compute))
+        await asyncio.sleep(0.01)
+        caller.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await caller
+        await asyncio.sleep(0.01)
+        # Checked before asyncio.run cancels whatever is left at shutdown
+        assert state.get("cancelled")
+        assert not flights._flights
+
+    asyncio.run(main())
+
+
+def test_run_many_batch_outlives_a_cancelled_caller_while_others_wait():
+    async def compute(keys):
+        await asyncio.sleep(0.05)
+        return [key.upper() for key in keys]
+
+    async def main():
+        flights = SingleFlight("test")
+        leader = asyncio.ensure_future(flights.run_many(["a", "b"], compute))
+        await asyncio.sleep(0.01)
+        follower = asyncio.ensure_future(flights.run_many(["b"], compute))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await follower
+
+    assert asyncio.run(main()) == ["B"]
+
+
+def test_answer_key_separates_deadline_modes_and_page_caps():
+    key = InferencePipeline._answer_key
+    unbounded = key("hash", None, "q")
+    assert key("hash", 5, "q") != unbounded
+    with deadline.scope(deadline.Deadline(60)):
+        assert key("hash", None, "q") == unbounded
+    with deadline.scope(deadline.Deadline(0)) as expired:
+        lexical = key("hash", None, "q")
+        assert "lexical" in expired.degraded
+    assert lexical != unbounded
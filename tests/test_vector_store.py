@@ -0,0 +1,137 @@
+import zlib
+
+import numpy as np
+import pytest
+
+from app.vector_store import FAISSVectorStore
+
+DIM = 16
+
+
+def _vector(text: str) -> np.ndarray:
+    return np.random.default_rng(zlib.crc32(text.encode())).random(DIM).astype("float32")
+
+
+class CountingEmbedder:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        return np.array([_vector(text) for text in texts])
+
+    @property
+    def embedded(self) -> int:
+        return sum(len(call) for call in self.calls)
+
+
+def _store(tmp_path, **kwargs) -> FAISSVectorStore:
+    return FAISSVectorStore(DIM, index_path=str(tmp_path / "index.faiss"),
+                            metadata_path=str(tmp_path / "metadata.pkl"), **kwargs)
+
+
+def _texts(store, queries, k=1):
+    return [[text for text, _ in hits] for hits in store.search_many(np.array(queries), k)]
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = _store(tmp_path, compact_ratio=0)
+    store.add_embeddings([{"text": f"clause {i}", "embedding": _vector(f"clause {i}"), "id": f"C{i}",
+                           "policy_type": "health"} for i in range(20)])
+    return store
+
+
+def test_remove_hides_rows_from_search(store):
+    assert store.remove(["C3", "missing"]) == 1
+    assert store.ntotal == 19
+    assert "clause 3" not in _texts(store, [_vector("clause 3")], k=20)[0]
+    assert "C3" not in store.live_ids()
+
+
+def test_upsert_replaces_and_inserts(store):
+    stats = store.upsert(["C1", "C99"], np.array([_vector("clause 1 v2"), _vector("new")]),
+                         [{"text": "clause 1 v2"}, {"text": "new"}])
+    assert stats == {"inserted": 1, "replaced": 1, "unchanged": 0}
+    assert store.ntotal == 21
+    assert _texts(store, [_vector("clause 1 v2")])[0] == ["clause 1 v2"]
+    assert "clause 1" not in _texts(store, [_vector("clause 1")], k=21)[0]
+
+
+def test_upsert_with_same_text_only_updates_attributes(store):
+    rows = store.index.ntotal
+    stats = store.upsert(["C2"], np.array([_vector("clause 2")]), [{"text": "clause 2", "policy_type": "motor"}])
+    assert stats == {"inserted": 0, "replaced": 0, "unchanged": 1}
+    assert store.index.ntotal == rows
+    assert _texts(store, [_vector("clause 2")])[0] == ["clause 2"]
+    assert store.search(_vector("clause 2"), 1, {"policy_type": "health"})[0][0] != "clause 2"
+
+
+def test_edits_survive_reload_through_the_log(tmp_path, store):
+    store.remove(["C4"])
+    store.upsert(["C5"], np.array([_vector("clause 5 v2")]), [{"text": "clause 5 v2"}])
+    reloaded = _store(tmp_path)
+    reloaded.load_index()
+    assert reloaded.ntotal == store.ntotal
+    assert sorted(reloaded.live_ids()) == sorted(store.live_ids())
+    queries = [_vector("clause 4"), _vector("clause 5 v2"), _vector("clause 7")]
+    assert _texts(reloaded, queries, k=3) == _texts(store, queries, k=3)
+
+
+def test_compaction_drops_dead_rows(tmp_path, store):
+    store.remove([f"C{i}" for i in range(5)])
+    expected = _texts(store, [_vector("clause 9")], k=5)
+    assert store.compact() == 5
+    assert store.index.ntotal == 15 and not store.deleted.any()
+    assert _texts(store, [_vector("clause 9")], k=5) == expected
+    reloaded = _store(tmp_path)
+    reloaded.load_index()
+    assert reloaded.index.ntotal == 15 and _texts(reloaded, [_vector("clause 9")], k=5) == expected
+
+
+def test_background_compaction_after_ratio(tmp_path):
+    store = _store(tmp_path, compact_ratio=0.2)
+    store.add_embeddings([{"text": f"t{i}", "embedding": _vector(f"t{i}"), "id": f"C{i}"} for i in range(10)])
+    store.remove(["C0", "C1"])
+    store.wait_for_compaction(timeout=30)
+    assert store.index.ntotal == 8 and store.ntotal == 8
+
+
+def test_sync_ids_embeds_only_new_texts_when_ids_shift(tmp_path):
+    # Ids that follow list position shift when a clause is inserted near the start
+    store = _store(tmp_path, compact_ratio=0)
+    embed = CountingEmbedder()
+    texts = [f"clause {i}" for i in range(10)]
+    store.sync_ids([f"C{i:02d}" for i in range(10)], texts, embed)
+    assert embed.embedded == 10
+
+    embed = CountingEmbedder()
+    texts = ["inserted clause"] + texts
+    stats = store.sync_ids([f"C{i:02d}" for i in range(11)], texts, embed)
+    assert embed.embedded == 1
+    assert stats["embedded"] == 1 and stats["inserted"] == 1
+    assert store.ntotal == 11
+    assert _texts(store, [_vector("clause 4")])[0] == ["clause 4"]
+
+
+def test_sync_ids_reuses_removed_rows_and_adopts_hash_ids(tmp_path):
+    store = _store(tmp_path, compact_ratio=0)
+    store.add_embeddings([{"text": "old clause", "embedding": _vector("old clause")}])
+    embed = CountingEmbedder()
+    stats = store.sync_ids(["A"], ["old clause"], embed)
+    assert embed.embedded == 0 and stats["inserted"] == 1
+    assert store.live_ids() == ["A"]
+
+    store.remove(["A"])
+    stats = store.sync_ids(["B"], ["old clause"], embed)
+    assert embed.embedded == 0 and store.live_ids() == ["B"]
+
+
+def test_sync_ids_removes_missing_unless_keep_existing(tmp_path):
+    store = _store(tmp_path, compact_ratio=0)
+    embed = CountingEmbedder()
+    store.sync_ids(["A", "B"], ["a text", "b text"], embed)
+    assert store.sync_ids(["A"], ["a text"], embed, keep_existing=True)["removed"] == 0
+    assert sorted(store.live_ids()) == ["A", "B"]
+    assert store.sync_ids(["A"], ["a text"], embed)["removed"] == 1
+    assert store.live_ids() == ["A"]